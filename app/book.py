@@ -0,0 +1,81 @@
+import heapq
+from typing import Optional
+
+import numpy as np
+
+from app.offers import OfferBatch
+
+
+def _run(batch: OfferBatch, n: int, order: str):
+    price, rows = batch.price.tolist(), batch.rows
+    return ((price[i], n, rows[i]) for i in batch.orders[order].tolist())
+
+
+def merge_offers(batches: list[OfferBatch], side: str) -> list[dict]:
+    """
+    One price-sorted book out of several exchange snapshots.
+
+    Every snapshot already has its price permutation, so this is a k-way
+    merge — O(n log k) — rather than a re-sort of the concatenation. BUY
+    books run cheapest first, SELL books dearest first; ties keep exchange
+    order.
+    """
+    sell = side == "SELL"
+    order = "price:SELL" if sell else "price:BUY"
+    runs = [_run(b, n, order) for n, b in enumerate(batches) if len(b)]
+    key = (lambda t: (-t[0], t[1])) if sell else (lambda t: (t[0], t[1]))
+    return [row for _, _, row in heapq.merge(*runs, key=key)]
+
+
+def depth_levels(rows: list[dict]) -> list[dict]:
+    """
+    Cumulative fillable fiat volume per distinct price, in book order.
+
+    Each offer contributes its `max_amount` — the most one trade against it
+    can move.
+    """
+    if not rows:
+        return []
+    price  = np.fromiter((o["price"] for o in rows), float, len(rows))
+    volume = np.fromiter((o.get("max_amount", 0) for o in rows), float, len(rows))
+    starts = np.flatnonzero(np.r_[True, price[1:] != price[:-1]])
+    level_volume = np.add.reduceat(volume, starts)
+    cumulative   = np.cumsum(level_volume)
+    counts       = np.diff(np.r_[starts, len(rows)])
+    return [
+        {"price": p, "offers": c, "volume": round(v, 2), "cumulative": round(cv, 2)}
+        for p, c, v, cv in zip(price[starts].tolist(), counts.tolist(),
+                               level_volume.tolist(), cumulative.tolist())
+    ]
+
+
+def fill(rows: list[dict], amount: float) -> Optional[dict]:
+    """
+    Walk the book for `amount` fiat: take each offer up to its `max_amount`,
+    skipping offers whose `min_amount` exceeds what is left. → filled fiat,
+    crypto received/paid and the effective (volume-weighted) price.
+    """
+    if amount <= 0:
+        return None
+    left, crypto, used = amount, 0.0, 0
+    for o in rows:
+        if left <= 0:
+            break
+        price = o["price"]
+        if price <= 0 or o.get("min_amount", 0) > left:
+            continue
+        take = min(left, o.get("max_amount", left))
+        if take <= 0:
+            continue
+        crypto += take / price
+        left   -= take
+        used   += 1
+    filled = amount - left
+    return {
+        "amount":   amount,
+        "filled":   round(filled, 2),
+        "complete": left <= 1e-9,
+        "crypto":   round(crypto, 8),
+        "vwap":     round(filled / crypto, 6) if crypto else None,
+        "offers":   used,
+    }
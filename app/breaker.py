@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from typing import Optional
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-exchange circuit breaker with rolling health stats.
+
+    Every upstream attempt is `record()`ed with its latency. Over the last
+    `window` seconds, once there are at least `min_calls` attempts and the
+    share of failures — errors plus calls slower than `slow_call` — reaches
+    `failure_ratio`, the breaker opens: `allow()` rejects calls (None) for
+    `cooldown` seconds, so callers fall back to stale cache (or nothing)
+    instead of waiting on a dead upstream. Then one probe is let through
+    (half-open, `allow()` is True for that caller only); success closes the
+    breaker, failure re-opens it with the cooldown doubled, up to
+    `max_cooldown`.
+    """
+
+    def __init__(
+        self,
+        window:        float = 60.0,
+        min_calls:     int   = 6,
+        failure_ratio: float = 0.5,
+        slow_call:     float = 6.0,
+        cooldown:      float = 15.0,
+        max_cooldown:  float = 120.0,
+    ):
+        self.window        = window
+        self.min_calls     = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call     = slow_call
+        self.base_cooldown = cooldown
+        self.max_cooldown  = max_cooldown
+
+        self.state     = CLOSED
+        self._cooldown = cooldown
+        self._open_until  = 0.0
+        self._probing     = False
+        self._calls: deque = deque(maxlen=500)    # (at, latency, ok)
+        self.opened   = 0
+        self.rejected = 0
+
+    # ── Gate ─────────────────────────────────────────────────────────────
+    def allow(self) -> Optional[bool]:
+        """None → rejected; otherwise whether this caller holds the half-open probe."""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN and time.monotonic() >= self._open_until:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True                     # exactly one probe
+            return True
+        self.rejected += 1
+        return None
+
+    def release(self):
+        """
+        Give back a probe slot that produced no `record()` — the attempt was
+        cancelled or never reached the upstream. Otherwise the breaker would
+        stay half-open with its only probe taken forever. Only the caller
+        `allow()` returned True to may call this.
+        """
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def record(self, latency: float, ok: bool):
+        now = time.monotonic()
+        self._calls.append((now, latency, ok))
+        failed = not ok or latency > self.slow_call
+        if self.state == HALF_OPEN:
+            if failed:
+                self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                self._trip(now)
+            else:
+                self.state = CLOSED
+                self._cooldown = self.base_cooldown
+                self._calls.clear()
+            return
+        if self.state == CLOSED:
+            recent = self._recent(now)
+            if len(recent) >= self.min_calls:
+                failures = sum(1 for _, lat, good in recent if not good or lat > self.slow_call)
+                if failures / len(recent) >= self.failure_ratio:
+                    self._trip(now)
+
+    def _trip(self, now: float):
+        self.state = OPEN
+        self._open_until = now + self._cooldown
+        self._probing = False
+        self.opened += 1
+
+    def _recent(self, now: float) -> list[tuple]:
+        cutoff = now - self.window
+        return [c for c in self._calls if c[0] >= cutoff]
+
+    # ── Health ───────────────────────────────────────────────────────────
+    def latency_percentile(self, q: float, successful_only: bool = True, min_samples: int = 1) -> Optional[float]:
+        """q-th percentile (0–100) of latencies in the window, None with fewer than `min_samples`."""
+        lats = sorted(lat for _, lat, ok in self._recent(time.monotonic()) if ok or not successful_only)
+        if not lats or len(lats) < min_samples:
+            return None
+        return lats[min(int(len(lats) * q / 100), len(lats) - 1)]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        recent = self._recent(now)
+        errors = sum(1 for _, _, ok in recent if not ok)
+
+        def pct(q):
+            p = self.latency_percentile(q)
+            return round(p, 3) if p is not None else None
+
+        return {
+            "state":      self.state,
+            "calls":      len(recent),
+            "error_rate": round(errors / len(recent), 3) if recent else 0.0,
+            "p50":        pct(50),
+            "p95":        pct(95),
+            "p99":        pct(99),
+            "opened":     self.opened,
+            "rejected":   self.rejected,
+            "retry_in":   round(max(self._open_until - now, 0.0), 1) if self.state == OPEN else 0.0,
+        }
+
+
+class BreakerRegistry:
+    def __init__(self, names: list[str]):
+        self.breakers = {name: CircuitBreaker() for name in names}
+
+    def get(self, name: str) -> CircuitBreaker:
+        return self.breakers[name.lower()]
+
+    def stats(self) -> dict[str, dict]:
+        return {name: b.stats() for name, b in self.breakers.items()}
+
+
+breakers = BreakerRegistry(["bybit", "binance"])
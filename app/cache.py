@@ -1,5 +1,52 @@
+import asyncio
+import logging
+import os
+import struct
+import sys
 import time
-from typing import Any, Optional
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from app import codec
+from app.metrics import registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:          # shared tier is optional
+    aioredis = None
+
+logger = logging.getLogger("metaflow")
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "set_at", "size")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float, set_at: float, size: int):
+        self.value       = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.set_at      = set_at
+        self.size        = size
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    """Rough deep size in bytes; containers are estimated from one sample element."""
+    size = sys.getsizeof(value)
+    if depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(_approx_size(v, depth + 1) for v in value.values())
+    elif isinstance(value, (list, tuple)) and value:
+        size += len(value) * _approx_size(value[0], depth + 1)
+    return size
+
+
+class _PrefixStats:
+    __slots__ = ("hits", "stale_hits", "misses", "expired", "evictions")
+
+    def __init__(self):
+        self.hits = self.stale_hits = self.misses = self.expired = self.evictions = 0
 
 
 class TTLCache:
@@ -12,31 +59,100 @@ class TTLCache:
                                         serve data while a background refresh runs
       dead   (> ttl + stale_extra):    return None — must fetch fresh
 
+    Memory is bounded by `max_entries` and an approximate `max_bytes`; when
+    either is exceeded the least recently used entries are evicted. Dead
+    entries are removed by `evict_expired`, run periodically by the sweeper.
+    Hits / stale hits / misses / evictions are counted per key prefix
+    (the part before the first ':').
+
     Usage:
         val = cache.get(key)          # None if dead
         if cache.is_stale(key):
             asyncio.create_task(refresh(...))  # kick off background refresh
     """
 
-    def __init__(self):
-        self._store: dict[str, dict] = {}
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self._store: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes  = 0
+        self._stats: dict[str, _PrefixStats] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self._listeners: list[tuple[str, Callable]] = []
+        self._fallback:  Optional[Callable[[str], Optional[tuple]]] = None
 
-    def get(self, key: str) -> Optional[Any]:
+    def add_listener(self, prefix: str, fn: Callable[[str, Any, float], None]):
+        """Call `fn(key, value, stale_until)` whenever a key starting with `prefix` is written."""
+        self._listeners.append((prefix, fn))
+
+    def set_fallback(self, fn: Callable[[str], Optional[tuple]]):
+        """
+        `fn(key)` → (value, fresh_until, stale_until, set_at) or None, asked on
+        a miss before giving up — restores persisted snapshots after a restart.
+        """
+        self._fallback = fn
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
         entry = self._store.get(key)
+        if entry is None and self._fallback is not None:
+            restored = self._fallback(key)
+            if restored is not None:
+                self.set_entry(key, *restored)
+                entry = self._store.get(key)
+        return entry
+
+    def _counter(self, key: str) -> _PrefixStats:
+        prefix = key.split(":", 1)[0]
+        st = self._stats.get(prefix)
+        if st is None:
+            st = self._stats[prefix] = _PrefixStats()
+        return st
+
+    def _drop(self, key: str) -> _Entry:
+        entry = self._store.pop(key)
+        self._bytes -= entry.size
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._lookup(key)
         if entry is None:
+            self._counter(key).misses += 1
             return None
         now = time.time()
-        if now <= entry["stale_until"]:
-            return entry["value"]          # fresh OR stale — both usable
-        del self._store[key]
-        return None                        # fully expired
+        if now <= entry.stale_until:       # fresh OR stale — both usable
+            self._store.move_to_end(key)
+            st = self._counter(key)
+            if now > entry.fresh_until:
+                st.stale_hits += 1
+            else:
+                st.hits += 1
+            return entry.value
+        self._drop(key)                    # fully expired
+        st = self._counter(key)
+        st.expired += 1
+        st.misses  += 1
+        return None
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Like get() but without touching LRU order or counters."""
+        entry = self._lookup(key)
+        if entry is None or time.time() > entry.stale_until:
+            return None
+        return entry.value
 
     def is_stale(self, key: str) -> bool:
         """True when data exists but is past its *fresh* window."""
         entry = self._store.get(key)
         if entry is None:
             return False
-        return time.time() > entry["fresh_until"]
+        return time.time() > entry.fresh_until
+
+    def fresh_for(self, key: str) -> Optional[float]:
+        """Seconds until *fresh* expires (negative once stale); None if absent."""
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        return entry.fresh_until - time.time()
 
     def set(self, key: str, value: Any, ttl: int = 25, stale_extra: int = None):
         """
@@ -47,25 +163,267 @@ class TTLCache:
         if stale_extra is None:
             stale_extra = ttl * 2
         now = time.time()
-        self._store[key] = {
-            "value":       value,
-            "fresh_until": now + ttl,
-            "stale_until": now + ttl + stale_extra,
-            "set_at":      now,
-        }
+        self.set_entry(key, value, now + ttl, now + ttl + stale_extra, now)
+
+    def set_entry(self, key: str, value: Any, fresh_until: float, stale_until: float, set_at: float):
+        """Store with absolute deadlines — used when filling from the shared tier."""
+        if key in self._store:
+            self._drop(key)
+        entry = _Entry(value, fresh_until, stale_until, set_at, _approx_size(value))
+        self._store[key] = entry
+        self._bytes += entry.size
+        # LRU eviction — never evicts the entry just written
+        while len(self._store) > 1 and (
+            len(self._store) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            old_key = next(iter(self._store))
+            self._drop(old_key)
+            self._counter(old_key).evictions += 1
+
+        for prefix, fn in self._listeners:
+            if key.startswith(prefix):
+                try:
+                    fn(key, value, stale_until)
+                except Exception as exc:
+                    logger.error("[cache] listener for %s failed: %s", key, exc)
+
+    def set_at(self, key: str) -> Optional[float]:
+        entry = self._store.get(key)
+        return entry.set_at if entry is not None else None
 
     def delete(self, key: str):
-        self._store.pop(key, None)
+        if key in self._store:
+            self._drop(key)
 
     def clear(self):
         self._store.clear()
+        self._bytes = 0
 
-    def evict_expired(self):
+    def evict_expired(self) -> int:
         """Housekeeping — remove fully dead entries."""
         now = time.time()
-        dead = [k for k, v in self._store.items() if now > v["stale_until"]]
+        dead = [k for k, v in self._store.items() if now > v.stale_until]
         for k in dead:
-            del self._store[k]
+            self._drop(k)
+            self._counter(k).expired += 1
+        return len(dead)
+
+    # ── Sweeper ──────────────────────────────────────────────────────────
+    async def start_sweeper(self, interval: float = 30.0):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep(interval))
+
+    async def stop_sweeper(self):
+        task, self._sweeper = self._sweeper, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _sweep(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.evict_expired()
+            if removed:
+                logger.info("[cache] swept %d expired entries", removed)
+
+    def stats(self) -> dict:
+        return {
+            "entries":     len(self._store),
+            "bytes":       self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes":   self.max_bytes,
+            "prefixes": {
+                prefix: {
+                    "hits":       st.hits,
+                    "stale_hits": st.stale_hits,
+                    "misses":     st.misses,
+                    "expired":    st.expired,
+                    "evictions":  st.evictions,
+                }
+                for prefix, st in sorted(self._stats.items())
+            },
+        }
+
+    def metrics(self) -> list[tuple]:
+        """Scrape-time view of the per-prefix counters (app.metrics collector)."""
+        lookups, evictions = [], []
+        for prefix, st in sorted(self._stats.items()):
+            lookups += [((prefix, "hit"), st.hits), ((prefix, "stale"), st.stale_hits),
+                        ((prefix, "miss"), st.misses)]
+            evictions.append(((prefix,), st.evictions))
+        return [
+            ("metaflow_cache_lookups_total", "counter", "L1 cache lookups per key prefix and result",
+             ("prefix", "result"), lookups),
+            ("metaflow_cache_evictions_total", "counter", "L1 cache evictions per key prefix",
+             ("prefix",), evictions),
+            ("metaflow_cache_bytes", "gauge", "Approximate size of the L1 cache", (), [((), self._bytes)]),
+        ]
+
+
+# ─── Shared (L2) tier ────────────────────────────────────────────────────────
+class SharedEntry(NamedTuple):
+    value:       Any
+    fresh_until: float
+    stale_until: float
+    set_at:      float
+
+
+_HEADER = struct.Struct("<ddd")      # fresh_until, stale_until, set_at
+
+# Compare-and-delete so a worker never releases a lock it no longer owns
+_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SharedTier:
+    """
+    Redis-backed cache shared by every worker and replica.
+
+    Values are stored as `<fresh_until, stale_until, set_at>` + codec bytes
+    with a Redis TTL equal to the stale window, so fresh/stale/dead mean the
+    same thing as in TTLCache. Disabled (every call is a no-op) when
+    REDIS_URL is unset or the redis package is missing; any Redis error is
+    logged and treated as a miss so the service degrades to L1-only.
+    """
+
+    prefix = "metaflow:"
+
+    def __init__(self, url: Optional[str]):
+        self._redis = aioredis.from_url(url) if (url and aioredis is not None) else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._redis is not None
+
+    async def get(self, key: str) -> Optional[SharedEntry]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(self.prefix + key)
+            if raw is None:
+                return None
+            fresh_until, stale_until, set_at = _HEADER.unpack_from(raw)
+            return SharedEntry(codec.decode(raw[_HEADER.size:]), fresh_until, stale_until, set_at)
+        except Exception as exc:
+            logger.warning("[l2] get %s failed: %s", key, exc)
+            return None
+
+    async def set(self, key: str, value: Any, fresh_until: float, stale_until: float, set_at: float):
+        if self._redis is None:
+            return
+        ttl_ms = int((stale_until - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        try:
+            raw = _HEADER.pack(fresh_until, stale_until, set_at) + codec.encode(value)
+            await self._redis.set(self.prefix + key, raw, px=ttl_ms)
+        except Exception as exc:
+            logger.warning("[l2] set %s failed: %s", key, exc)
+
+    async def acquire(self, key: str, ttl: float = 20.0) -> Optional[str]:
+        """Cross-process refresh lock. Returns a token, or None if held elsewhere."""
+        if self._redis is None:
+            return "local"
+        token = uuid.uuid4().hex
+        try:
+            ok = await self._redis.set(self.prefix + "lock:" + key, token, nx=True, px=int(ttl * 1000))
+            return token if ok else None
+        except Exception as exc:
+            logger.warning("[l2] lock %s failed: %s", key, exc)
+            return "local"
+
+    async def release(self, key: str, token: str):
+        if self._redis is None or token == "local":
+            return
+        try:
+            await self._redis.eval(_RELEASE, 1, self.prefix + "lock:" + key, token)
+        except Exception as exc:
+            logger.warning("[l2] unlock %s failed: %s", key, exc)
+
+    async def aclose(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+class TieredCache:
+    """
+    In-process L1 (TTLCache) in front of the shared L2.
+
+    Reads on the hot path stay synchronous against L1; `load()` is what a
+    miss or refresh runs (under single-flight): it takes a newer L2 entry if
+    another worker already refreshed the key, otherwise it grabs the
+    cross-process lock, fetches upstream and writes both tiers. A worker
+    that loses the lock waits for the winner's result instead of fetching.
+    """
+
+    def __init__(self, local: TTLCache, shared: SharedTier, wait_timeout: float = 10.0):
+        self.local        = local
+        self.shared       = shared
+        self.wait_timeout = wait_timeout
+
+    async def put(self, key: str, value: Any, ttl: int = 25, stale_extra: int = None):
+        """Write both tiers."""
+        if stale_extra is None:
+            stale_extra = ttl * 2
+        now = time.time()
+        self.local.set_entry(key, value, now + ttl, now + ttl + stale_extra, now)
+        await self.shared.set(key, value, now + ttl, now + ttl + stale_extra, now)
+
+    async def pull(self, key: str) -> Optional[Any]:
+        """Copy a fresh L2 entry newer than ours into L1 and return it, else None."""
+        entry = await self.shared.get(key)
+        if entry is None or time.time() > entry.fresh_until:
+            return None
+        if entry.set_at <= (self.local.set_at(key) or 0):
+            return None
+        self.local.set_entry(key, entry.value, entry.fresh_until, entry.stale_until, entry.set_at)
+        return entry.value
+
+    async def load(
+        self,
+        key:        str,
+        fetch:      Callable[[], Awaitable[Any]],
+        ttl:        int  = 25,
+        stale_extra: int = None,
+        keep_empty: bool = True,
+    ) -> Any:
+        """
+        keep_empty – when False an empty result is cached only if nothing
+                     usable is in L1, so a failed refresh keeps stale data
+        """
+        value = await self.pull(key)
+        if value is not None:
+            return value
+
+        token = await self.shared.acquire(key)
+        if token is None:
+            # Another process is refreshing this key — wait for its result
+            deadline = time.time() + self.wait_timeout
+            while time.time() < deadline:
+                await asyncio.sleep(0.25)
+                value = await self.pull(key)
+                if value is not None:
+                    return value
+            token = await self.shared.acquire(key)
+
+        try:
+            value = await fetch()
+            if keep_empty or value or self.local.peek(key) is None:
+                await self.put(key, value, ttl=ttl, stale_extra=stale_extra)
+            return value
+        finally:
+            if token is not None:
+                await self.shared.release(key, token)
 
 
-cache = TTLCache()
+cache  = TTLCache()
+shared = SharedTier(os.environ.get("REDIS_URL"))
+tiered = TieredCache(cache, shared)
+registry.add_collector(cache.metrics)
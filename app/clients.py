@@ -0,0 +1,233 @@
+import asyncio
+import importlib.util
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable
+
+import httpx
+
+from app.breaker import breakers
+from app.metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY, UPSTREAM_RESPONSES
+from app.ratelimit import limiter, parse_retry_after
+
+# HTTP/2 needs the optional `h2` package; without it httpx refuses http2=True,
+# so we silently fall back to HTTP/1.1 keep-alive.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Per-upstream connection settings. Each client talks to exactly one host,
+# so the pool limits below are effectively per-host limits.
+UPSTREAMS: dict[str, dict] = {
+    "bybit": {
+        "timeout": 10.0, "http2": True,
+        "max_connections": 8, "max_keepalive": 4,
+    },
+    "binance": {
+        "timeout": 15.0, "http2": True,
+        "max_connections": 8, "max_keepalive": 4,
+    },
+    # api.binance.com — klines / tickers for the market endpoints
+    "binance_api": {
+        "timeout": 10.0, "http2": True,
+        "max_connections": 4, "max_keepalive": 2,
+    },
+}
+KEEPALIVE_EXPIRY = 30.0
+
+# Adaptive per-request timeout: TIMEOUT_FACTOR × the upstream's observed p99,
+# never below MIN_TIMEOUT nor above the configured timeout. Until
+# MIN_SAMPLES responses have been seen the configured timeout applies.
+TIMEOUT_FACTOR = 3.0
+MIN_TIMEOUT    = 2.0
+MIN_SAMPLES    = 20
+
+# Set for cold-cache user requests; tasks started from there inherit it.
+# Only those requests are hedged — background refreshes can afford to wait.
+hedging: ContextVar[bool] = ContextVar("hedging", default=False)
+
+
+class _PoolStats:
+    """Counts TCP connects vs. requests via the httpcore `trace` extension."""
+
+    __slots__ = ("connects", "requests", "hedged", "hedge_wins")
+
+    def __init__(self):
+        self.connects   = 0
+        self.requests   = 0
+        self.hedged     = 0
+        self.hedge_wins = 0
+
+    async def trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.connects += 1
+        elif event.endswith("send_request_headers.started"):
+            self.requests += 1
+
+
+class ClientRegistry:
+    """
+    One long-lived httpx.AsyncClient per upstream.
+
+    Clients are created lazily on first use and closed by `aclose()` from the
+    app lifespan, so keep-alive connections (and TLS sessions) are reused
+    across requests instead of being re-established on every call.
+    """
+
+    def __init__(self, upstreams: dict[str, dict]):
+        self._config  = upstreams
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stats:   dict[str, _PoolStats]        = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(name)
+            self._clients[name] = client
+        return client
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        cfg   = self._config[name]
+        stats = self._stats.setdefault(name, _PoolStats())
+
+        breaker = breakers.breakers.get(name)
+        latency = UPSTREAM_LATENCY.labels(name)
+        statuses: dict[int, object] = {}           # status code → bound counter
+
+        async def _attach_trace(request: httpx.Request):
+            request.extensions["trace"] = stats.trace
+            request.extensions["started"] = time.monotonic()
+
+        async def _throttle_feedback(response: httpx.Response):
+            # 429 = rate limited, 418 = Binance auto-ban after ignoring 429s
+            throttled = response.status_code in (418, 429)
+            if throttled:
+                limiter.penalize(name, parse_retry_after(response.headers.get("Retry-After")))
+            # Time to response headers, excluding our own rate-limit wait
+            started = response.request.extensions.get("started")
+            code = response.status_code
+            counter = statuses.get(code)
+            if counter is None:
+                counter = statuses[code] = UPSTREAM_RESPONSES.labels(name, code)
+            counter.inc()
+            if started is not None:
+                elapsed = time.monotonic() - started
+                latency.observe(elapsed)
+                if breaker is not None:
+                    breaker.record(elapsed, ok=code < 500 and not throttled)
+
+        return httpx.AsyncClient(
+            timeout=cfg["timeout"],
+            http2=cfg.get("http2", False) and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=cfg["max_connections"],
+                max_keepalive_connections=cfg["max_keepalive"],
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={"request": [_attach_trace], "response": [_throttle_feedback]},
+        )
+
+    def timeout(self, name: str) -> float:
+        """Per-request timeout for `name`, adapted to its recent latency."""
+        configured = self._config[name]["timeout"]
+        breaker = breakers.breakers.get(name)
+        p99 = breaker.latency_percentile(99, min_samples=MIN_SAMPLES) if breaker else None
+        if p99 is None:
+            return configured
+        return min(max(p99 * TIMEOUT_FACTOR, MIN_TIMEOUT), configured)
+
+    async def _attempt(self, name: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        One upstream request, bounded end to end by `timeout(name)` (httpx's
+        own timeout is per read, so a slow drip could outlive it). Responses
+        are recorded by the event hooks; requests that get none (deadline,
+        connect / read timeouts, resets) are recorded here as failures, timed
+        from the send — rate-limit waits happen before and never count
+        against the upstream.
+        """
+        deadline = self.timeout(name)
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(send(), deadline)
+        except (httpx.TransportError, asyncio.TimeoutError) as exc:
+            breaker = breakers.breakers.get(name)
+            if breaker is not None:
+                breaker.record(time.monotonic() - started, ok=False)
+            UPSTREAM_ERRORS.labels(name).inc()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise httpx.ReadTimeout(f"{name}: no response within {deadline:.1f}s") from None
+            raise
+
+    async def hedged(self, name: str, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        `send()`, plus — on hedged requests only — a second identical
+        request once the first has taken longer than the upstream's p95,
+        if the rate limiter has a token to spare right now. The first
+        successful response wins; the other request is cancelled.
+        """
+        breaker = breakers.breakers.get(name)
+        delay = breaker.latency_percentile(95, min_samples=MIN_SAMPLES) if breaker else None
+        if not hedging.get() or delay is None:
+            return await self._attempt(name, send)
+
+        first = asyncio.ensure_future(self._attempt(name, send))
+        hedge = False
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or limiter.bucket(name).available() < 1:
+                return await first
+            await limiter.acquire(name)
+            hedge = True
+        finally:
+            if not hedge:
+                first.cancel()      # no-op once done; stops it if the caller was cancelled
+        stats = self._stats[name]
+        stats.hedged += 1
+        second = asyncio.ensure_future(self._attempt(name, send))
+
+        pending, error = {first, second}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            stats.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def start(self):
+        for name in self._config:
+            self.get(name)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict[str, dict]:
+        out = {}
+        for name in self._config:
+            client = self._clients.get(name)
+            counters = self._stats.get(name) or _PoolStats()
+            # httpx does not expose its pool publicly; read httpcore's view
+            pool  = getattr(getattr(client, "_transport", None), "_pool", None)
+            conns = list(getattr(pool, "connections", []) or [])
+            out[name] = {
+                "http2":    bool(self._config[name].get("http2")) and HTTP2_AVAILABLE,
+                "open":     len(conns),
+                "idle":     sum(1 for c in conns if c.is_idle()),
+                "requests": counters.requests,
+                "connects": counters.connects,
+                "reused":   max(counters.requests - counters.connects, 0),
+                "timeout":  round(self.timeout(name), 2),
+                "hedged":   counters.hedged,
+                "hedge_wins": counters.hedge_wins,
+            }
+        return out
+
+
+clients = ClientRegistry(UPSTREAMS)
+
@@ -0,0 +1,133 @@
+import json
+import struct
+import zlib
+from typing import Any, Optional
+
+import numpy as np
+
+from app.offers import OfferBatch
+from app.payload import Payload
+
+# Compact binary encoding for cached values shared between processes.
+#
+#   b"R" + zlib(rows)   list of flat dicts with identical keys (offer lists):
+#                       stored column-wise — numbers as packed little-endian
+#                       arrays, strings through one de-duplicated string table
+#   b"J" + zlib(json)   anything else (charts, trending, spread results)
+#   b"O" + <R or J>     an OfferBatch, rebuilt from its rows on decode
+#   b"P" + <J>          a pre-encoded Payload, re-encoded once on decode
+#
+# rows layout: u32 header length, JSON header {"n", "cols", "strings"},
+# then one binary buffer per column in header order.
+
+_TAG_ROWS = b"R"
+_TAG_JSON = b"J"
+_TAG_BATCH = b"O"
+_TAG_PAYLOAD = b"P"
+_NONE     = 0xFFFFFFFF      # string index meaning None
+
+_DTYPES = {"d": "<f8", "q": "<i8", "?": "?", "s": "<u4"}
+
+
+def _column_type(values: list) -> Optional[str]:
+    kinds = {type(v) for v in values}
+    if kinds == {float}:
+        return "d"
+    if kinds == {int}:
+        return "q"
+    if kinds == {bool}:
+        return "?"
+    if kinds <= {str, type(None)}:
+        return "s"
+    if kinds == {list} and all(x is None or type(x) is str for v in values for x in v):
+        return "S"
+    return None
+
+
+def _encode_rows(rows: list[dict]) -> Optional[bytes]:
+    names = list(rows[0])
+    if any(list(r) != names for r in rows):
+        return None
+
+    strings: dict[str, int] = {}
+
+    def sid(v):
+        return _NONE if v is None else strings.setdefault(v, len(strings))
+
+    cols, buffers = [], []
+    for name in names:
+        values = [r[name] for r in rows]
+        kind = _column_type(values)
+        if kind is None:
+            return None
+        if kind == "S":
+            counts = np.fromiter((len(v) for v in values), dtype="<u2", count=len(values))
+            flat   = np.fromiter((sid(x) for v in values for x in v), dtype="<u4")
+            buffers.append(counts.tobytes() + flat.tobytes())
+        elif kind == "s":
+            buffers.append(np.fromiter((sid(v) for v in values), dtype="<u4", count=len(values)).tobytes())
+        else:
+            buffers.append(np.asarray(values, dtype=_DTYPES[kind]).tobytes())
+        cols.append([name, kind])
+
+    header = json.dumps(
+        {"n": len(rows), "cols": cols, "strings": list(strings)},
+        separators=(",", ":"), ensure_ascii=False,
+    ).encode()
+    return struct.pack("<I", len(header)) + header + b"".join(buffers)
+
+
+def _decode_rows(body: bytes) -> list[dict]:
+    (hlen,) = struct.unpack_from("<I", body)
+    header  = json.loads(body[4:4 + hlen])
+    n, strings = header["n"], header["strings"]
+    lookup = lambda i: None if i == _NONE else strings[i]
+
+    pos, columns = 4 + hlen, []
+    for name, kind in header["cols"]:
+        if kind == "S":
+            counts = np.frombuffer(body, dtype="<u2", count=n, offset=pos)
+            pos += counts.nbytes
+            total = int(counts.sum())
+            flat = np.frombuffer(body, dtype="<u4", count=total, offset=pos).tolist()
+            pos += total * 4
+            values, i = [], 0
+            for c in counts.tolist():
+                values.append([lookup(j) for j in flat[i:i + c]])
+                i += c
+        else:
+            arr = np.frombuffer(body, dtype=_DTYPES[kind], count=n, offset=pos)
+            pos += arr.nbytes
+            values = arr.tolist()
+            if kind == "s":
+                values = [lookup(i) for i in values]
+        columns.append((name, values))
+
+    names = [name for name, _ in columns]
+    return [dict(zip(names, row)) for row in zip(*(v for _, v in columns))]
+
+
+def encode(value: Any) -> bytes:
+    if isinstance(value, OfferBatch):
+        return _TAG_BATCH + encode(list(value.rows))
+    if isinstance(value, Payload):
+        return _TAG_PAYLOAD + _TAG_JSON + zlib.compress(value.body, 1)
+    if isinstance(value, list) and value and all(type(r) is dict for r in value):
+        body = _encode_rows(value)
+        if body is not None:
+            return _TAG_ROWS + zlib.compress(body, 1)
+    body = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+    return _TAG_JSON + zlib.compress(body, 1)
+
+
+def decode(data: bytes) -> Any:
+    if data[:1] == _TAG_BATCH:
+        return OfferBatch(decode(data[1:]))
+    if data[:1] == _TAG_PAYLOAD:
+        return Payload(decode(data[1:]))
+    tag, body = data[:1], zlib.decompress(data[1:])
+    if tag == _TAG_ROWS:
+        return _decode_rows(body)
+    if tag == _TAG_JSON:
+        return json.loads(body)
+    raise ValueError(f"unknown cache codec tag {tag!r}")
@@ -1,8 +1,13 @@
-import asyncio
+import os
+
 import httpx
+from app.clients import clients
+from app.collectors.paginate import paginate
+from app.ratelimit import limiter
 from app.trusted import is_trusted
 
-BINANCE_P2P_URL = "https://p2p.binance.com/bapi/c2c/v2/friendly/c2c/adv/search"
+# BINANCE_P2P_URL подменяет адрес, например на bench/mock_upstream.py
+BINANCE_P2P_URL = os.environ.get("BINANCE_P2P_URL", "https://p2p.binance.com/bapi/c2c/v2/friendly/c2c/adv/search")
 HEADERS = {
     "Content-Type": "application/json",
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
@@ -10,75 +15,67 @@ HEADERS = {
 }
 COMMISSION = 0.0
 ROWS_PER_PAGE = 20   # Binance максимум 20 за запрос
-PAGES = 3            # итого до 60 офферов
-
-
-async def _fetch_page(client: httpx.AsyncClient, fiat: str, crypto: str, side: str, page: int) -> list:
-    payload = {
-        "fiat": fiat, "asset": crypto, "tradeType": side,
-        "page": page, "rows": ROWS_PER_PAGE,
-        "payTypes": [], "publisherType": None,
-    }
-    try:
-        response = await client.post(BINANCE_P2P_URL, json=payload, headers=HEADERS)
-        data = response.json()
-        return data.get("data", [])
-    except Exception as e:
-        print(f"Binance P2P page {page} error: {e}")
-        return []
+MAX_PAGES     = 5    # итого до 100 офферов для глубоких стаканов
+CONCURRENCY   = 3    # страниц параллельно
+PRICE_BAND    = 0.03 # дальше 3% от лучшей цены не листаем
 
 
-async def fetch_p2p_offers(fiat, crypto, side, rows=None):
-    offers = []
-    seen_ids = set()
+def _parse_item(item: dict, fiat: str, crypto: str, side: str) -> dict:
+    adv        = item.get("adv", {})
+    advertiser = item.get("advertiser", {})
 
-    try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            # Запрашиваем все страницы параллельно
-            pages = await asyncio.gather(*[
-                _fetch_page(client, fiat, crypto, side, p)
-                for p in range(1, PAGES + 1)
-            ])
+    advertiser_no = str(advertiser.get("userNo", ""))
+    nick          = advertiser.get("nickName", "")
 
-            for page_items in pages:
-                for item in page_items:
-                    adv        = item.get("adv", {})
-                    advertiser = item.get("advertiser", {})
+    trade_count = int(advertiser.get("monthOrderCount", 0))
+    raw_rate    = float(advertiser.get("monthFinishRate", 0))
+    completion_rate = round(
+        min(raw_rate * 100 if raw_rate <= 1.0 else raw_rate, 100.0), 1
+    )
 
-                    advertiser_no = str(advertiser.get("userNo", ""))
-                    nick          = advertiser.get("nickName", "")
-
-                    # Дедупликация по ID рекламы
-                    adv_id = adv.get("advNo") or advertiser_no
-                    if adv_id in seen_ids:
-                        continue
-                    seen_ids.add(adv_id)
+    return {
+        "exchange":       "Binance",
+        "price":          float(adv.get("price", 0)),
+        "min_amount":     float(adv.get("minSingleTransAmount", 0)),
+        "max_amount":     float(adv.get("maxSingleTransAmount", 0)),
+        "currency":       fiat,
+        "crypto":         crypto,
+        "side":           side,
+        "advertiser":     nick,
+        "advertiser_id":  advertiser_no,
+        # Дедупликация между страницами — по ID рекламы
+        "adv_id":         str(adv.get("advNo") or advertiser_no),
+        "commission":     COMMISSION,
+        "url":            f"https://p2p.binance.com/en/advertiserDetail?advertiserNo={advertiser_no}" if advertiser_no else None,
+        "payment_methods": [p.get("tradeMethodName") for p in adv.get("tradeMethods", [])],
+        "trade_count":    trade_count,
+        "completion_rate": completion_rate,
+        "trusted":        is_trusted("binance", advertiser_no, nick),
+    }
 
-                    trade_count = int(advertiser.get("monthOrderCount", 0))
-                    raw_rate    = float(advertiser.get("monthFinishRate", 0))
-                    completion_rate = round(
-                        min(raw_rate * 100 if raw_rate <= 1.0 else raw_rate, 100.0), 1
-                    )
 
-                    offers.append({
-                        "exchange":       "Binance",
-                        "price":          float(adv.get("price", 0)),
-                        "min_amount":     float(adv.get("minSingleTransAmount", 0)),
-                        "max_amount":     float(adv.get("maxSingleTransAmount", 0)),
-                        "currency":       fiat,
-                        "crypto":         crypto,
-                        "side":           side,
-                        "advertiser":     nick,
-                        "advertiser_id":  advertiser_no,
-                        "commission":     COMMISSION,
-                        "url":            f"https://p2p.binance.com/en/advertiserDetail?advertiserNo={advertiser_no}" if advertiser_no else None,
-                        "payment_methods": [p.get("tradeMethodName") for p in adv.get("tradeMethods", [])],
-                        "trade_count":    trade_count,
-                        "completion_rate": completion_rate,
-                        "trusted":        is_trusted("binance", advertiser_no, nick),
-                    })
+async def _fetch_page(client: httpx.AsyncClient, fiat: str, crypto: str, side: str, page: int,
+                      rows: int = ROWS_PER_PAGE) -> list:
+    payload = {
+        "fiat": fiat, "asset": crypto, "tradeType": side,
+        "page": page, "rows": rows,
+        "payTypes": [], "publisherType": None,
+    }
+    # Каждая страница — отдельный запрос, поэтому и токен за каждую
+    await limiter.acquire("binance")
+    response = await clients.hedged("binance", lambda: client.post(
+        BINANCE_P2P_URL, json=payload, headers=HEADERS, timeout=clients.timeout("binance")))
+    response.raise_for_status()
+    data = response.json()
+    return [_parse_item(item, fiat, crypto, side) for item in data.get("data") or []]
 
-    except Exception as e:
-        print(f"Binance P2P error: {e}")
 
-    return offers
+async def fetch_p2p_offers(fiat, crypto, side, rows=ROWS_PER_PAGE, pages=MAX_PAGES,
+                           price_band=PRICE_BAND, min_volume=None):
+    client = clients.get("binance")
+    # Первая страница отдельно, остальные — волнами по CONCURRENCY; ошибка первой страницы
+    # пробрасывается наверх (retry / circuit breaker), остальных — обрезает стакан
+    return await paginate(
+        lambda page: _fetch_page(client, fiat, crypto, side, page, rows),
+        rows, pages, CONCURRENCY, price_band, min_volume,
+    )
@@ -1,7 +1,12 @@
-import httpx
+import os
+
+from app.clients import clients
+from app.collectors.paginate import paginate
+from app.ratelimit import limiter
 from app.trusted import is_trusted
 
-BYBIT_P2P_URL = "https://api2.bybit.com/fiat/otc/item/online"
+# BYBIT_P2P_URL points the collector at a stand-in (bench/mock_upstream.py)
+BYBIT_P2P_URL = os.environ.get("BYBIT_P2P_URL", "https://api2.bybit.com/fiat/otc/item/online")
 HEADERS = {
     "Content-Type": "application/json",
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
@@ -36,57 +41,73 @@ PAYMENT_METHODS = {
     "22":  "WebMoney",
 }
 COMMISSION = 0.0
+ROWS_PER_PAGE = 40
+MAX_PAGES     = 3      # up to 120 offers for deep books
+CONCURRENCY   = 2      # pages requested at once
+PRICE_BAND    = 0.03   # stop paging once prices are 3% off the best offer
+
 
-async def fetch_p2p_offers(fiat, crypto, side, rows=40):
-    payload = {
-        "tokenId": crypto, "currencyId": fiat,
-        "side": "1" if side == "BUY" else "0",
-        "size": str(rows), "page": "1", "amount": "", "paymentMethod": []
+def _parse_item(item: dict, fiat: str, crypto: str, side: str) -> dict:
+    user_id = str(item.get("userId", ""))
+    nick = item.get("nickName", "")
+    raw_payments = item.get("payments", [])
+    # Resolve name from map, fallback to paymentName field, then #ID
+    payment_names = []
+    for p in raw_payments:
+        pid = str(p)
+        if pid in PAYMENT_METHODS:
+            payment_names.append(PAYMENT_METHODS[pid])
+        else:
+            # Try to get name from object if it's a dict
+            if isinstance(p, dict):
+                name = p.get("paymentName") or PAYMENT_METHODS.get(str(p.get("id", ""))) or f"#{p.get('id', p)}"
+            else:
+                name = f"#{pid}"
+            payment_names.append(name)
+    # Deduplicate while preserving order
+    seen = set()
+    payment_names = [x for x in payment_names if not (x in seen or seen.add(x))]
+
+    trade_count = int(item.get("recentOrderNum", 0))
+    raw_rate = float(item.get("recentExecuteRate", 0))
+    completion_rate = round(min(raw_rate * 100 if raw_rate <= 1.0 else raw_rate, 100.0), 1)
+    return {
+        "exchange":      "Bybit",
+        "price":         float(item.get("price", 0)),
+        "min_amount":    float(item.get("minAmount", 0)),
+        "max_amount":    float(item.get("maxAmount", 0)),
+        "currency":      fiat,
+        "crypto":        crypto,
+        "side":          side,
+        "advertiser":    nick,
+        "advertiser_id": user_id,
+        "adv_id":        str(item.get("id", "")),
+        "commission":    COMMISSION,
+        "url":           f"https://www.bybit.com/fiat/trade/otc/profile/{user_id}" if user_id else None,
+        "payment_methods": payment_names,
+        "trade_count":   trade_count,
+        "completion_rate": completion_rate,
+        "trusted":       is_trusted("bybit", user_id, nick),
     }
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post(BYBIT_P2P_URL, json=payload, headers=HEADERS)
-        data = response.json()
-        offers = []
-        for item in data.get("result", {}).get("items", []):
-            user_id = str(item.get("userId", ""))
-            nick = item.get("nickName", "")
-            raw_payments = item.get("payments", [])
-            # Resolve name from map, fallback to paymentName field, then #ID
-            payment_names = []
-            for p in raw_payments:
-                pid = str(p)
-                if pid in PAYMENT_METHODS:
-                    payment_names.append(PAYMENT_METHODS[pid])
-                else:
-                    # Try to get name from object if it's a dict
-                    if isinstance(p, dict):
-                        name = p.get("paymentName") or PAYMENT_METHODS.get(str(p.get("id", ""))) or f"#{p.get('id', p)}"
-                    else:
-                        name = f"#{pid}"
-                    payment_names.append(name)
-            # Deduplicate while preserving order
-            seen = set()
-            payment_names = [x for x in payment_names if not (x in seen or seen.add(x))]
 
-            trade_count = int(item.get("recentOrderNum", 0))
-            raw_rate = float(item.get("recentExecuteRate", 0))
-            completion_rate = round(min(raw_rate * 100 if raw_rate <= 1.0 else raw_rate, 100.0), 1)
-            offers.append({
-                "exchange":      "Bybit",
-                "price":         float(item.get("price", 0)),
-                "min_amount":    float(item.get("minAmount", 0)),
-                "max_amount":    float(item.get("maxAmount", 0)),
-                "currency":      fiat,
-                "crypto":        crypto,
-                "side":          side,
-                "advertiser":    nick,
-                "advertiser_id": user_id,
-                "commission":    COMMISSION,
-                "url":           f"https://www.bybit.com/fiat/trade/otc/profile/{user_id}" if user_id else None,
-                "payment_methods": payment_names,
-                "trade_count":   trade_count,
-                "completion_rate": completion_rate,
-                "trusted":       is_trusted("bybit", user_id, nick),
-            })
-        return offers
 
+async def fetch_p2p_offers(fiat, crypto, side, rows=ROWS_PER_PAGE, pages=MAX_PAGES,
+                           price_band=PRICE_BAND, min_volume=None):
+    client = clients.get("bybit")
+
+    async def fetch_page(page: int) -> list:
+        payload = {
+            "tokenId": crypto, "currencyId": fiat,
+            "side": "1" if side == "BUY" else "0",
+            "size": str(rows), "page": str(page), "amount": "", "paymentMethod": []
+        }
+        # One token per page request
+        await limiter.acquire("bybit")
+        response = await clients.hedged("bybit", lambda: client.post(
+            BYBIT_P2P_URL, json=payload, headers=HEADERS, timeout=clients.timeout("bybit")))
+        response.raise_for_status()
+        data = response.json()
+        return [_parse_item(item, fiat, crypto, side)
+                for item in (data.get("result") or {}).get("items") or []]
+
+    return await paginate(fetch_page, rows, pages, CONCURRENCY, price_band, min_volume)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("metaflow")
+
+
+async def paginate(
+    fetch_page:  Callable[[int], Awaitable[list[dict]]],
+    page_size:   int,
+    max_pages:   int,
+    concurrency: int             = 2,
+    price_band:  Optional[float] = None,
+    min_volume:  Optional[float] = None,
+) -> list[dict]:
+    """
+    Fetch a best-price-first offer book: page 1 alone, then the rest
+    `concurrency` pages at a time.
+
+    `fetch_page(n)` returns the parsed offers of page n (1-based) and pays
+    its own rate-limit token. Stops after the wave in which
+      - a page comes back short (end of the book),
+      - the price has moved more than `price_band` (fraction) past the best
+        offer, or
+      - the collected offers cover `min_volume` fiat (sum of max_amount).
+    Offers are de-duplicated by `adv_id` — pages shift while the book moves.
+
+    Page 1 decides whether paging is worth it at all, so a book that fits
+    on one page (or already spans the price band) costs a single request.
+    Raises if the first page fails; a failure on a later page just ends the
+    book early.
+    """
+    offers: list[dict] = []
+    seen: set[str] = set()
+    best: Optional[float] = None
+    volume = 0.0
+
+    page = 1
+    while page <= max_pages:
+        wave = range(page, min(page + (concurrency if page > 1 else 1), max_pages + 1))
+        results = await asyncio.gather(*[fetch_page(n) for n in wave], return_exceptions=True)
+        done = False
+        for n, items in zip(wave, results):
+            if isinstance(items, BaseException):
+                if n == 1:
+                    raise items
+                logger.warning("page %d failed: %s", n, items)
+                done = True
+                break
+            for o in items:
+                adv_id = o.get("adv_id")
+                if adv_id:
+                    if adv_id in seen:
+                        continue
+                    seen.add(adv_id)
+                offers.append(o)
+                volume += o.get("max_amount", 0)
+                if best is None:
+                    best = o["price"]
+            if len(items) < page_size:
+                done = True
+                break
+            if price_band is not None and best and items and abs(items[-1]["price"] - best) > best * price_band:
+                done = True
+                break
+            if min_volume is not None and volume >= min_volume:
+                done = True
+                break
+        if done:
+            break
+        page += len(wave)
+    return offers
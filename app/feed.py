@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.cache import cache
+from app.offers import OfferBatch
+from app.payload import dumps
+
+logger = logging.getLogger("metaflow")
+
+# Messages buffered per subscriber before it is considered too slow and dropped
+QUEUE_SIZE = 32
+
+
+def offer_id(o: dict, i: int) -> str:
+    """Stable offer identity across refreshes: the exchange's ad id."""
+    return o.get("adv_id") or f"{o.get('advertiser_id', '')}#{i}"
+
+
+class Subscription:
+    """One connected client. `next()` → (event, encoded message), or None once closed."""
+
+    __slots__ = ("group", "queue", "dropped")
+
+    def __init__(self, group: "_Group"):
+        self.group   = group
+        self.queue:  asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = False
+
+    def push(self, message: tuple[str, str]) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        # Discard the backlog so the terminator always fits
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def next(self) -> Optional[tuple[str, str]]:
+        return await self.queue.get()
+
+
+class _Group:
+    """
+    Subscribers sharing a cache key and filter set.
+
+    The selection and the diff against the previous refresh are computed
+    once per cache write and the encoded message is shared by every member.
+    """
+
+    __slots__ = ("cache_key", "filters", "subs", "rows", "order", "version")
+
+    def __init__(self, cache_key: str, filters: dict):
+        self.cache_key = cache_key
+        self.filters   = filters
+        self.subs:     set[Subscription] = set()
+        self.rows:     dict[str, dict]   = {}       # offer id → row
+        self.order:    list[str]         = []
+        self.version   = 0
+
+    def _select(self, batch: OfferBatch) -> tuple[dict[str, dict], list[str]]:
+        side = self.cache_key.rsplit(":", 1)[1]
+        rows = {}
+        for i in batch.select(side, **self.filters).tolist():
+            o = batch.rows[i]
+            rows[offer_id(o, i)] = o
+        return rows, list(rows)
+
+    def snapshot(self) -> tuple[str, str]:
+        return "snapshot", dumps({
+            "type":    "snapshot",
+            "key":     self.cache_key,
+            "version": self.version,
+            "offers":  [self.rows[k] for k in self.order],
+        }).decode()
+
+    def apply(self, batch: OfferBatch, version: int) -> Optional[tuple[str, str]]:
+        """Adopt a new snapshot; → encoded diff, or None if nothing changed."""
+        rows, order = self._select(batch)
+        old = self.rows
+        added   = [rows[k] for k in order if k not in old]
+        removed = [k for k in self.order if k not in rows]
+        changed = [rows[k] for k in order if k in old and old[k] != rows[k]]
+        reordered = order != self.order
+
+        self.rows, self.order, self.version = rows, order, version
+        if not (added or removed or changed or reordered):
+            return None
+        diff = {
+            "type":    "diff",
+            "key":     self.cache_key,
+            "version": version,
+            "added":   added,
+            "removed": removed,
+            "changed": changed,
+        }
+        if reordered:
+            diff["order"] = order
+        return "diff", dumps(diff).decode()
+
+
+class LiveFeed:
+    """
+    Push-based offer feed keyed by (cache key, filters).
+
+    Fed by the TTLCache listener: one upstream refresh produces one diff per
+    group, fanned out to every subscriber without awaiting any of them. A
+    subscriber whose queue is full is dropped instead of stalling the write.
+    """
+
+    def __init__(self):
+        self._groups: dict[str, dict[tuple, _Group]] = {}   # cache key → filters → group
+        self.sent    = 0
+        self.dropped = 0
+
+    def subscribe(self, cache_key: str, filters: dict, batch: Optional[OfferBatch], version: int) -> Subscription:
+        groups = self._groups.setdefault(cache_key, {})
+        fk = tuple(sorted(filters.items()))
+        group = groups.get(fk)
+        if group is None:
+            group = groups[fk] = _Group(cache_key, filters)
+            if batch is not None:
+                group.apply(batch, version)
+        sub = Subscription(group)
+        group.subs.add(sub)
+        sub.push(group.snapshot())
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        group = sub.group
+        group.subs.discard(sub)
+        groups = self._groups.get(group.cache_key, {})
+        if not group.subs and groups.get(tuple(sorted(group.filters.items()))) is group:
+            del groups[tuple(sorted(group.filters.items()))]
+            if not groups:
+                del self._groups[group.cache_key]
+
+    def on_cache_write(self, key: str, value, stale_until: float):
+        """TTLCache listener for the `p2p:` prefix."""
+        if not isinstance(value, OfferBatch):
+            return
+        version = int((cache.set_at(key) or 0) * 1000)
+        for group in list(self._groups.get(key, {}).values()):
+            message = group.apply(value, version)
+            if message is None:
+                continue
+            for sub in list(group.subs):
+                if sub.push(message):
+                    self.sent += 1
+                else:
+                    logger.warning("[feed] dropping slow subscriber of %s", key)
+                    sub.dropped = True
+                    sub.close()
+                    self.unsubscribe(sub)
+                    self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "keys":        len(self._groups),
+            "groups":      sum(len(gs) for gs in self._groups.values()),
+            "subscribers": sum(len(g.subs) for gs in self._groups.values() for g in gs.values()),
+            "sent":        self.sent,
+            "dropped":     self.dropped,
+        }
+
+
+feed = LiveFeed()
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_right
+from typing import Optional
+
+import numpy as np
+
+from app.cache import cache
+from app.offers import OfferBatch
+from app.scoring import SAFE_THRESHOLD
+
+logger = logging.getLogger("metaflow")
+
+# Per-refresh aggregates recorded for every p2p:{exchange}:{fiat}:{crypto}:{side}
+FIELDS = ("best", "median", "vwap", "safe", "offers")
+TOP_N  = 10          # offers in the top-of-book VWAP
+
+# Tier → (bucket seconds, retention seconds). "raw" is one point per refresh;
+# coarser tiers hold bucket means rolled up from the tier below.
+TIERS = {
+    "raw": (0,    6 * 3600),
+    "1m":  (60,   7 * 86400),
+    "1h":  (3600, 180 * 86400),
+}
+BLOCK = 256          # points per sealed columnar block
+
+
+def aggregate(batch: OfferBatch, side: str) -> Optional[tuple]:
+    """One history point for a snapshot, None when it has no offers."""
+    if not len(batch):
+        return None
+    order = batch.orders["price:SELL" if side == "SELL" else "price:BUY"]
+    top = order[:TOP_N]
+    price = batch.price[top]
+    weight = batch.max_amount[top]
+    weight = np.where(np.isfinite(weight) & (weight > 0), weight, 1.0)
+    return (
+        float(batch.price[order[0]]),
+        float(np.median(batch.price)),
+        float(np.dot(price, weight) / weight.sum()),
+        int((batch.safety_score >= SAFE_THRESHOLD).sum()),
+        len(batch),
+    )
+
+
+class _Tier:
+    """
+    Append-only time series split into fixed-size columnar blocks.
+
+    Sealed blocks are (timestamps, values[n, len(FIELDS)]) numpy arrays with
+    their first timestamp kept in `starts`, so a range query bisects to the
+    first relevant block and binary-searches inside the few blocks it
+    touches. Whole blocks past the retention are dropped from the front.
+    """
+
+    __slots__ = ("retention", "starts", "blocks", "_t", "_v")
+
+    def __init__(self, retention: float):
+        self.retention = retention
+        self.starts: list[float] = []
+        self.blocks: list[tuple[np.ndarray, np.ndarray]] = []
+        self._t: list[float] = []                 # open block
+        self._v: list[tuple] = []
+
+    def __len__(self) -> int:
+        return sum(len(t) for t, _ in self.blocks) + len(self._t)
+
+    def append(self, t: float, row: tuple):
+        self._t.append(t)
+        self._v.append(row)
+        if len(self._t) >= BLOCK:
+            self.starts.append(self._t[0])
+            self.blocks.append((np.asarray(self._t), np.asarray(self._v, dtype=float)))
+            self._t, self._v = [], []
+            cutoff = t - self.retention
+            while self.blocks and self.blocks[0][0][-1] < cutoff:
+                self.blocks.pop(0)
+                self.starts.pop(0)
+
+    def query(self, t0: float, t1: float) -> tuple[np.ndarray, np.ndarray]:
+        ts, vs = [], []
+        first = max(bisect_right(self.starts, t0) - 1, 0)
+        for i in range(first, len(self.blocks)):
+            if self.starts[i] > t1:
+                break
+            t, v = self.blocks[i]
+            lo, hi = np.searchsorted(t, t0, "left"), np.searchsorted(t, t1, "right")
+            ts.append(t[lo:hi])
+            vs.append(v[lo:hi])
+        if self._t and self._t[0] <= t1:
+            t = np.asarray(self._t)
+            lo, hi = np.searchsorted(t, t0, "left"), np.searchsorted(t, t1, "right")
+            ts.append(t[lo:hi])
+            vs.append(np.asarray(self._v[lo:hi], dtype=float).reshape(-1, len(FIELDS)))
+        if not ts:
+            return np.empty(0), np.empty((0, len(FIELDS)))
+        return np.concatenate(ts), np.concatenate(vs)
+
+    def load(self, t: np.ndarray, v: np.ndarray, now: float):
+        """Refill from saved points (oldest first), dropping those past the retention."""
+        keep = t >= now - self.retention
+        t, v = t[keep], v[keep]
+        sealed = len(t) // BLOCK * BLOCK
+        for i in range(0, sealed, BLOCK):
+            self.starts.append(float(t[i]))
+            self.blocks.append((t[i:i + BLOCK], v[i:i + BLOCK]))
+        self._t = t[sealed:].tolist()
+        self._v = [tuple(row) for row in v[sealed:].tolist()]
+
+
+class _Series:
+    """Raw points plus rolling 1m / 1h downsampling for one cache key."""
+
+    __slots__ = ("tiers", "last", "_buckets")
+
+    def __init__(self):
+        self.tiers = {name: _Tier(retention) for name, (_, retention) in TIERS.items()}
+        self.last  = 0.0
+        self._buckets: dict[str, tuple[float, list]] = {}   # tier → (open bucket start, rows)
+
+    def add(self, t: float, row: tuple):
+        if t <= self.last:
+            return                          # replayed write (snapshot restore, shared tier)
+        self.last = t
+        self.tiers["raw"].append(t, row)
+        self._roll("1m", t, row)
+
+    def _roll(self, tier: str, t: float, row: tuple):
+        width = TIERS[tier][0]
+        bucket = t // width * width
+        start, rows = self._buckets.get(tier, (bucket, []))
+        if bucket != start and rows:
+            # The previous bucket is complete — emit its mean one tier up
+            point = tuple(np.mean(rows, axis=0).tolist())
+            self.tiers[tier].append(start, point)
+            if tier == "1m":
+                self._roll("1h", start, point)
+            rows = []
+        rows.append(row)
+        self._buckets[tier] = (bucket, rows)
+
+    def dump(self, prefix: str, out: dict[str, np.ndarray]):
+        for name, tier in self.tiers.items():
+            out[f"{prefix}.{name}.t"], out[f"{prefix}.{name}.v"] = tier.query(-np.inf, np.inf)
+        for name, (start, rows) in self._buckets.items():
+            out[f"{prefix}.{name}.open"] = np.asarray([start])
+            out[f"{prefix}.{name}.rows"] = np.asarray(rows, dtype=float).reshape(-1, len(FIELDS))
+
+    def restore(self, prefix: str, data, now: float):
+        for name, tier in self.tiers.items():
+            tier.load(data[f"{prefix}.{name}.t"], data[f"{prefix}.{name}.v"], now)
+        for name in TIERS:
+            if f"{prefix}.{name}.open" in data:
+                rows = [tuple(row) for row in data[f"{prefix}.{name}.rows"].tolist()]
+                self._buckets[name] = (float(data[f"{prefix}.{name}.open"][0]), rows)
+        raw = self.tiers["raw"]
+        self.last = raw._t[-1] if raw._t else float(raw.blocks[-1][0][-1]) if raw.blocks else 0.0
+
+
+class HistoryStore:
+    """
+    Time series of per-refresh offer aggregates, fed by the p2p: cache listener.
+
+    History is per worker process: each worker records the refreshes it
+    sees. With `path` set, every tier is saved there every `save_interval`
+    seconds and on shutdown (written to a temp file from a worker thread,
+    then renamed into place) and loaded back on start, so a restart loses
+    at most one interval. This is best effort — a crash loses the points
+    since the last save, and several workers sharing one path overwrite
+    each other's file (give each its own HISTORY_PATH). Disabled when
+    `path` is empty.
+    """
+
+    def __init__(self, path: Optional[str] = None, save_interval: float = 300.0):
+        self.path          = path
+        self.save_interval = save_interval
+        self._series: dict[str, _Series] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.saved    = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # ── Persistence ──────────────────────────────────────────────────────
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if os.path.exists(self.path):
+            try:
+                data = await asyncio.to_thread(self._read)
+                self._restore(data)
+                logger.info("[history] %d series restored from %s", len(self._series), self.path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.error("[history] cannot load %s: %s — starting empty", self.path, exc)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await self.save()
+
+    async def save(self):
+        # Copied on the event loop (appends happen there), written off it
+        out = {"keys": np.asarray(list(self._series), dtype=str)}
+        for i, series in enumerate(self._series.values()):
+            series.dump(str(i), out)
+        try:
+            await asyncio.to_thread(self._write, out)
+            self.saved += 1
+        except OSError as exc:
+            logger.error("[history] save to %s failed: %s", self.path, exc)
+
+    def _write(self, arrays: dict[str, np.ndarray]):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, self.path)
+
+    def _read(self) -> dict[str, np.ndarray]:
+        with np.load(self.path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    def _restore(self, data: dict[str, np.ndarray]):
+        now = time.time()
+        for i, key in enumerate(data["keys"].tolist()):
+            if key in self._series:
+                continue
+            series = _Series()
+            series.restore(str(i), data, now)
+            self._series[key] = series
+
+    def on_cache_write(self, key: str, value, stale_until: float):
+        if not isinstance(value, OfferBatch):
+            return
+        row = aggregate(value, key.rsplit(":", 1)[1])
+        if row is None:
+            return
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series()
+        series.add(cache.set_at(key) or time.time(), row)
+        self.recorded += 1
+
+    def query(self, key: str, t0: float, t1: float, resolution: str = "auto") -> dict:
+        if resolution == "auto":
+            span = t1 - t0
+            resolution = "raw" if span <= 2 * 3600 else "1m" if span <= 3 * 86400 else "1h"
+        series = self._series.get(key)
+        if series is None:
+            t, v = np.empty(0), np.empty((0, len(FIELDS)))
+        else:
+            t, v = series.tiers[resolution].query(t0, t1)
+            # Plus the bucket still being filled, so recent data shows up at once
+            start, rows = series._buckets.get(resolution, (0.0, []))
+            if rows and t0 <= start <= t1:
+                t = np.append(t, start)
+                v = np.vstack([v, np.mean(rows, axis=0)])
+        out = {"resolution": resolution, "t": t.tolist()}
+        for i, name in enumerate(FIELDS):
+            out[name] = np.round(v[:, i], 6).tolist()
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "series":   len(self._series),
+            "recorded": self.recorded,
+            "saved":    self.saved,
+            "points":   {name: sum(len(s.tiers[name]) for s in self._series.values()) for name in TIERS},
+        }
+
+
+history = HistoryStore(os.environ.get("HISTORY_PATH"))
@@ -0,0 +1,241 @@
+import re
+from typing import Optional
+
+import numpy as np
+
+# Indicators accepted by /market/chart, e.g. "ma7,ema21,rsi14,bb20,vwap20".
+# "ma" is the plain SMA (kept for the ma7/ma25/ma99 columns the chart
+# always had).
+DEFAULT_INDICATORS = "ma7,ma25,ma99"
+MAX_PERIOD = 500
+_SPEC = re.compile(r"^(ma|sma|ema|rsi|bb|vwap)(\d+)$")
+
+
+def _rolling_sum(x: np.ndarray, period: int, start: int) -> np.ndarray:
+    """Sums of the `period`-wide windows ending at start..n-1 (NaN while warming up), O(n)."""
+    lo = max(start - period + 1, 0)
+    cs = np.concatenate(([0.0], np.cumsum(x[lo:])))
+    idx = np.arange(start, len(x))
+    out = np.full(len(idx), np.nan)
+    ok = idx >= period - 1
+    ends = idx[ok] - lo + 1
+    out[ok] = cs[ends] - cs[ends - period]
+    return out
+
+
+class Indicator:
+    """
+    One indicator over a KlineSeries, kept up to date incrementally.
+
+    `update(series, start)` recomputes only rows from `start` on — the
+    candles that were appended or changed. Window indicators use prefix
+    sums over the tail; recursive ones (EMA, RSI) continue from their state
+    at `start - 1`.
+    """
+
+    def __init__(self, name: str, period: int):
+        self.name   = name
+        self.period = period
+        self.out: dict[str, np.ndarray] = {}
+
+    @property
+    def warmup(self) -> int:
+        return self.period
+
+    def _resize(self, n: int, *columns: str):
+        for col in columns:
+            arr = self.out.get(col)
+            if arr is None or len(arr) != n:
+                grown = np.full(n, np.nan)
+                if arr is not None:
+                    grown[:min(len(arr), n)] = arr[:n]
+                self.out[col] = grown
+
+    def trim(self, k: int):
+        for col in self.out:
+            self.out[col] = self.out[col][k:]
+
+    def update(self, s: "KlineSeries", start: int):
+        raise NotImplementedError
+
+
+class SMA(Indicator):
+    def update(self, s, start):
+        self._resize(len(s), self.name)
+        self.out[self.name][start:] = _rolling_sum(s.close, self.period, start) / self.period
+
+
+class EMA(Indicator):
+    @property
+    def warmup(self) -> int:
+        return 3 * self.period                     # until the SMA seed has faded
+
+    def update(self, s, start):
+        self._resize(len(s), self.name)
+        out, x, p = self.out[self.name], s.close, self.period
+        alpha = 2.0 / (p + 1)
+        if len(x) < p:
+            return
+        if start <= p - 1:
+            out[:p - 1] = np.nan
+            out[p - 1] = x[:p].mean()
+            start = p
+        prev = out[start - 1]
+        for i in range(start, len(x)):
+            prev = prev + alpha * (x[i] - prev)
+            out[i] = prev
+
+
+class RSI(Indicator):
+    """Wilder's RSI; average gain / loss are kept as state columns."""
+
+    @property
+    def warmup(self) -> int:
+        return 3 * self.period
+
+    def update(self, s, start):
+        self._resize(len(s), self.name, "_gain", "_loss")
+        out, gain, loss, x, p = self.out[self.name], self.out["_gain"], self.out["_loss"], s.close, self.period
+        if len(x) <= p:
+            return
+        diff = np.diff(x, prepend=x[0])
+        up, down = np.maximum(diff, 0.0), np.maximum(-diff, 0.0)
+        if start <= p:
+            out[:p] = gain[:p] = loss[:p] = np.nan
+            gain[p], loss[p] = up[1:p + 1].mean(), down[1:p + 1].mean()
+            start = p + 1
+        g, l = gain[start - 1], loss[start - 1]
+        for i in range(start, len(x)):
+            g = (g * (p - 1) + up[i]) / p
+            l = (l * (p - 1) + down[i]) / p
+            gain[i], loss[i] = g, l
+        seg = slice(p, len(x))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[seg] = np.where(loss[seg] == 0, 100.0, 100.0 - 100.0 / (1.0 + gain[seg] / loss[seg]))
+
+
+class Bollinger(Indicator):
+    K = 2.0
+
+    def __init__(self, name: str, period: int):
+        super().__init__(name, period)
+        self._ref: Optional[float] = None
+
+    def update(self, s, start):
+        up, mid, low = f"{self.name}_upper", f"{self.name}_mid", f"{self.name}_lower"
+        self._resize(len(s), up, mid, low)
+        if not len(s):
+            return
+        if self._ref is None:
+            self._ref = float(s.close[0])
+        p = self.period
+        # Centred on a nearby price so the x² sums don't lose precision
+        x = s.close - self._ref
+        mean = _rolling_sum(x, p, start) / p
+        std  = np.sqrt(np.maximum(_rolling_sum(x * x, p, start) / p - mean * mean, 0.0))
+        mean = mean + self._ref
+        self.out[mid][start:] = mean
+        self.out[up][start:]  = mean + self.K * std
+        self.out[low][start:] = mean - self.K * std
+
+
+class VWAP(Indicator):
+    """Rolling VWAP over `period` candles, typical price (h + l + c) / 3."""
+
+    def update(self, s, start):
+        self._resize(len(s), self.name)
+        tp = (s.high + s.low + s.close) / 3.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.out[self.name][start:] = (_rolling_sum(tp * s.volume, self.period, start)
+                                           / _rolling_sum(s.volume, self.period, start))
+
+
+_KINDS = {"ma": SMA, "sma": SMA, "ema": EMA, "rsi": RSI, "bb": Bollinger, "vwap": VWAP}
+
+
+def parse_indicators(spec: str) -> list[str]:
+    """"ma7, rsi14" → ["ma7", "rsi14"]; raises ValueError on anything unknown."""
+    names = []
+    for part in spec.split(","):
+        name = part.strip().lower()
+        if not name:
+            continue
+        m = _SPEC.match(name)
+        if m is None or not 2 <= int(m.group(2)) <= MAX_PERIOD:
+            raise ValueError(f"unknown indicator {part.strip()!r}")
+        names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def make_indicator(name: str) -> Indicator:
+    kind, period = _SPEC.match(name).groups()
+    return _KINDS[kind](name, int(period))
+
+
+def warmup(names: list[str]) -> int:
+    return max((make_indicator(n).warmup for n in names), default=0)
+
+
+class KlineSeries:
+    """
+    Candles of one (symbol, interval) as columnar arrays plus indicators.
+
+    `extend()` merges new candles by open time — the last, still-open candle
+    is replaced in place — and updates every indicator from the first row
+    that changed. At most `capacity` candles are kept.
+    """
+
+    COLUMNS = ("time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, capacity: int = 1000, depth: int = 0):
+        self.capacity = capacity
+        self.depth    = depth                     # candles of history requested on load
+        for col in self.COLUMNS:
+            setattr(self, col, np.empty(0))
+        self.indicators: dict[str, Indicator] = {}
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def last_time(self) -> Optional[int]:
+        return int(self.time[-1]) if len(self.time) else None
+
+    def extend(self, candles: np.ndarray) -> int:
+        """Merge rows of (time, o, h, l, c, v); → index of the first changed row."""
+        if not len(candles):
+            return len(self)
+        first = int(np.searchsorted(self.time, candles[0, 0], side="left"))
+        for j, col in enumerate(self.COLUMNS):
+            setattr(self, col, np.concatenate((getattr(self, col)[:first], candles[:, j])))
+        overflow = len(self) - self.capacity
+        if overflow > 0:
+            for col in self.COLUMNS:
+                setattr(self, col, getattr(self, col)[overflow:])
+            for ind in self.indicators.values():
+                ind.trim(overflow)
+            first = max(first - overflow, 0)
+        for ind in self.indicators.values():
+            ind.update(self, first)
+        return first
+
+    def ensure(self, names: list[str]):
+        for name in names:
+            if name not in self.indicators:
+                ind = self.indicators[name] = make_indicator(name)
+                ind.update(self, 0)
+
+    def rows(self, limit: int, names: list[str]) -> list[dict]:
+        start = max(len(self) - limit, 0)
+        cols = {col: getattr(self, col)[start:] for col in self.COLUMNS}
+        for name in names:
+            for col, arr in self.indicators[name].out.items():
+                if not col.startswith("_"):
+                    cols[col] = np.round(arr[start:], 2)
+        out = {col: arr.tolist() for col, arr in cols.items()}
+        out["time"] = [int(t) for t in out["time"]]
+        keys = list(out)
+        rows = []
+        for values in zip(*(out[k] for k in keys)):
+            rows.append({k: (None if v != v else v) for k, v in zip(keys, values)})   # NaN → None
+        return rows
@@ -1,50 +1,149 @@
-import httpx
+import logging
+import os
+import time
+from collections import OrderedDict
 
-BINANCE_BASE = "https://api.binance.com/api/v3"
+import numpy as np
 
-def calc_ma(data, period):
-    result = []
-    for i in range(len(data)):
-        if i < period - 1:
-            result.append(None)
-        else:
-            avg = sum(d["close"] for d in data[i-period+1:i+1]) / period
-            result.append(round(avg, 2))
-    return result
+from app.clients import clients
+from app.indicators import DEFAULT_INDICATORS, KlineSeries, parse_indicators, warmup
+from app.ratelimit import limiter
+from app.singleflight import flight
+from app.stream import stream
+from app.trending import TickerTable
 
-async def fetch_chart(symbol: str = "BTCUSDT", interval: str = "1d", limit: int = 90):
+logger = logging.getLogger("metaflow")
+
+# BINANCE_BASE points market data at a stand-in (bench/mock_upstream.py)
+BINANCE_BASE = os.environ.get("BINANCE_BASE", "https://api.binance.com/api/v3")
+# Request weights from the Binance API docs
+WEIGHT_KLINES        = 2
+WEIGHT_TICKER_24H_ALL = 80
+MAX_KLINES = 1000        # klines per request (Binance maximum)
+TICKERS_TTL = 60         # seconds a REST ticker/24hr download serves trending without the stream
+# (symbol, interval) series kept, least recently charted evicted together
+# with its kline stream — below MAX_STREAMS so every kept series stays live
+MAX_SERIES  = 150
+
+# (symbol, interval) → candles + indicators, extended in place on every
+# refresh. Only series that loaded at least one candle are kept.
+_series: OrderedDict[tuple[str, str], KlineSeries] = OrderedDict()
+
+# Live updates come from the Binance WebSocket (app.stream); REST only
+# backfills. A series is "synced" once REST has caught it up on the current
+# connection — from then on kline events extend it and no REST call is made.
+_synced: set[tuple[str, str]] = set()
+
+# Rolling 24 h (last, open, high, low, quote volume) of every symbol, from
+# miniTicker events; seeded by one REST ticker/24hr download per connection.
+# Every trending query (any limit / quote / sort) is answered from it.
+tickers = TickerTable()
+_tickers_synced = False
+
+
+def _on_connect():
+    global _tickers_synced
+    _synced.clear()
+    _tickers_synced = False
+
+
+def _on_kline(event: dict):
+    k = event["k"]
+    key = (event["s"], k["i"])
+    series = _series.get(key)
+    if series is not None and key in _synced:
+        series.extend(np.array([[k["t"], k["o"], k["h"], k["l"], k["c"], k["v"]]], dtype=float))
+
+
+def _on_mini_ticker(event: dict):
+    tickers.update(event["s"], float(event["c"]), float(event["o"]), float(event["h"]),
+                   float(event["l"]), float(event["q"]))
+
+
+stream.on("kline", _on_kline)
+stream.on("24hrMiniTicker", _on_mini_ticker)
+stream.on_connect(_on_connect)
+stream.subscribe("!miniTicker@arr")
+
+
+def _kline_stream(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+def _remember(key: tuple[str, str], series: KlineSeries):
+    _series[key] = series
+    _series.move_to_end(key)
+    while len(_series) > MAX_SERIES:
+        old, _ = _series.popitem(last=False)
+        _synced.discard(old)
+        stream.unsubscribe(_kline_stream(*old))
+
+
+def market_live() -> bool:
+    """True while market data is pushed — responses may then be cached briefly."""
+    return stream.connected
+
+
+async def _klines(symbol: str, interval: str, limit: int, start_time: int = None) -> np.ndarray:
+    client = clients.get("binance_api")
+    await limiter.acquire("binance_api", cost=WEIGHT_KLINES)
+    params = {"symbol": symbol, "interval": interval, "limit": limit}
+    if start_time is not None:
+        params["startTime"] = start_time
+    r = await client.get(f"{BINANCE_BASE}/klines", params=params)
+    raw = r.json()
+    return np.array([[k[0], k[1], k[2], k[3], k[4], k[5]] for k in raw], dtype=float).reshape(-1, 6)
+
+
+async def fetch_chart(symbol: str = "BTCUSDT", interval: str = "1d", limit: int = 90, indicators: list = None):
+    names = indicators if indicators is not None else parse_indicators(DEFAULT_INDICATORS)
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(f"{BINANCE_BASE}/klines", params={"symbol": symbol, "interval": interval, "limit": limit})
-            raw = r.json()
-            data = [{"time": k[0], "open": float(k[1]), "high": float(k[2]), "low": float(k[3]), "close": float(k[4]), "volume": float(k[5])} for k in raw]
-            ma7  = calc_ma(data, 7)
-            ma25 = calc_ma(data, 25)
-            ma99 = calc_ma(data, 99)
-            for i, d in enumerate(data):
-                d["ma7"]  = ma7[i]
-                d["ma25"] = ma25[i]
-                d["ma99"] = ma99[i]
-            return data
-    except Exception as e:
-        print(f"Chart error: {e}")
+        key = (symbol, interval)
+        series = _series.get(key)
+        # Enough extra history that every indicator is warmed up on the first row shown
+        depth = min(limit + warmup(names), MAX_KLINES)
+        if series is not None and depth <= series.depth and key in _synced and stream.connected:
+            _series.move_to_end(key)
+            series.ensure(names)
+            return series.rows(limit, names)
+        new = None
+        if series is not None and depth <= series.depth:
+            # Only the candles since the last one we have (it is re-sent, as
+            # it was probably still open)
+            new = await _klines(symbol, interval, MAX_KLINES, start_time=series.last_time)
+        if new is None or len(new) >= MAX_KLINES:      # first load, deeper history, or a gap
+            new = await _klines(symbol, interval, depth)
+            series = KlineSeries(capacity=MAX_KLINES, depth=depth)
+        series.extend(new)
+        series.ensure(names)
+        if len(series):
+            _remember(key, series)
+            stream.subscribe(_kline_stream(symbol, interval))
+            if stream.connected:
+                _synced.add(key)
+        return series.rows(limit, names)
+    except Exception:
+        logger.exception("[chart] %s %s failed", symbol, interval)
         return []
 
-async def fetch_trending(limit: int = 20):
+async def _load_tickers():
+    global _tickers_synced
+    client = clients.get("binance_api")
+    await limiter.acquire("binance_api", cost=WEIGHT_TICKER_24H_ALL)
+    r = await client.get(f"{BINANCE_BASE}/ticker/24hr")
+    # Backfill the ticker table; miniTicker events keep it current from here
+    tickers.load(r.json())
+    _tickers_synced = stream.connected
+
+
+async def fetch_trending(limit: int = 20, quote: str = "USDT", min_volume: float = 1_000_000,
+                         sort_by: str = "change"):
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(f"{BINANCE_BASE}/ticker/24hr")
-            data = r.json()
-            usdt_pairs = [t for t in data if t["symbol"].endswith("USDT") and float(t.get("quoteVolume", 0)) > 1_000_000]
-            sorted_pairs = sorted(usdt_pairs, key=lambda x: abs(float(x["priceChangePercent"])), reverse=True)
-            return [{
-                "symbol": t["symbol"].replace("USDT", ""),
-                "price": float(t["lastPrice"]),
-                "change": float(t["priceChangePercent"]),
-                "volume": float(t["quoteVolume"]),
-                "high": float(t["highPrice"]),
-                "low": float(t["lowPrice"]),
-            } for t in sorted_pairs[:limit]]
-    except Exception as e:
-        print(f"Trending error: {e}")
+        live = _tickers_synced and stream.connected
+        if not live and time.time() - tickers.loaded_at > TICKERS_TTL:
+            # One download however many parameter combinations are asking
+            await flight.do("tickers", _load_tickers)
+        return tickers.top(limit, quote, min_volume, sort_by)
+    except Exception as exc:
+        logger.warning("[trending] failed: %s", exc)
         return []
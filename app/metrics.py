@@ -0,0 +1,255 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+# Prometheus text exposition (format 0.0.4) without the client library.
+#
+# Instrumented code binds its label values once — `LATENCY.labels("bybit")`
+# at import or client build time — and keeps the child, so recording a
+# sample is a bisect plus two additions: no label dicts, no lookups.
+# Values that other modules already count (cache hits, queue lengths) are
+# not duplicated; `registry.add_collector()` reads them at scrape time.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers cache hits (sub-ms) up to slow upstream pages (10 s+)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)     # per bucket, not cumulative; last = +Inf
+        self.sum    = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name       = name
+        self.help       = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+
+    def _new(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """The child for these label values — bind once, keep the result."""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new()
+        return child
+
+    def _samples(self, key: tuple, child) -> Iterable[str]:
+        yield f"{self.name}{_labels(self.labelnames, key)} {_num(child.value)}"
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        return _HistogramChild(self.buckets)
+
+    def _samples(self, key, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = 'le="%s"' % _num(bound)
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.labelnames, key)} {child.sum!r}"
+        yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[tuple]]] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, fn: Callable[[], Iterable[tuple]]):
+        """
+        `fn()` → (name, kind, help, labelnames, [(label values, value), ...])
+        tuples, called on every scrape for values kept elsewhere.
+        """
+        self._collectors.append(fn)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        for fn in self._collectors:
+            for name, kind, help, labelnames, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for values, value in samples:
+                    lines.append(f"{name}{_labels(labelnames, values)} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ── Hot-path metrics; label values are bound where they are recorded ─────
+HTTP_LATENCY = registry.histogram(
+    "metaflow_http_request_duration_seconds",
+    "Time to response headers per route", ("method", "route"))
+HTTP_RESPONSES = registry.counter(
+    "metaflow_http_responses_total", "Responses per route and status", ("route", "status"))
+UPSTREAM_LATENCY = registry.histogram(
+    "metaflow_upstream_request_duration_seconds",
+    "Upstream time to response headers, excluding rate-limit waits", ("upstream",))
+UPSTREAM_RESPONSES = registry.counter(
+    "metaflow_upstream_responses_total", "Upstream responses per status code", ("upstream", "status"))
+UPSTREAM_ERRORS = registry.counter(
+    "metaflow_upstream_errors_total", "Upstream requests that got no response", ("upstream",))
+LIMITER_WAIT = registry.histogram(
+    "metaflow_ratelimit_wait_seconds", "Time spent waiting for rate-limit tokens", ("bucket",),
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SPREAD_DURATION = registry.histogram(
+    "metaflow_spread_seconds", "Spread index work: update per p2p cache write, result per scan", ("op",),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+REFRESH_QUEUE = registry.gauge(
+    "metaflow_refresh_queue", "Hot keys due for refresh but waiting for budget").labels()
+REFRESH_RUNNING = registry.gauge(
+    "metaflow_refresh_running", "Background refreshes in flight").labels()
+
+
+def route_label(scope: dict) -> Optional[str]:
+    """The matched route's path template, so /p2p/{fiat} is one series."""
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request's time to response headers
+    (so streaming endpoints count until their first byte) and its status,
+    per method and route template. Children are bound on a route's first
+    request and reused.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._latency:   dict[tuple, _HistogramChild] = {}
+        self._responses: dict[tuple, _CounterChild]   = {}
+
+    def _record(self, scope: dict, status: int, elapsed: float):
+        route = route_label(scope) or "unmatched"
+        key = (scope["method"], route)
+        latency = self._latency.get(key)
+        if latency is None:
+            latency = self._latency[key] = HTTP_LATENCY.labels(*key)
+        latency.observe(elapsed)
+        key = (route, status)
+        responses = self._responses.get(key)
+        if responses is None:
+            responses = self._responses[key] = HTTP_RESPONSES.labels(*key)
+        responses.inc()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        responded = False
+
+        async def send_timed(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                self._record(scope, message["status"], time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not responded:
+                self._record(scope, 500, time.perf_counter() - started)
+            raise
@@ -0,0 +1,191 @@
+import base64
+import sys
+from typing import Optional
+
+import numpy as np
+
+from app.scoring import ratings, safety_scores, safety_tier
+
+# Sort orders accepted by /p2p: name → (column, descending)
+SORTS = {
+    "volume": ("max_amount",      True),
+    "rate":   ("completion_rate", True),
+    "score":  ("rating_score",    True),
+    "safety": ("safety_score",    True),
+}
+
+# Payment-filter results remembered per snapshot (distinct needles are few)
+_PAYMENT_MEMO = 32
+
+
+def _order(key: np.ndarray, desc: bool) -> np.ndarray:
+    # Stable, like list.sort — ties keep upstream order in both directions
+    order = np.argsort(-key if desc else key, kind="stable")
+    order.flags.writeable = False
+    return order
+
+
+class OfferBatch:
+    """
+    Immutable, enriched snapshot of one exchange/pair offer list.
+
+    Built once when the cache is written: every row already carries
+    `safety_score`, `safety_tier` and `rating_score`, every sort order has
+    its permutation, and payment methods have an inverted index. A request
+    then only selects rows — it never copies or re-scores them, so the row
+    dicts are shared between responses and must not be mutated.
+    """
+
+    __slots__ = (
+        "rows", "price", "min_amount", "max_amount", "trade_count",
+        "completion_rate", "safety_score", "rating_score",
+        "orders", "by_min_amount", "by_max_amount", "rate_desc_neg", "pm_index", "_pm_memo",
+    )
+
+    def __init__(self, rows: list[dict]):
+        n = len(rows)
+
+        self.price           = np.fromiter((o.get("price", 0) for o in rows), float, n)
+        self.min_amount      = np.fromiter((o.get("min_amount", 0) for o in rows), float, n)
+        self.max_amount      = np.fromiter((o.get("max_amount", float("inf")) for o in rows), float, n)
+        self.trade_count     = np.fromiter((o.get("trade_count", 0) for o in rows), np.int64, n)
+        self.completion_rate = np.fromiter((o.get("completion_rate", 0) for o in rows), float, n)
+        is_binance = np.fromiter(((o.get("exchange") or "").lower() == "binance" for o in rows), bool, n)
+
+        self.safety_score = safety_scores(self.price, self.min_amount, self.trade_count,
+                                          self.completion_rate, is_binance)
+        self.rating_score = ratings(self.completion_rate, self.trade_count)
+
+        enriched = []
+        for o, sc, rs in zip(rows, self.safety_score.tolist(), self.rating_score.tolist()):
+            o = dict(o)
+            o["safety_score"] = sc
+            o["safety_tier"]  = safety_tier(sc)
+            o["rating_score"] = rs
+            enriched.append(o)
+        self.rows = tuple(enriched)
+
+        # Sort permutations, keyed like SORTS plus both price directions
+        self.orders = {
+            "price:BUY":  _order(self.price, False),
+            "price:SELL": _order(self.price, True),
+        }
+        for name, (column, desc) in SORTS.items():
+            self.orders[name] = _order(getattr(self, column), desc)
+        # (permutation, sorted values) pairs for range filters via searchsorted
+        order = _order(self.min_amount, False)
+        self.by_min_amount = (order, self.min_amount[order])
+        order = _order(self.max_amount, False)
+        self.by_max_amount = (order, self.max_amount[order])
+        self.rate_desc_neg = -self.completion_rate[self.orders["rate"]]
+
+        index: dict[str, list[int]] = {}
+        for i, o in enumerate(rows):
+            for pm in o.get("payment_methods") or ():
+                if pm is not None:
+                    index.setdefault(pm, []).append(i)
+        self.pm_index = {pm: np.asarray(ix, dtype=np.intp) for pm, ix in index.items()}
+        self._pm_memo: dict[str, np.ndarray] = {}
+
+        for arr in (self.price, self.min_amount, self.max_amount, self.trade_count,
+                    self.completion_rate, self.safety_score, self.rating_score):
+            arr.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __sizeof__(self) -> int:
+        arrays = sum(a.nbytes for a in (
+            self.price, self.min_amount, self.max_amount, self.trade_count,
+            self.completion_rate, self.safety_score, self.rating_score,
+            *self.by_min_amount, *self.by_max_amount, self.rate_desc_neg,
+            *self.orders.values()))
+        sample = sys.getsizeof(self.rows[0]) * 3 if self.rows else 0
+        return object.__sizeof__(self) + arrays + len(self.rows) * sample
+
+    # ── Selection ────────────────────────────────────────────────────────
+    def payment_mask(self, needle: str) -> np.ndarray:
+        """Offers with a payment method containing `needle` (case-insensitive)."""
+        needle = needle.lower()
+        mask = self._pm_memo.get(needle)
+        if mask is None:
+            mask = np.zeros(len(self.rows), dtype=bool)
+            for pm, ix in self.pm_index.items():
+                if needle in pm.lower():
+                    mask[ix] = True
+            if len(self._pm_memo) < _PAYMENT_MEMO:
+                self._pm_memo[needle] = mask
+        return mask
+
+    def _range_mask(self, by: tuple, lo: float = None, hi: float = None) -> np.ndarray:
+        """Rows with lo <= value <= hi, found by binary search on a sorted permutation."""
+        order, sorted_vals = by
+        start = 0 if lo is None else np.searchsorted(sorted_vals, lo, side="left")
+        stop  = len(order) if hi is None else np.searchsorted(sorted_vals, hi, side="right")
+        mask = np.zeros(len(self.rows), dtype=bool)
+        mask[order[start:stop]] = True
+        return mask
+
+    def select(
+        self,
+        side:     str,
+        sort:     str   = "price",
+        min_rate: float = 0,
+        payment:  str   = "",
+        amount:   float = 0,
+    ) -> np.ndarray:
+        """Row indices matching the filters, in the requested sort order."""
+        order = self.orders[sort if sort in SORTS else f"price:{'SELL' if side == 'SELL' else 'BUY'}"]
+        if not (min_rate > 0 or payment or amount > 0):
+            return order
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        if min_rate > 0:
+            # Rows sorted by completion_rate descending → rows ≥ min_rate are a prefix
+            cut = np.searchsorted(self.rate_desc_neg, -min_rate, side="right")
+            rate_mask = np.zeros(len(self.rows), dtype=bool)
+            rate_mask[self.orders["rate"][:cut]] = True
+            mask &= rate_mask
+        if payment:
+            mask &= self.payment_mask(payment)
+        if amount > 0:
+            mask &= self._range_mask(self.by_min_amount, hi=amount)
+            mask &= self._range_mask(self.by_max_amount, lo=amount)
+        return order[mask[order]]
+
+
+# ─── Response shaping ────────────────────────────────────────────────────────
+def parse_fields(fields: str) -> Optional[list[str]]:
+    """`fields=price,advertiser` → ["price", "advertiser"]; empty → all fields."""
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    return list(dict.fromkeys(names)) or None
+
+
+def project(rows: list[dict], fields: Optional[list[str]], compact: bool) -> tuple[list, list[str]]:
+    """
+    Apply field projection before serialization.
+
+    compact=True returns array-of-arrays rows plus the column list, so keys
+    are sent once per response instead of once per offer.
+    """
+    columns = fields or (list(rows[0]) if rows else [])
+    if compact:
+        return [[o.get(f) for f in columns] for o in rows], columns
+    if fields is None:
+        return rows, columns
+    return [{f: o.get(f) for f in columns} for o in rows], columns
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    raw = f"{version:x}.{offset}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[tuple[int, int]]:
+    """→ (snapshot version, offset), or None if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        version, offset = raw.split(".")
+        return int(version, 16), max(int(offset), 0)
+    except (ValueError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,88 @@
+import gzip
+import json
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:          # stdlib fallback — same output, just slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:          # br is only offered when the package is installed
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed — not worth the CPU
+MIN_COMPRESS = 1024
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class Payload:
+    """
+    A response body encoded once and reused for every caller.
+
+    Cached next to (in place of) the object for payloads that are identical
+    for everybody until the cache entry changes — spread results, trending,
+    charts. Compressed variants are produced lazily, once per payload.
+    """
+
+    __slots__ = ("obj", "body", "_gzip", "_br")
+
+    def __init__(self, obj: Any):
+        self.obj   = obj
+        self.body  = dumps(obj)
+        self._gzip: Optional[bytes] = None
+        self._br:   Optional[bytes] = None
+
+    def __sizeof__(self) -> int:
+        return (object.__sizeof__(self) + len(self.body) * 4
+                + len(self._gzip or b"") + len(self._br or b""))
+
+    def encoded(self, accept_encoding: str = "") -> tuple[bytes, Optional[str]]:
+        """→ (body, Content-Encoding) best matching the client's Accept-Encoding."""
+        if len(self.body) < MIN_COMPRESS or not accept_encoding:
+            return self.body, None
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            if self._br is None:
+                self._br = brotli.compress(self.body, quality=5)
+            return self._br, "br"
+        if _accepts(accept_encoding, "gzip"):
+            if self._gzip is None:
+                self._gzip = gzip.compress(self.body, compresslevel=5)
+            return self._gzip, "gzip"
+        return self.body, None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(
+    content:         Any,
+    accept_encoding: str = "",
+    headers:         Optional[dict] = None,
+) -> Response:
+    """Serve a Payload (or any JSON-able object) bypassing jsonable_encoder."""
+    payload = content if isinstance(content, Payload) else Payload(content)
+    body, coding = payload.encoded(accept_encoding)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from app.metrics import LIMITER_WAIT
+
+
+class TokenBucket:
+    """
+    Token bucket with weighted costs and adaptive slow-down.
+
+    `rate` tokens/second refill up to `burst`. `acquire(cost)` waits (FIFO)
+    until `cost` tokens are available; costs above `burst` are allowed and
+    simply leave the bucket in debt. `penalize()` — called on HTTP 429/418
+    — pauses the bucket for Retry-After and halves the effective rate,
+    which then recovers linearly over `recover_secs`.
+    """
+
+    MIN_FACTOR = 0.1
+
+    def __init__(self, rate: float, burst: float, recover_secs: float = 60.0, wait_metric=None):
+        self.rate         = rate
+        self.burst        = burst
+        self.recover_secs = recover_secs
+        self._wait_metric = wait_metric           # histogram child observing every wait
+
+        self._tokens       = burst
+        self._updated      = time.monotonic()
+        self._factor       = 1.0
+        self._blocked_until = 0.0
+        self._lock         = asyncio.Lock()
+
+        self.waiting      = 0
+        self.acquired     = 0
+        self.throttled    = 0
+        self.wait_total   = 0.0
+        self.wait_max     = 0.0
+
+    @property
+    def effective_rate(self) -> float:
+        return self.rate * self._factor
+
+    def _refill(self, now: float):
+        dt = now - self._updated
+        # No tokens accrue while paused by a Retry-After
+        earning = now - max(self._updated, self._blocked_until)
+        self._updated = now
+        if self._factor < 1.0:
+            self._factor = min(1.0, self._factor + dt / self.recover_secs)
+        if earning > 0:
+            self._tokens = min(self.burst, self._tokens + earning * self.effective_rate)
+
+    def available(self) -> float:
+        """Tokens that could be spent right now without waiting."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return 0.0
+        self._refill(now)
+        return max(self._tokens, 0.0)
+
+    async def acquire(self, cost: float = 1.0) -> float:
+        """Wait for `cost` tokens; returns seconds waited."""
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                need = min(cost, self.burst)
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._blocked_until:
+                        await asyncio.sleep(self._blocked_until - now)
+                        continue
+                    if self._tokens >= need:
+                        break
+                    await asyncio.sleep((need - self._tokens) / self.effective_rate)
+                self._tokens -= cost
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.acquired   += 1
+        self.wait_total += waited
+        self.wait_max    = max(self.wait_max, waited)
+        if self._wait_metric is not None:
+            self._wait_metric.observe(waited)
+        return waited
+
+    def penalize(self, retry_after: Optional[float] = None):
+        self.throttled += 1
+        now = time.monotonic()
+        self._refill(now)
+        self._factor = max(self._factor / 2, self.MIN_FACTOR)
+        self._tokens = min(self._tokens, 0.0)
+        pause = retry_after if retry_after is not None else 1.0 / self.effective_rate
+        self._blocked_until = max(self._blocked_until, now + pause)
+
+    def stats(self) -> dict:
+        return {
+            "rate":           self.rate,
+            "effective_rate": round(self.effective_rate, 3),
+            "burst":          self.burst,
+            "tokens":         round(self.available(), 2),
+            "queue":          self.waiting,
+            "acquired":       self.acquired,
+            "throttled":      self.throttled,
+            "wait_avg":       round(self.wait_total / self.acquired, 4) if self.acquired else 0.0,
+            "wait_max":       round(self.wait_max, 4),
+            "blocked_for":    round(max(self._blocked_until - time.monotonic(), 0.0), 3),
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[float, float]]):
+        self.buckets = {name: TokenBucket(rate, burst, wait_metric=LIMITER_WAIT.labels(name))
+                        for name, (rate, burst) in limits.items()}
+
+    def bucket(self, name: str) -> TokenBucket:
+        return self.buckets[name.lower()]
+
+    async def acquire(self, name: str, cost: float = 1.0) -> float:
+        return await self.bucket(name).acquire(cost)
+
+    def penalize(self, name: str, retry_after: Optional[float] = None):
+        self.bucket(name).penalize(retry_after)
+
+    def stats(self) -> dict[str, dict]:
+        return {name: b.stats() for name, b in self.buckets.items()}
+
+
+# (rate tokens/s, burst). P2P endpoints are undocumented — stay well under
+# what they tolerate. api.binance.com is weight-based (6000/min per IP); we
+# use a fraction of it and charge each call its documented weight.
+limiter = RateLimiter({
+    "bybit":       (1.25, 3),     # ~75 req/min
+    "binance":     (2.0,  4),     # ~120 req/min, one token per result page
+    "binance_api": (20.0, 100),   # request weight, ~1200/min
+})
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from app.cache import cache
+from app.metrics import REFRESH_QUEUE, REFRESH_RUNNING
+
+logger = logging.getLogger("metaflow")
+
+# Decayed hit count below which a key no longer counts as requested
+HOT = 0.05
+
+
+class RefreshScheduler:
+    """
+    Keeps the most requested `p2p:{exchange}:{fiat}:{crypto}:{side}` keys warm.
+
+    Every user request `touch()`es its key; popularity is an exponentially
+    decayed hit count. Each tick the hottest keys whose fresh window ends
+    within `lead` seconds are refreshed, limited per exchange to `budget`
+    upstream requests/second so user traffic still gets its share of the
+    rate limit. A refresh of `key` is charged `cost(key)` requests (1 by
+    default); the bucket may go into debt, so one deep refresh delays the
+    next ones instead of never fitting.
+
+    Pinned keys are refreshed whatever their popularity. Background pins
+    (`pin(key, background=True)`) are for keys kept warm on nobody's behalf
+    — the caller can refresh them cheaper while `is_background(key)`; once
+    real traffic arrives the key is refreshed right away at full cost.
+
+    `refresh(key)` must start the refresh and return its task, or None when
+    one is already running for that key.
+    """
+
+    def __init__(
+        self,
+        refresh:   Callable[[str], Optional[asyncio.Task]],
+        budget:    dict[str, float],
+        cost:      Optional[Callable[[str], float]] = None,
+        lead:      float = 6.0,
+        tick:      float = 1.0,
+        max_hot:   int   = 40,
+        half_life: float = 300.0,
+    ):
+        self._refresh   = refresh
+        self.budget     = budget
+        self._cost      = cost or (lambda key: 1.0)
+        self.lead       = lead
+        self.tick       = tick
+        self.max_hot    = max_hot
+        self.half_life  = half_life
+
+        self._scores:   dict[str, tuple[float, float]] = {}   # key → (score, at)
+        self._pinned:   dict[str, int]                 = {}   # key → pin count
+        self._background: set[str]                     = set()
+        self._promoted: set[str]                       = set()   # background keys that got traffic
+        self._tokens:   dict[str, float]               = {}
+        self._queue:    list[str]                      = []
+        self._running:  set[str]                       = set()
+        self._lags:     deque                          = deque(maxlen=200)
+        self._refreshes = 0
+        self._task:     Optional[asyncio.Task]         = None
+
+    # ── Popularity ───────────────────────────────────────────────────────
+    def _decayed(self, key: str, now: float) -> float:
+        score, at = self._scores.get(key, (0.0, now))
+        return score * 0.5 ** ((now - at) / self.half_life)
+
+    def touch(self, key: str):
+        now = time.time()
+        score = self._decayed(key, now)
+        if score < HOT and key in self._background and key not in self._pinned:
+            self._promoted.add(key)
+        self._scores[key] = (score + 1.0, now)
+
+    def pin(self, key: str, background: bool = False):
+        """
+        Keep `key` warm regardless of request volume — live feeds, or with
+        `background` keys nobody asks for directly (spread pairs).
+        """
+        if background:
+            self._background.add(key)
+        else:
+            self._pinned[key] = self._pinned.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        count = self._pinned.get(key, 0) - 1
+        if count > 0:
+            self._pinned[key] = count
+        else:
+            self._pinned.pop(key, None)
+
+    def is_background(self, key: str) -> bool:
+        """True while `key` is only kept warm by a background pin."""
+        return (key in self._background and key not in self._pinned
+                and self._decayed(key, time.time()) < HOT)
+
+    def background_keys(self, exchange: str) -> list[str]:
+        return [k for k in self._background if k.split(":")[1] == exchange]
+
+    def _hot_keys(self, now: float) -> list[str]:
+        ranked = sorted(
+            ((self._decayed(k, now), k) for k in self._scores),
+            reverse=True,
+        )
+        # Forget keys nobody has asked for in a long while
+        for score, key in ranked:
+            if score < HOT:
+                del self._scores[key]
+        hot = [k for score, k in ranked[: self.max_hot] if score >= HOT]
+        seen = set(hot)
+        pinned = [k for k in self._pinned if k not in seen]
+        seen.update(pinned)
+        return hot + pinned + [k for k in self._background if k not in seen]
+
+    # ── Loop ─────────────────────────────────────────────────────────────
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as exc:
+                logger.error("[scheduler] tick failed: %s", exc)
+            await asyncio.sleep(self.tick)
+
+    def _step(self):
+        now = time.time()
+        for exchange, per_sec in self.budget.items():
+            # Allow at most one tick's worth of saved-up refreshes (min. 1)
+            cap = max(per_sec * self.tick, 1.0)
+            self._tokens[exchange] = min(self._tokens.get(exchange, cap) + per_sec * self.tick, cap)
+
+        due = []
+        for key in self._hot_keys(now):
+            if key in self._running:
+                continue
+            left = cache.fresh_for(key)
+            if key in self._promoted:
+                left = float("-inf")                 # shallow entry, now wanted in full
+            if left is None or left <= self.lead:
+                due.append((left if left is not None else float("-inf"), key))
+        due.sort()                                   # most overdue first
+
+        self._queue = []
+        for left, key in due:
+            exchange = key.split(":")[1]
+            if exchange not in self.budget:
+                continue
+            if self._tokens.get(exchange, 0.0) < 1.0:
+                self._queue.append(key)
+                continue
+            cost = self._cost(key)
+            task = self._refresh(key)
+            if task is None:
+                continue
+            self._tokens[exchange] -= cost
+            self._promoted.discard(key)
+            self._running.add(key)
+            deadline = now + left if left != float("-inf") else now
+            task.add_done_callback(lambda t, k=key, d=deadline: self._done(k, d))
+        REFRESH_QUEUE.set(len(self._queue))
+        REFRESH_RUNNING.set(len(self._running))
+
+    def _done(self, key: str, deadline: float):
+        self._running.discard(key)
+        REFRESH_RUNNING.set(len(self._running))
+        self._refreshes += 1
+        # Positive lag = the key was served stale (or missing) for that long
+        self._lags.append(time.time() - deadline)
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+        return {
+            "tracked":    len(self._scores),
+            "pinned":     len(self._pinned),
+            "background": len(self._background),
+            "running":    len(self._running),
+            "queue":      len(self._queue),
+            "queued":     self._queue[:20],
+            "refreshes":  self._refreshes,
+            "lag_p50":    round(lags[len(lags) // 2], 3) if lags else None,
+            "lag_max":    round(lags[-1], 3) if lags else None,
+        }
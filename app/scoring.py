@@ -0,0 +1,121 @@
+import math
+
+import numpy as np
+
+# ─── Safety scoring (Bybit-specific) ────────────────────────────────────────
+#
+# On Bybit P2P, offers with dirty money or scam intent share common signals:
+#   • Very few trades (new / throwaway accounts)
+#   • Low completion rate (abandon trades after receiving fiat)
+#   • Price that deviates suspiciously far from the median (too-good-to-be-true bait)
+#   • Abnormally low minimum amount (luring small, cautious buyers)
+#
+# Binance pre-filters advertisers via its own KYC/compliance layer, so we
+# assign a flat baseline score there instead of applying Bybit heuristics.
+
+SAFE_THRESHOLD = 65          # minimum score to be used in safe spread
+
+
+def compute_safety_score(offer: dict, median_price: float) -> int:
+    """Return integer 0–100. Higher = safer."""
+    # Binance is platform-filtered — trust their KYC baseline
+    if offer.get("exchange", "").lower() == "binance":
+        return 85
+
+    score = 100
+    tc = offer.get("trade_count", 0)
+    cr = offer.get("completion_rate", 0)
+
+    # ── Trade count ──────────────────────────────────────────────────────
+    if   tc < 5:    score -= 45   # throwaway / brand-new account
+    elif tc < 20:   score -= 30
+    elif tc < 50:   score -= 15
+    elif tc < 100:  score -= 7
+
+    # ── Completion rate ──────────────────────────────────────────────────
+    if   cr < 80:   score -= 30   # abandons >20 % of deals
+    elif cr < 90:   score -= 15
+    elif cr < 95:   score -= 7
+
+    # ── Price outlier ────────────────────────────────────────────────────
+    # A suspiciously better price is a classic scam lure
+    if median_price > 0 and offer.get("price", 0) > 0:
+        dev = abs(offer["price"] - median_price) / median_price * 100
+        if   dev > 8:   score -= 30
+        elif dev > 5:   score -= 15
+        elif dev > 3:   score -= 5
+
+    # ── Suspiciously low minimum amount ─────────────────────────────────
+    if offer.get("min_amount", 0) < 5:
+        score -= 10
+
+    return max(0, min(100, score))
+
+
+def safety_tier(score: int) -> str:
+    if score >= 80: return "safe"
+    if score >= 60: return "caution"
+    return "risky"
+
+
+def enrich_safety(offers: list) -> list:
+    """Mutates each offer dict in-place; returns same list."""
+    if not offers:
+        return offers
+    prices = sorted(o["price"] for o in offers if o.get("price", 0) > 0)
+    median = prices[len(prices) // 2] if prices else 0
+    for o in offers:
+        sc = compute_safety_score(o, median)
+        o["safety_score"] = sc
+        o["safety_tier"]  = safety_tier(sc)
+    return offers
+
+
+def compute_rating(completion_rate: float, trade_count: int) -> float:
+    """Composite score 0–10: completion_rate×0.7 + log(trades+1)×0.3"""
+    cr  = min(max(completion_rate, 0), 100) / 100
+    tc  = math.log(max(trade_count, 0) + 1)
+    raw = cr * 0.7 + tc * 0.3
+    return round(min(raw / 0.287, 10), 2)
+
+
+# ─── Vectorized variants (columnar offer batches) ───────────────────────────
+# Same rules as above, applied to whole NumPy columns at once. Keep the
+# thresholds in sync with compute_safety_score / compute_rating —
+# tests/test_scoring.py checks both agree on randomized offers.
+
+def upper_median(price: np.ndarray) -> float:
+    """Upper median of positive prices — matches enrich_safety."""
+    p = price[price > 0]
+    if not len(p):
+        return 0.0
+    k = len(p) // 2
+    return float(np.partition(p, k)[k])
+
+
+def safety_scores(
+    price: np.ndarray, min_amount: np.ndarray, trade_count: np.ndarray,
+    completion_rate: np.ndarray, is_binance: np.ndarray,
+) -> np.ndarray:
+    tc, cr = trade_count, completion_rate
+    score = np.full(len(price), 100, dtype=np.int16)
+    score -= np.select([tc < 5, tc < 20, tc < 50, tc < 100], [45, 30, 15, 7], 0).astype(np.int16)
+    score -= np.select([cr < 80, cr < 90, cr < 95], [30, 15, 7], 0).astype(np.int16)
+
+    median = upper_median(price)
+    if median > 0:
+        dev = np.abs(price - median) / median * 100
+        penalty = np.select([dev > 8, dev > 5, dev > 3], [30, 15, 5], 0)
+        score -= np.where(price > 0, penalty, 0).astype(np.int16)
+
+    score -= np.where(min_amount < 5, 10, 0).astype(np.int16)
+    np.clip(score, 0, 100, out=score)
+    score[is_binance] = 85
+    return score
+
+
+def ratings(completion_rate: np.ndarray, trade_count: np.ndarray) -> np.ndarray:
+    cr  = np.clip(completion_rate, 0, 100) / 100
+    tc  = np.log(np.maximum(trade_count, 0) + 1)
+    raw = cr * 0.7 + tc * 0.3
+    return np.round(np.minimum(raw / 0.287, 10), 2)
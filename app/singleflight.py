@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one in-flight task.
+
+        data = await flight.do(key, lambda: fetch(...))   # waiters share one fetch
+        flight.spawn(key, lambda: refresh(...))           # no-op if key already running
+
+    The shared task is shielded, so a cancelled waiter (client disconnect,
+    wait_for timeout) does not cancel the fetch the other waiters depend on.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def _task(self, key: str, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return task
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()               # mark retrieved — no "never retrieved" noise
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self._task(key, fn))
+
+    def spawn(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Optional[asyncio.Task]:
+        """Start `fn` in the background unless `key` is already in flight."""
+        if key in self._inflight:
+            return None
+        return self._task(key, fn)
+
+
+flight = SingleFlight()
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Any, Optional
+
+from app import codec
+from app.cache import cache
+
+logger = logging.getLogger("metaflow")
+
+# File layout: MAGIC, then append-only records
+#
+#   <H key length> <I value length> <d fresh_until> <d stale_until> <d set_at>
+#   key (utf-8)    value (app.codec bytes)    <I crc32 of key + value>
+#
+# The latest record for a key wins. A torn record at the tail (crash
+# mid-write) fails its length or CRC check and is cut off on open.
+MAGIC   = b"MFSNAP1\n"
+_RECORD = struct.Struct("<HIddd")
+_CRC    = struct.Struct("<I")
+
+# Only offer books are persisted: a stale p2p: entry is refreshed in the
+# background (and by the scheduler) as soon as it is served. Chart and
+# trending payloads are reloaded only on a miss, so a restored one would be
+# served unrefreshed for up to `max_age`.
+PREFIXES = ("p2p:",)
+
+
+class SnapshotStore:
+    """
+    Latest cached value of every key under `prefixes`, persisted for warm
+    restarts.
+
+    Cache writes are collected by a listener and appended every
+    `flush_interval` seconds from a worker thread (latest value per key
+    only). On start the file is memory-mapped and indexed by key without
+    decoding anything; a value is decoded the first time its key misses in
+    TTLCache (the cache fallback) and served as stale — at most `max_age`
+    seconds past its original write — while the scheduler refreshes it.
+
+    The file is rewritten with only the latest records once it grows past
+    `compact_ratio` × the live data. Disabled when `path` is empty.
+    """
+
+    def __init__(
+        self,
+        path:           Optional[str],
+        max_age:        float = 900.0,
+        flush_interval: float = 5.0,
+        compact_ratio:  float = 3.0,
+        prefixes:       tuple[str, ...] = PREFIXES,
+    ):
+        self.path           = path
+        self.prefixes       = prefixes
+        self.max_age        = max_age
+        self.flush_interval = flush_interval
+        self.compact_ratio  = compact_ratio
+
+        self._mmap:    Optional[mmap.mmap] = None
+        self._index:   dict[str, tuple[int, int, float, float, float]] = {}   # key → (offset, length, fresh, stale, set_at)
+        self._live:    dict[str, int]   = {}      # key → size of its latest record on disk
+        self._written: dict[str, float] = {}      # key → set_at of the latest record
+        self._pending: dict[str, tuple] = {}
+        self._size     = 0
+        self._task:    Optional[asyncio.Task] = None
+
+        self.restored = 0
+        self.expired  = 0
+        self.flushed  = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    # ── Startup ──────────────────────────────────────────────────────────
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            await asyncio.to_thread(self._open)
+        except OSError as exc:
+            logger.error("[snapshots] cannot open %s: %s — persistence disabled", self.path, exc)
+            self.path = None
+            return
+        for prefix in self.prefixes:
+            cache.add_listener(prefix, self.on_cache_write)
+        cache.set_fallback(self.restore)
+        self._task = asyncio.create_task(self._run())
+        logger.info("[snapshots] %d keys available from %s", len(self._index), self.path)
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(MAGIC):
+            with open(self.path, "wb") as f:
+                f.write(MAGIC)
+        with open(self.path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            raise OSError("not a snapshot file")
+
+        index, live, end = self._scan(mm, self.prefixes)
+        if end < len(mm):
+            logger.warning("[snapshots] dropping %d torn bytes at the end of %s", len(mm) - end, self.path)
+            mm.close()
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._mmap, self._index, self._live, self._size = mm, index, live, end
+        self._written = {key: rec[4] for key, rec in index.items()}
+        if self._size > self.compact_ratio * max(sum(live.values()), 1) + len(MAGIC):
+            self._compact()
+
+    @staticmethod
+    def _scan(buf, prefixes: tuple[str, ...]) -> tuple[dict, dict, int]:
+        """
+        Index every complete record → (index, live sizes, end of valid data).
+        Records of keys outside `prefixes` (written by older versions) are
+        skipped, so compaction drops them.
+        """
+        index, live = {}, {}
+        pos, n = len(MAGIC), len(buf)
+        while pos + _RECORD.size <= n:
+            klen, vlen, fresh, stale, set_at = _RECORD.unpack_from(buf, pos)
+            start = pos + _RECORD.size
+            end = start + klen + vlen + _CRC.size
+            if end > n:
+                break
+            (crc,) = _CRC.unpack_from(buf, end - _CRC.size)
+            if zlib.crc32(buf[start:end - _CRC.size]) != crc:
+                break
+            key = bytes(buf[start:start + klen]).decode()
+            if key.startswith(prefixes):
+                index[key] = (start + klen, vlen, fresh, stale, set_at)
+                live[key] = end - pos
+            pos = end
+        return index, live, pos
+
+    # ── Restore (TTLCache fallback) ──────────────────────────────────────
+    def restore(self, key: str) -> Optional[tuple]:
+        rec = self._index.pop(key, None) if key.startswith(self.prefixes) else None
+        if rec is None or self._mmap is None:
+            return None
+        offset, length, fresh_until, stale_until, set_at = rec
+        valid_until = max(stale_until, set_at + self.max_age)
+        if time.time() > valid_until:
+            self.expired += 1
+            return None
+        try:
+            value = codec.decode(self._mmap[offset:offset + length])
+        except Exception as exc:
+            logger.warning("[snapshots] cannot decode %s: %s", key, exc)
+            return None
+        self.restored += 1
+        return value, fresh_until, valid_until, set_at
+
+    # ── Writes ───────────────────────────────────────────────────────────
+    def on_cache_write(self, key: str, value: Any, stale_until: float):
+        set_at = cache.set_at(key)
+        if set_at is None or self._written.get(key) == set_at:
+            return                                   # just restored from disk
+        # The cache has newer data now — never restore the old record
+        self._index.pop(key, None)
+        fresh_until = time.time() + (cache.fresh_for(key) or 0.0)
+        self._pending[key] = (value, fresh_until, stale_until, set_at)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._append, pending)
+        except Exception as exc:
+            logger.error("[snapshots] flush failed: %s", exc)
+
+    def _append(self, pending: dict[str, tuple]):
+        chunks = []
+        for key, (value, fresh_until, stale_until, set_at) in pending.items():
+            kb, vb = key.encode(), codec.encode(value)
+            body = kb + vb
+            record = (_RECORD.pack(len(kb), len(vb), fresh_until, stale_until, set_at)
+                      + body + _CRC.pack(zlib.crc32(body)))
+            chunks.append(record)
+            self._live[key] = len(record)
+            self._written[key] = set_at
+        data = b"".join(chunks)
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self._size += len(data)
+        self.flushed += len(pending)
+        if self._size > self.compact_ratio * sum(self._live.values()) + (1 << 20):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file keeping only each key's latest record."""
+        with open(self.path, "rb") as f:
+            data = f.read()
+        index, _, _ = self._scan(memoryview(data), self.prefixes)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            for key, (offset, length, *_) in index.items():
+                start = offset - len(key.encode()) - _RECORD.size
+                f.write(data[start:offset + length + _CRC.size])
+        os.replace(tmp, self.path)
+        before, self._size = self._size, os.path.getsize(self.path)
+        # The open mmap still maps the old inode, so restore() keeps working
+        logger.info("[snapshots] compacted %s: %d → %d bytes", self.path, before, self._size)
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled":   self.enabled,
+            "path":      self.path,
+            "bytes":     self._size,
+            "keys":      len(self._live),
+            "available": len(self._index),
+            "restored":  self.restored,
+            "expired":   self.expired,
+            "flushed":   self.flushed,
+        }
+
+
+snapshots = SnapshotStore(os.environ.get("SNAPSHOT_PATH"))
@@ -0,0 +1,194 @@
+import heapq
+import itertools
+import time
+from typing import Optional
+
+from app.metrics import SPREAD_DURATION
+from app.offers import OfferBatch
+from app.payload import Payload
+from app.scoring import SAFE_THRESHOLD
+
+_UPDATE_SECONDS = SPREAD_DURATION.labels("update")
+_RESULT_SECONDS = SPREAD_DURATION.labels("result")
+
+
+def _summary(batch: OfferBatch, i: int) -> dict:
+    o = batch.rows[i]
+    return {
+        "price":        o["price"],
+        "exchange":     o.get("exchange", ""),
+        "advertiser":   o.get("advertiser", ""),
+        "url":          o.get("url", ""),
+        "safety_score": o["safety_score"],
+        "safety_tier":  o["safety_tier"],
+    }
+
+
+def best_offers(batch: OfferBatch, side: str) -> tuple[Optional[dict], Optional[dict]]:
+    """→ (best safe offer, best offer of any safety) for one snapshot, by price."""
+    if not len(batch):
+        return None, None
+    order = batch.orders["price:SELL" if side == "SELL" else "price:BUY"]
+    safe = order[batch.safety_score[order] >= SAFE_THRESHOLD]
+    best_safe = _summary(batch, int(safe[0])) if len(safe) else None
+    return best_safe, _summary(batch, int(order[0]))
+
+
+class _SideBook:
+    """
+    Best offer for one (fiat, crypto, side) across exchanges.
+
+    A heap of (tier, signed price, seq, exchange, summary, stale_until) with
+    lazy deletion: updating an exchange pushes new candidates and bumps its
+    seq, superseded entries are discarded when they reach the top. Tier 0 =
+    safe candidates, tier 1 = any offer, so the "fall back to all offers when
+    none is safe" rule falls out of the heap order.
+    """
+
+    __slots__ = ("side", "heap", "live")
+
+    def __init__(self, side: str):
+        self.side = side
+        self.heap: list = []
+        self.live: dict[str, int] = {}            # exchange → current seq
+
+    def update(self, exchange: str, seq: int, best_safe, best_any, stale_until: float):
+        self.live[exchange] = seq
+        sign = -1 if self.side == "SELL" else 1
+        for tier, cand in ((0, best_safe), (1, best_any)):
+            if cand is not None:
+                heapq.heappush(self.heap, (tier, sign * cand["price"], seq, exchange, cand, stale_until))
+        if len(self.heap) > 8 * max(len(self.live), 1):
+            self.heap = [e for e in self.heap if self.live.get(e[3]) == e[2]]
+            heapq.heapify(self.heap)
+
+    def best(self, now: float) -> Optional[tuple[dict, float]]:
+        while self.heap:
+            tier, _, seq, exchange, cand, stale_until = self.heap[0]
+            if self.live.get(exchange) != seq:
+                heapq.heappop(self.heap)              # superseded
+            elif now > stale_until:
+                heapq.heappop(self.heap)              # source cache entry is dead
+                if tier == 1:
+                    self.live.pop(exchange, None)
+            else:
+                return cand, stale_until
+        return None
+
+
+class SpreadIndex:
+    """
+    Incrementally maintained best buy / best sell per (fiat, crypto).
+
+    Fed by cache writes of `p2p:{exchange}:{fiat}:{crypto}:{side}` keys:
+    each write re-derives only that exchange's candidates for that pair and
+    side. `/p2p/spread` reads the per-pair spreads in O(pairs), with no
+    upstream fan-out; the encoded result is reused until something changes.
+    """
+
+    def __init__(self):
+        self._books:   dict[tuple, _SideBook]   = {}
+        self._spreads: dict[tuple, dict]        = {}
+        self._expires: dict[tuple, float]       = {}
+        self._seq      = itertools.count(1)
+        self._version  = 0
+        self._payload: Optional[Payload] = None
+        self._payload_version = -1
+
+    def on_cache_write(self, key: str, value, stale_until: float):
+        """TTLCache listener for the `p2p:` prefix."""
+        if not isinstance(value, OfferBatch):
+            return
+        _, exchange, fiat, crypto, side = key.split(":")
+        self.update(exchange, fiat, crypto, side, value, stale_until)
+
+    def update(self, exchange: str, fiat: str, crypto: str, side: str, batch: OfferBatch, stale_until: float):
+        started = time.perf_counter()
+        book = self._books.get((fiat, crypto, side))
+        if book is None:
+            book = self._books[(fiat, crypto, side)] = _SideBook(side)
+        best_safe, best_any = best_offers(batch, side)
+        book.update(exchange.lower(), next(self._seq), best_safe, best_any, stale_until)
+        self._recompute((fiat, crypto), time.time())
+        _UPDATE_SECONDS.observe(time.perf_counter() - started)
+
+    def _recompute(self, pair: tuple, now: float):
+        fiat, crypto = pair
+        buy_book, sell_book = self._books.get((*pair, "BUY")), self._books.get((*pair, "SELL"))
+        buy  = buy_book.best(now)  if buy_book  else None
+        sell = sell_book.best(now) if sell_book else None
+        spread = None
+        if buy and sell:
+            spread = _spread_row(fiat, crypto, buy[0], sell[0])
+            # Tracked even when the row is implausible: once either offer
+            # dies, the next best ones may give a valid spread
+            self._expires[pair] = min(buy[1], sell[1])
+        else:
+            self._expires.pop(pair, None)
+        if spread is None:
+            self._spreads.pop(pair, None)
+        else:
+            self._spreads[pair] = spread
+        self._version += 1
+
+    def _expire(self, now: float):
+        for pair in [p for p, exp in self._expires.items() if now > exp]:
+            self._recompute(pair, now)
+
+    def spread(self, fiat: str, crypto: str) -> Optional[dict]:
+        """Current spread row for one pair, or None if either side is unknown."""
+        pair = (fiat, crypto)
+        if pair in self._expires and time.time() > self._expires[pair]:
+            self._recompute(pair, time.time())
+        return self._spreads.get(pair)
+
+    def result(self) -> dict:
+        started = time.perf_counter()
+        self._expire(time.time())
+        spreads = sorted(self._spreads.values(), key=lambda x: x["spread_pct"], reverse=True)
+        _RESULT_SECONDS.observe(time.perf_counter() - started)
+        return {
+            "spread":     spreads[0] if spreads else None,
+            "all":        spreads,
+            "profitable": [s for s in spreads if s["profitable"]],
+            "scanned":    len(spreads),
+        }
+
+    def payload(self) -> Payload:
+        self._expire(time.time())
+        if self._payload is None or self._payload_version != self._version:
+            self._payload = Payload(self.result())
+            self._payload_version = self._version
+        return self._payload
+
+
+def _spread_row(fiat: str, crypto: str, buy: dict, sell: dict) -> Optional[dict]:
+    bp, sp = buy["price"], sell["price"]
+    if bp <= 0:
+        return None
+    pct = (sp - bp) / bp * 100
+    if not (-50 < pct < 10):
+        return None
+    return {
+        "fiat":              fiat,
+        "crypto":            crypto,
+        "buy_price":         round(bp, 6),
+        "sell_price":        round(sp, 6),
+        "spread_pct":        round(pct, 3),
+        "profitable":        pct > 0,
+        "buy_exchange":      buy["exchange"],
+        "sell_exchange":     sell["exchange"],
+        "buy_advertiser":    buy["advertiser"],
+        "sell_advertiser":   sell["advertiser"],
+        "buy_url":           buy["url"],
+        "sell_url":          sell["url"],
+        "buy_safety_score":  buy["safety_score"],
+        "sell_safety_score": sell["safety_score"],
+        "buy_safety_tier":   buy["safety_tier"],
+        "sell_safety_tier":  sell["safety_tier"],
+        # True when best buy and best sell are on different exchanges
+        "cross_exchange":    buy["exchange"].lower() != sell["exchange"].lower(),
+    }
+
+
+spread_index = SpreadIndex()
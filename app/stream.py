@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+try:
+    from websockets.asyncio.client import connect
+except ImportError:          # without websockets everything stays on REST
+    connect = None
+
+logger = logging.getLogger("metaflow")
+
+# Combined-stream endpoint; BINANCE_WS_URL points it at a local stand-in
+STREAM_URL = os.environ.get("BINANCE_WS_URL", "wss://stream.binance.com:9443/stream")
+MAX_STREAMS = 200            # Binance allows 1024 per connection; we stay well below
+
+
+class BinanceStream:
+    """
+    One lifespan-managed WebSocket to Binance market data.
+
+    Streams are added with `subscribe()` (sent on the live connection and
+    replayed after every reconnect) and dropped with `unsubscribe()`. Each
+    event is dispatched by its "e" type to the handlers registered with
+    `on()`; `on_connect` callbacks run after each (re)connect so consumers
+    can mark their data for backfill — anything that happened while we were
+    disconnected was missed.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.streams: set[str] = set()
+        self.connected = False
+        self._handlers: dict[str, Callable[[dict], None]] = {}
+        self._connect_hooks: list[Callable[[], None]] = []
+        self._ws = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_id = 1
+
+        self.messages   = 0
+        self.reconnects = 0
+        self.last_message: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return connect is not None and bool(self.url)
+
+    def on(self, event: str, fn: Callable[[dict], None]):
+        self._handlers[event] = fn
+
+    def on_connect(self, fn: Callable[[], None]):
+        self._connect_hooks.append(fn)
+
+    def subscribe(self, *streams: str):
+        """Add streams; sent right away when connected, otherwise on connect."""
+        wanted = [s for s in streams if s not in self.streams]
+        new = wanted[: MAX_STREAMS - len(self.streams)]
+        if len(new) < len(wanted):
+            logger.warning("[stream] %d streams open, not subscribing %s", len(self.streams), wanted[len(new):])
+        if not new:
+            return
+        self.streams.update(new)
+        if self._ws is not None:
+            asyncio.create_task(self._send("SUBSCRIBE", new))
+
+    def unsubscribe(self, *streams: str):
+        gone = [s for s in streams if s in self.streams]
+        if not gone:
+            return
+        self.streams.difference_update(gone)
+        if self._ws is not None:
+            asyncio.create_task(self._send("UNSUBSCRIBE", gone))
+
+    async def _send(self, method: str, streams: list[str]):
+        try:
+            await self._ws.send(json.dumps({"method": method, "params": streams, "id": self._next_id}))
+            self._next_id += 1
+        except Exception as exc:
+            logger.warning("[stream] %s failed: %s", method.lower(), exc)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            if self._ws is not None:
+                try:
+                    await self._ws.close()
+                except Exception:
+                    pass
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with connect(self.url, open_timeout=10, max_size=2 ** 22) as ws:
+                    self._ws = ws
+                    self.connected = True
+                    backoff = 1.0
+                    for hook in self._connect_hooks:
+                        hook()
+                    if self.streams:
+                        await self._send("SUBSCRIBE", sorted(self.streams))
+                    logger.info("[stream] connected, %d streams", len(self.streams))
+                    async for raw in ws:
+                        self._dispatch(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("[stream] connection lost: %s — reconnecting in %.0fs", exc, backoff)
+            finally:
+                self._ws = None
+                self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _dispatch(self, raw):
+        msg = json.loads(raw)
+        if isinstance(msg, dict) and "id" in msg:
+            return                                   # (UN)SUBSCRIBE acknowledgement
+        data = msg.get("data") if isinstance(msg, dict) and "stream" in msg else msg
+        if not isinstance(data, (dict, list)):
+            return
+        self.messages += 1
+        self.last_message = time.time()
+        events = data if isinstance(data, list) else [data]
+        for event in events:
+            handler = self._handlers.get(event.get("e")) if isinstance(event, dict) else None
+            if handler is not None:
+                try:
+                    handler(event)
+                except Exception as exc:
+                    logger.error("[stream] %s handler failed: %s", event.get("e"), exc)
+
+    def stats(self) -> dict:
+        return {
+            "enabled":    self.enabled,
+            "connected":  self.connected,
+            "streams":    len(self.streams),
+            "messages":   self.messages,
+            "reconnects": self.reconnects,
+            "last_message_age": round(time.time() - self.last_message, 1) if self.last_message else None,
+        }
+
+
+stream = BinanceStream(STREAM_URL)
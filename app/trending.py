@@ -0,0 +1,114 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+# Quote assets we index, longest first so "FDUSD" wins over "USD"-like suffixes
+QUOTES = ("FDUSD", "USDT", "USDC", "BTC", "ETH", "BNB", "EUR", "TRY")
+
+# sort_by → score column (higher = more trending)
+SORT_KEYS = ("change", "volume", "range")
+
+
+def quote_of(symbol: str) -> Optional[str]:
+    for quote in QUOTES:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return quote
+    return None
+
+
+class TickerTable:
+    """
+    24 h tickers of every symbol as columnar arrays.
+
+    Filled in one go from REST ticker/24hr (strings parsed by numpy in bulk,
+    not per-field float() calls) and patched per symbol by miniTicker
+    events. A symbol index per quote asset means a query only looks at
+    e.g. the USDT pairs, and `top()` selects the K best with argpartition
+    instead of sorting every candidate.
+    """
+
+    COLUMNS = ("last", "open", "high", "low", "quote_volume")
+
+    def __init__(self):
+        self.symbols: list[str] = []
+        self.row: dict[str, int] = {}
+        self._data = np.empty((0, len(self.COLUMNS)))   # capacity rows; the first len(self) are used
+        self._by_quote: dict[str, np.ndarray] = {}
+        self._dirty = False
+        self.loaded_at = 0.0                      # last full REST load
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def load(self, tickers: list[dict]):
+        """Replace the table from a REST ticker/24hr response."""
+        self.symbols = [t["symbol"] for t in tickers]
+        self.row = {s: i for i, s in enumerate(self.symbols)}
+        raw = [(t["lastPrice"], t["openPrice"], t["highPrice"], t["lowPrice"], t.get("quoteVolume", 0))
+               for t in tickers]
+        self._data = np.array(raw, dtype=float).reshape(-1, len(self.COLUMNS))
+        self._reindex()
+        self.loaded_at = time.time()
+        self.version += 1
+
+    def update(self, symbol: str, last: float, open_: float, high: float, low: float, quote_volume: float):
+        i = self.row.get(symbol)
+        if i is None:
+            i = self.row[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+            if i == len(self._data):
+                grown = np.zeros((max(2 * i, 256), len(self.COLUMNS)))
+                grown[:i] = self._data
+                self._data = grown
+            self._dirty = True
+        self._data[i] = (last, open_, high, low, quote_volume)
+        self.version += 1
+
+    def _reindex(self):
+        groups: dict[str, list[int]] = {}
+        for i, symbol in enumerate(self.symbols):
+            quote = quote_of(symbol)
+            if quote is not None:
+                groups.setdefault(quote, []).append(i)
+        self._by_quote = {q: np.asarray(ix, dtype=np.intp) for q, ix in groups.items()}
+        self._dirty = False
+
+    def top(self, limit: int = 20, quote: str = "USDT", min_volume: float = 1_000_000,
+            sort_by: str = "change") -> list[dict]:
+        """The `limit` `quote` pairs above `min_volume` with the highest |change|, volume or (high − low) / low."""
+        if self._dirty:
+            self._reindex()
+        idx = self._by_quote.get(quote)
+        if idx is None or not len(idx):
+            return []
+        rows = self._data[idx]
+        last, open_, high, low, volume = rows.T
+        keep = (volume > min_volume) & (open_ > 0) & (low > 0)
+        idx, last, open_, high, low, volume = (a[keep] for a in (idx, last, open_, high, low, volume))
+        change = (last / open_ - 1.0) * 100.0
+        score = {"change": np.abs(change), "volume": volume, "range": (high - low) / low}[sort_by]
+
+        k = min(limit, len(score))
+        if k == 0:
+            return []
+        best = np.argpartition(-score, k - 1)[:k] if k < len(score) else np.arange(len(score))
+        best = best[np.argsort(-score[best], kind="stable")]
+        cut = len(quote)
+        return [{
+            "symbol": self.symbols[idx[j]][:-cut],
+            "price":  float(last[j]),
+            "change": round(float(change[j]), 3),
+            "volume": float(volume[j]),
+            "high":   float(high[j]),
+            "low":    float(low[j]),
+        } for j in best.tolist()]
+
+    def stats(self) -> dict:
+        return {
+            "symbols":  len(self),
+            "quotes":   {q: len(ix) for q, ix in self._by_quote.items()},
+            "age":      round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "version":  self.version,
+        }
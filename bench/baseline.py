@@ -0,0 +1,68 @@
+import json
+import os
+from typing import Optional
+
+# Results of a reference run, compared against by micro.py and load.py.
+# Timings depend on the machine — save a baseline on the machine you
+# compare on (--save-baseline) rather than sharing one.
+BASELINE_PATH = os.environ.get("BENCH_BASELINE", os.path.join(os.path.dirname(__file__), "baseline.json"))
+
+# Metrics where a higher value is better; for everything else lower is better
+HIGHER_IS_BETTER = {"rps", "ops_per_sec"}
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[k]
+
+
+def load(section: str) -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f).get(section, {})
+
+
+def save(section: str, results: dict):
+    data = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            data = json.load(f)
+    data[section] = results
+    with open(BASELINE_PATH, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print(f"baseline saved to {BASELINE_PATH} [{section}]")
+
+
+def _change(metric: str, now: float, then: Optional[float]) -> tuple[str, float]:
+    """→ (printable change, regression as a fraction; > 0 = worse)."""
+    if not then:
+        return "", 0.0
+    delta = (now - then) / then
+    worse = -delta if metric in HIGHER_IS_BETTER else delta
+    return f"{delta * 100:+.1f}%", worse
+
+
+def report(section: str, results: dict[str, dict], metrics: list[str], tolerance: float) -> list[str]:
+    """Print `results` next to the saved baseline; → names of regressed benchmarks."""
+    base = load(section)
+    width = max((len(name) for name in results), default=10)
+    print(f"{'':{width}}  " + "  ".join(f"{m:>18}" for m in metrics))
+    regressed = []
+    for name, values in results.items():
+        cells = []
+        for metric in metrics:
+            now = values.get(metric, 0.0)
+            change, worse = _change(metric, now, base.get(name, {}).get(metric))
+            flag = "!" if worse > tolerance else " "
+            cells.append(f"{now:>10.4g} {change:>6}{flag}")
+            if worse > tolerance and name not in regressed:
+                regressed.append(name)
+        print(f"{name:{width}}  " + "  ".join(cells))
+    if not base:
+        print("(no baseline yet — run with --save-baseline to record one)")
+    elif regressed:
+        print(f"regressed by more than {tolerance:.0%}: {', '.join(regressed)}")
+    return regressed
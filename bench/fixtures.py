@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import time
+import zlib
+from functools import lru_cache
+from typing import Optional
+
+# Upstream payloads in the shape the exchanges return them.
+#
+# A recorded response saved as BENCH_FIXTURES/<name>.json (e.g.
+# "bybit_PLN_USDT_BUY.json", "binance_EUR_USDT_SELL.json",
+# "ticker_24hr.json") is replayed as is; everything else is generated —
+# deterministically, so two runs see the same books.
+FIXTURES_DIR = os.environ.get("BENCH_FIXTURES", os.path.join(os.path.dirname(__file__), "fixtures"))
+
+# Rough fiat per 1 USDT, for plausible prices
+FIAT_RATES = {
+    "PLN": 3.95, "EUR": 0.92, "USD": 1.0, "GBP": 0.79, "CZK": 23.1, "HUF": 362.0,
+    "CAD": 1.37, "NGN": 1580.0, "ILS": 3.7, "JPY": 151.0, "AED": 3.67, "INR": 84.0,
+    "GEL": 2.7, "TRY": 34.2, "AMD": 388.0, "AZN": 1.7, "UZS": 12700.0,
+}
+CRYPTO_USD = {"USDT": 1.0, "USDC": 1.0, "BTC": 67000.0, "ETH": 3400.0}
+
+BYBIT_PAYMENTS   = ["14", "64", "9", "133", "154", "355", "377", "591", "999"]
+BINANCE_PAYMENTS = ["BankTransfer", "Revolut", "Wise", "BLIK", "SEPA", "Zen", "Skrill"]
+
+BOOK_DEPTH = 150     # offers per (exchange, pair, side) book
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(zlib.crc32(":".join(map(str, parts)).encode()))
+
+
+def recorded(name: str) -> Optional[object]:
+    path = os.path.join(FIXTURES_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _prices(rng: random.Random, fiat: str, crypto: str, side: str, n: int) -> list[float]:
+    mid = FIAT_RATES.get(fiat, 1.0) * CRYPTO_USD.get(crypto, 1.0)
+    # Best offer first: cheapest when buying, dearest when selling
+    offsets = sorted(abs(rng.gauss(0, 0.02)) for _ in range(n))
+    sign = 1 if side == "BUY" else -1
+    return [round(mid * (1 + sign * (0.004 + d)), 2) for d in offsets]
+
+
+@lru_cache(maxsize=None)
+def bybit_book(fiat: str, crypto: str, side: str, n: int = BOOK_DEPTH) -> list[dict]:
+    rng = _rng("bybit", fiat, crypto, side)
+    items = []
+    for i, price in enumerate(_prices(rng, fiat, crypto, side, n)):
+        user_id = 100000 + rng.randrange(900000)
+        low = rng.choice([1, 5, 50, 100, 500])
+        items.append({
+            "id":                 str(1800000000000000000 + i * 7919 + user_id),
+            "accountId":          str(user_id + 7),
+            "userId":             str(user_id),
+            "nickName":           f"trader{user_id}",
+            "tokenId":            crypto,
+            "currencyId":         fiat,
+            "side":               1 if side == "BUY" else 0,
+            "price":              f"{price:.2f}",
+            "lastQuantity":       f"{rng.uniform(10, 5000):.4f}",
+            "quantity":           f"{rng.uniform(5000, 20000):.4f}",
+            "minAmount":          f"{low:.2f}",
+            "maxAmount":          f"{low * rng.choice([20, 100, 400]):.2f}",
+            "payments":           rng.sample(BYBIT_PAYMENTS, rng.randint(1, 3)),
+            "recentOrderNum":     rng.choice([0, 3, 12, 40, 180, 900, 4000]),
+            "recentExecuteRate":  rng.choice([72, 88, 94, 97, 99, 100]),
+            "isOnline":           True,
+            "authStatus":         rng.choice([1, 2]),
+        })
+    return items
+
+
+@lru_cache(maxsize=None)
+def binance_book(fiat: str, crypto: str, side: str, n: int = BOOK_DEPTH) -> list[dict]:
+    rng = _rng("binance", fiat, crypto, side)
+    items = []
+    for i, price in enumerate(_prices(rng, fiat, crypto, side, n)):
+        user_no = "s" + "".join(rng.choice("0123456789abcdef") for _ in range(32))
+        low = rng.choice([10, 50, 100, 500])
+        items.append({
+            "adv": {
+                "advNo":                  str(12600000000000000000 + i * 104729),
+                "tradeType":              side,
+                "asset":                  crypto,
+                "fiatUnit":               fiat,
+                "price":                  f"{price:.2f}",
+                "surplusAmount":          f"{rng.uniform(50, 10000):.2f}",
+                "tradableQuantity":       f"{rng.uniform(50, 10000):.2f}",
+                "minSingleTransAmount":   f"{low:.2f}",
+                "maxSingleTransAmount":   f"{low * rng.choice([20, 100, 400]):.2f}",
+                "tradeMethods": [{"identifier": m, "tradeMethodName": m}
+                                 for m in rng.sample(BINANCE_PAYMENTS, rng.randint(1, 3))],
+            },
+            "advertiser": {
+                "userNo":          user_no,
+                "nickName":        f"P2P-{user_no[1:9]}",
+                "monthOrderCount": rng.choice([4, 25, 120, 600, 2500]),
+                "monthFinishRate": rng.choice([0.81, 0.93, 0.97, 0.99, 1.0]),
+                "userType":        rng.choice(["user", "merchant"]),
+            },
+        })
+    return items
+
+
+def bybit_page(fiat: str, crypto: str, side: str, page: int, size: int) -> dict:
+    book = recorded(f"bybit_{fiat}_{crypto}_{side}")
+    if book is not None:
+        return book
+    items = bybit_book(fiat, crypto, side)
+    return {"ret_code": 0, "ret_msg": "SUCCESS",
+            "result": {"count": len(items), "items": items[(page - 1) * size: page * size]}}
+
+
+def binance_page(fiat: str, crypto: str, side: str, page: int, rows: int) -> dict:
+    book = recorded(f"binance_{fiat}_{crypto}_{side}")
+    if book is not None:
+        return book
+    items = binance_book(fiat, crypto, side)
+    return {"code": "000000", "message": None, "success": True, "total": len(items),
+            "data": items[(page - 1) * rows: page * rows]}
+
+
+@lru_cache(maxsize=None)
+def tickers(n: int = 2000) -> list[dict]:
+    data = recorded("ticker_24hr")
+    if data is not None:
+        return data
+    rng = _rng("tickers")
+    quotes = ["USDT"] * 5 + ["BTC", "FDUSD", "USDC", "TRY", "EUR"]
+    out = []
+    for i in range(n):
+        open_ = rng.lognormvariate(0, 2)
+        last = open_ * rng.uniform(0.8, 1.25)
+        high, low = max(open_, last) * rng.uniform(1, 1.05), min(open_, last) * rng.uniform(0.95, 1)
+        volume = rng.lognormvariate(12, 2.5)
+        out.append({
+            "symbol":             f"COIN{i}{rng.choice(quotes)}",
+            "priceChange":        f"{last - open_:.8f}",
+            "priceChangePercent": f"{(last / open_ - 1) * 100:.3f}",
+            "weightedAvgPrice":   f"{(high + low) / 2:.8f}",
+            "prevClosePrice":     f"{open_:.8f}",
+            "lastPrice":          f"{last:.8f}",
+            "openPrice":          f"{open_:.8f}",
+            "highPrice":          f"{high:.8f}",
+            "lowPrice":           f"{low:.8f}",
+            "volume":             f"{volume / last:.8f}",
+            "quoteVolume":        f"{volume:.8f}",
+            "count":              rng.randrange(100, 500000),
+        })
+    return out
+
+
+INTERVALS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400, "1d": 86400, "1w": 604800}
+
+
+def klines(symbol: str, interval: str, limit: int, start_time: Optional[int] = None,
+           now_ms: Optional[int] = None) -> list[list]:
+    """Up to `limit` candles from `start_time` (default: ending with the open one); each is seeded by its open time."""
+    step = INTERVALS.get(interval, 86400) * 1000
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    last_open = now_ms // step * step
+    first = last_open - (limit - 1) * step if start_time is None else start_time // step * step
+    out = []
+    for t in range(first, last_open + step, step):
+        rng = _rng(symbol, interval, t)
+        open_ = 100.0 * (1 + 0.3 * ((t // step) % 97) / 97) * rng.uniform(0.99, 1.01)
+        close = open_ * rng.uniform(0.97, 1.03)
+        high, low = max(open_, close) * rng.uniform(1, 1.01), min(open_, close) * rng.uniform(0.99, 1)
+        volume = rng.uniform(100, 10000)
+        out.append([t, f"{open_:.2f}", f"{high:.2f}", f"{low:.2f}", f"{close:.2f}", f"{volume:.4f}",
+                    t + step - 1, f"{volume * close:.2f}", rng.randrange(100, 10000),
+                    f"{volume / 2:.4f}", f"{volume * close / 2:.2f}", "0"])
+        if len(out) >= limit:
+            break
+    return out
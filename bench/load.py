@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from bench import baseline
+
+# End-to-end load scenarios: the service (uvicorn main:app) runs against
+# bench/mock_upstream.py, both as subprocesses on free local ports, and
+# each scenario is driven by `concurrency` workers for `duration` seconds
+# after a warm-up pass. Reports throughput and p50 / p99 per scenario.
+#
+#   python -m bench.load [scenario ...] [--latency 0.05 --error-rate 0.02
+#                         --throttle-rate 0.01] [--save-baseline]
+#
+# Redis, snapshots, history files and the market WebSocket are disabled so runs are
+# self-contained; --app-url skips starting the service (upstreams are then
+# whatever that instance is configured with).
+
+PAIRS = [("PLN", "USDT"), ("EUR", "USDT"), ("USD", "USDT"), ("GBP", "USDT"),
+         ("PLN", "BTC"), ("EUR", "BTC"), ("TRY", "USDT"), ("NGN", "USDT")]
+
+# name → (paths cycled through by the workers, concurrency)
+SCENARIOS = {
+    "p2p_hot":    (["/p2p?fiat=PLN&crypto=USDT&side=BUY&exchange=bybit"], 32),
+    "p2p_pairs":  ([f"/p2p?fiat={f}&crypto={c}&side={s}&exchange={e}"
+                    for f, c in PAIRS for s in ("BUY", "SELL") for e in ("bybit", "binance")], 32),
+    "p2p_paged":  (["/p2p?fiat=EUR&crypto=USDT&side=SELL&exchange=binance&limit=20&sort=rate"], 32),
+    "p2p_book":   (["/p2p/book?fiat=PLN&crypto=USDT&side=BUY&amount=5000"], 16),
+    "spread":     (["/p2p/spread"], 32),
+    "trending":   (["/market/trending", "/market/trending?sort_by=volume&limit=50"], 16),
+    "chart":      (["/market/chart?symbol=BTCUSDT&interval=1h&indicators=ma7,ema21,rsi14"], 16),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+@contextmanager
+def _process(args: list[str], env: dict, ready_url: str):
+    proc = subprocess.Popen(args, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(ready_url)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def _servers(args):
+    if args.app_url:
+        yield args.app_url
+        return
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mock_port, app_port = _free_port(), _free_port()
+    mock = f"http://127.0.0.1:{mock_port}"
+    mock_env = {
+        "MOCK_LATENCY":       str(args.latency),
+        "MOCK_JITTER":        str(args.jitter),
+        "MOCK_ERROR_RATE":    str(args.error_rate),
+        "MOCK_THROTTLE_RATE": str(args.throttle_rate),
+        "PYTHONPATH":         root,
+    }
+    app_env = {
+        "BYBIT_P2P_URL":   f"{mock}/fiat/otc/item/online",
+        "BINANCE_P2P_URL": f"{mock}/bapi/c2c/v2/friendly/c2c/adv/search",
+        "BINANCE_BASE":    f"{mock}/api/v3",
+        "BINANCE_WS_URL":  "",
+        "REDIS_URL":       "",
+        "SNAPSHOT_PATH":   "",
+        "HISTORY_PATH":    "",
+        "PYTHONPATH":      root,
+    }
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    with _process(uvicorn + ["bench.mock_upstream:app", "--port", str(mock_port)], mock_env,
+                  f"{mock}/mock/stats"):
+        app = f"http://127.0.0.1:{app_port}"
+        with _process(uvicorn + ["main:app", "--port", str(app_port)], app_env, f"{app}/health"):
+            yield app
+
+
+# Cold misses queue in the service's rate limiter (bybit: 1.25 requests/s),
+# so warming many pairs at once can take well over the per-request timeout
+WARMUP_TIMEOUT = 180.0
+
+
+async def _scenario(client: httpx.AsyncClient, paths: list[str], concurrency: int, duration: float) -> dict:
+    # Warm-up: every path once, so the run measures steady state, not cold misses
+    await asyncio.gather(*[client.get(p, timeout=WARMUP_TIMEOUT) for p in paths])
+
+    latencies: list[float] = []
+    errors = 0
+    stop = time.perf_counter() + duration
+
+    async def worker(offset: int):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < stop:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                r = await client.get(path)
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(n) for n in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors":   errors,
+        "rps":      len(latencies) / elapsed,
+        "p50_ms":   baseline.percentile(latencies, 50) * 1000,
+        "p99_ms":   baseline.percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(app_url: str, names: list[str], duration: float) -> dict[str, dict]:
+    results = {}
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+    async with httpx.AsyncClient(base_url=app_url, timeout=30.0, limits=limits) as client:
+        for name, (paths, concurrency) in SCENARIOS.items():
+            if names and name not in names:
+                continue
+            results[name] = await _scenario(client, paths, concurrency, duration)
+            print(f"  {name}: {results[name]['requests']} requests, {results[name]['errors']} errors",
+                  file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load scenarios against the service on a mock upstream")
+    parser.add_argument("names", nargs="*", help=f"scenarios to run (default: all of {list(SCENARIOS)})")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock upstream delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream 500s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of upstream 429s")
+    parser.add_argument("--app-url", help="benchmark a running instance instead of starting one")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs. baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}; choose from {list(SCENARIOS)}")
+
+    with _servers(args) as app_url:
+        results = asyncio.run(run(app_url, args.names, args.duration))
+    regressed = baseline.report("load", results, ["rps", "p50_ms", "p99_ms"], args.tolerance)
+    if args.save_baseline:
+        baseline.save("load", {**baseline.load("load"), **results})
+    sys.exit(1 if regressed and not args.save_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
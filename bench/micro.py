@@ -0,0 +1,86 @@
+import argparse
+import copy
+import sys
+import timeit
+
+import numpy as np
+
+from app.collectors import binance_p2p, bybit_p2p
+from app.offers import OfferBatch
+from app.scoring import compute_rating, enrich_safety, ratings, safety_scores
+from bench import baseline, fixtures
+
+# CPU-only micro-benchmarks of the per-offer hot loops: upstream item
+# parsing, safety scoring / rating (per-dict and vectorized) and building
+# the columnar OfferBatch. Inputs are bench.fixtures pages.
+#
+#   python -m bench.micro [--save-baseline] [--tolerance 0.15]
+
+
+def _inputs():
+    bybit_items   = fixtures.bybit_page("PLN", "USDT", "BUY", 1, bybit_p2p.ROWS_PER_PAGE)["result"]["items"]
+    binance_items = fixtures.binance_page("PLN", "USDT", "BUY", 1, binance_p2p.ROWS_PER_PAGE)["data"]
+    offers = ([bybit_p2p._parse_item(i, "PLN", "USDT", "BUY")
+               for i in fixtures.bybit_book("PLN", "USDT", "BUY")[:100]]
+              + [binance_p2p._parse_item(i, "PLN", "USDT", "BUY")
+                 for i in fixtures.binance_book("PLN", "USDT", "BUY")[:100]])
+    return bybit_items, binance_items, offers
+
+
+def benchmarks() -> dict[str, tuple]:
+    """name → (callable, items processed per call)."""
+    bybit_items, binance_items, offers = _inputs()
+    fresh = copy.deepcopy(offers)                 # enrich_safety adds keys in place
+    price      = np.array([o["price"] for o in offers])
+    min_amount = np.array([o["min_amount"] for o in offers])
+    trades     = np.array([o["trade_count"] for o in offers])
+    rate       = np.array([o["completion_rate"] for o in offers])
+    is_binance = np.array([o["exchange"] == "Binance" for o in offers])
+
+    return {
+        "bybit_parse_page":   (lambda: [bybit_p2p._parse_item(i, "PLN", "USDT", "BUY") for i in bybit_items],
+                               len(bybit_items)),
+        "binance_parse_page": (lambda: [binance_p2p._parse_item(i, "PLN", "USDT", "BUY") for i in binance_items],
+                               len(binance_items)),
+        "enrich_safety":      (lambda: enrich_safety(fresh), len(fresh)),
+        "compute_rating":     (lambda: [compute_rating(o["completion_rate"], o["trade_count"]) for o in offers],
+                               len(offers)),
+        "safety_scores_np":   (lambda: safety_scores(price, min_amount, trades, rate, is_binance), len(offers)),
+        "ratings_np":         (lambda: ratings(rate, trades), len(offers)),
+        "offer_batch":        (lambda: OfferBatch(offers), len(offers)),
+    }
+
+
+def run(names: list[str], repeat: int) -> dict[str, dict]:
+    results = {}
+    for name, (fn, items) in benchmarks().items():
+        if names and name not in names:
+            continue
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()                # ≥ 0.2 s per repetition
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = {
+            "us_per_call": best * 1e6,
+            "ns_per_item": best * 1e9 / items,
+            "ops_per_sec": 1 / best,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the offer hot loops")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown vs. baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args.names, args.repeat)
+    regressed = baseline.report("micro", results, ["us_per_call", "ns_per_item"], args.tolerance)
+    if args.save_baseline:
+        baseline.save("micro", {**baseline.load("micro"), **results})
+    sys.exit(1 if regressed and not args.save_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
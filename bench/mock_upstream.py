@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from bench import fixtures
+
+# Local stand-in for the Bybit / Binance P2P and Binance market endpoints,
+# replaying bench.fixtures. Point the service at it with
+#
+#   BYBIT_P2P_URL=http://127.0.0.1:9100/fiat/otc/item/online
+#   BINANCE_P2P_URL=http://127.0.0.1:9100/bapi/c2c/v2/friendly/c2c/adv/search
+#   BINANCE_BASE=http://127.0.0.1:9100/api/v3
+#
+# Every response is delayed by MOCK_LATENCY ± MOCK_JITTER seconds; a
+# MOCK_ERROR_RATE fraction of requests get a 500 and a MOCK_THROTTLE_RATE
+# fraction a 429 with Retry-After, as the real upstreams do under load.
+
+
+class Faults:
+    def __init__(self):
+        self.latency       = float(os.environ.get("MOCK_LATENCY", 0.05))
+        self.jitter        = float(os.environ.get("MOCK_JITTER", 0.02))
+        self.error_rate    = float(os.environ.get("MOCK_ERROR_RATE", 0.0))
+        self.throttle_rate = float(os.environ.get("MOCK_THROTTLE_RATE", 0.0))
+        self.retry_after   = int(os.environ.get("MOCK_RETRY_AFTER", 1))
+        self.served = {}
+
+    async def apply(self, route: str):
+        """→ an error response to send instead, or None."""
+        delay = max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self._count(route, 429)
+            return JSONResponse({"code": -1003, "msg": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": str(self.retry_after)})
+        if roll < self.throttle_rate + self.error_rate:
+            self._count(route, 500)
+            return JSONResponse({"code": -1000, "msg": "Internal error"}, status_code=500)
+        self._count(route, 200)
+        return None
+
+    def _count(self, route: str, status: int):
+        key = f"{route} {status}"
+        self.served[key] = self.served.get(key, 0) + 1
+
+
+faults = Faults()
+app = FastAPI(title="Metaflow mock upstream")
+
+
+@app.post("/fiat/otc/item/online")
+async def bybit_online(request: Request):
+    body = await request.json()
+    error = await faults.apply("bybit")
+    if error is not None:
+        return error
+    side = "BUY" if str(body.get("side")) == "1" else "SELL"
+    return JSONResponse(fixtures.bybit_page(body["currencyId"], body["tokenId"], side,
+                                            int(body.get("page", 1)), int(body.get("size", 10))))
+
+
+@app.post("/bapi/c2c/v2/friendly/c2c/adv/search")
+async def binance_search(request: Request):
+    body = await request.json()
+    error = await faults.apply("binance")
+    if error is not None:
+        return error
+    return JSONResponse(fixtures.binance_page(body["fiat"], body["asset"], body["tradeType"],
+                                              int(body.get("page", 1)), int(body.get("rows", 10))))
+
+
+@app.get("/api/v3/ticker/24hr")
+async def ticker_24hr():
+    error = await faults.apply("ticker")
+    return error if error is not None else JSONResponse(fixtures.tickers())
+
+
+@app.get("/api/v3/klines")
+async def klines(symbol: str, interval: str, limit: int = 500, startTime: int = None):
+    error = await faults.apply("klines")
+    return error if error is not None else JSONResponse(
+        fixtures.klines(symbol, interval, min(limit, 1000), startTime))
+
+
+@app.get("/mock/stats")
+async def stats():
+    return faults.served
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock Bybit / Binance upstream")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=faults.latency, help="mean delay, seconds")
+    parser.add_argument("--jitter", type=float, default=faults.jitter)
+    parser.add_argument("--error-rate", type=float, default=faults.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=faults.throttle_rate)
+    args = parser.parse_args()
+    faults.latency, faults.jitter = args.latency, args.jitter
+    faults.error_rate, faults.throttle_rate = args.error_rate, args.throttle_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
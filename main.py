@@ -1,14 +1,65 @@
-import math, asyncio, time, logging
-from fastapi import FastAPI
+import asyncio, time, logging, zlib
+from contextlib import asynccontextmanager, suppress
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from app.collectors import bybit_p2p, binance_p2p
-from app.market import fetch_chart, fetch_trending
-from app.cache import cache
+from app.market import fetch_chart, fetch_trending, market_live, tickers
+from app.cache import cache, shared, tiered
+from app.clients import clients, hedging
+from app.ratelimit import limiter
+from app.breaker import breakers
+from app.offers import OfferBatch, decode_cursor, encode_cursor, parse_fields, project
+from app.singleflight import flight
+from app.payload import FastJSONResponse, Payload, dumps, json_response
+from app.scheduler import RefreshScheduler
+from app.spread import spread_index
+from app.feed import Subscription, feed
+from app.book import depth_levels, fill, merge_offers
+from app.snapshots import snapshots
+from app.stream import stream
+from app.history import TIERS, history
+from app.indicators import DEFAULT_INDICATORS, parse_indicators
+from app.trending import SORT_KEYS
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, registry
 
 logger = logging.getLogger("metaflow")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-app = FastAPI(title="Metaflow")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled upstream clients live for the whole process so keep-alive
+    # connections survive between requests.
+    await clients.start()
+    # Price history saved by the previous run (HISTORY_PATH) — before the
+    # snapshot restore, whose replayed writes it must recognise as old
+    await history.start()
+    # Last known snapshots (SNAPSHOT_PATH) are served stale right after a
+    # restart; spread pairs are restored up front so /p2p/spread isn't empty
+    await snapshots.start()
+    for key in SPREAD_KEYS:
+        cache.peek(key)
+    _check_refresh_budget()
+    await scheduler.start()
+    await cache.start_sweeper()
+    # Binance market-data WebSocket feeding charts and trending (app.stream)
+    await stream.start()
+    try:
+        yield
+    finally:
+        await stream.stop()
+        await cache.stop_sweeper()
+        await scheduler.stop()
+        await snapshots.stop()
+        await history.stop()
+        await clients.aclose()
+        await shared.aclose()
+
+
+app = FastAPI(title="Metaflow", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +68,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so CORS handling is included in the request timings
+app.add_middleware(MetricsMiddleware)
 
 EXCHANGES = {"bybit": bybit_p2p, "binance": binance_p2p}
 
@@ -28,46 +81,35 @@ CRYPTO_SET = set(SUPPORTED_CRYPTOS)
 FIAT_SET   = set(SUPPORTED_FIATS)
 
 
-# ─── Rate limiter ────────────────────────────────────────────────────────────
-# Minimum seconds between consecutive requests to the same exchange.
-# Keeps us well under their undocumented rate limits.
-_RATE_INTERVAL = {
-    "bybit":   0.8,   # ~75 req/min
-    "binance": 0.5,   # ~120 req/min
-}
-_rate_last:  dict[str, float]         = {}
-_rate_locks: dict[str, asyncio.Lock]  = {}
-
-
-def _exchange_lock(exchange: str) -> asyncio.Lock:
-    if exchange not in _rate_locks:
-        _rate_locks[exchange] = asyncio.Lock()
-    return _rate_locks[exchange]
-
-
-async def _rate_wait(exchange: str):
-    key = exchange.lower()
-    async with _exchange_lock(key):
-        interval = _RATE_INTERVAL.get(key, 1.0)
-        elapsed  = time.time() - _rate_last.get(key, 0)
-        if elapsed < interval:
-            await asyncio.sleep(interval - elapsed)
-        _rate_last[key] = time.time()
-
-
 # ─── Fetch with retry + exponential backoff ──────────────────────────────────
+# Each exchange has a circuit breaker (app.breaker). Only upstream
+# outcomes feed it: the pooled clients record every HTTP response (5xx / 429
+# as failures) and every request that got none (connect / read timeouts),
+# timed from the send — never our own rate-limiter queueing. While the
+# breaker is open no attempt is made: stale cache keeps being served (an
+# empty result never replaces it) and cold misses get an empty list at once.
+#
+# There is no deadline around a whole attempt: a deep book is several
+# requests, each of which first queues in the rate limiter, so any fixed cap
+# would mostly measure our own limiter. Every upstream request carries its
+# own deadline instead (clients.timeout), and every caller that has a client
+# waiting bounds its own wait (COLD_DEADLINE, /p2p/batch and /p2p/spread
+# deadlines); the load itself carries on and fills the cache.
 async def _fetch_with_retry(
     exchange: str, fiat: str, crypto: str, side: str,
-    max_retries: int = 2,
+    max_retries: int = 2, pages: Optional[int] = None,
 ) -> list:
-    module = EXCHANGES.get(exchange.lower(), bybit_p2p)
+    module  = EXCHANGES[exchange]
+    breaker = breakers.get(exchange)
     for attempt in range(max_retries):
+        probe = breaker.allow()
+        if probe is None:
+            logger.warning("[%s] circuit open — skipping %s/%s %s", exchange, fiat, crypto, side)
+            return []
         try:
-            await _rate_wait(exchange)
-            return await asyncio.wait_for(
-                module.fetch_p2p_offers(fiat, crypto, side),
-                timeout=9.0
-            )
+            # Rate limiting happens inside the collectors (app.ratelimit),
+            # charged per upstream request
+            return await module.fetch_p2p_offers(fiat, crypto, side, pages=pages or module.MAX_PAGES)
         except Exception as exc:
             wait = 2 ** attempt          # 1 s → 2 s → 4 s
             logger.warning(
@@ -76,92 +118,144 @@ async def _fetch_with_retry(
             )
             if attempt < max_retries - 1:
                 await asyncio.sleep(wait)
+        finally:
+            # A half-open probe that was cancelled (or failed before reaching
+            # the upstream) must not keep the probe slot
+            if probe:
+                breaker.release()
     logger.error("[%s] all %d retries failed for %s/%s %s", exchange, max_retries, fiat, crypto, side)
     return []
 
 
+# ─── Cache loaders ───────────────────────────────────────────────────────────
+# Every upstream load runs through `flight` keyed by the cache key, so N
+# concurrent misses (or N stale hits) for one pair cost a single fetch.
+# `tiered.load` first takes a fresher copy written by another worker (Redis),
+# and only one worker across the deployment fetches a given key at a time.
+# Offers are cached as columnar OfferBatch objects (app.offers).
+async def _fetch_batch(exchange: str, fiat: str, crypto: str, side: str,
+                       pages: Optional[int] = None) -> OfferBatch:
+    return OfferBatch(await _fetch_with_retry(exchange, fiat, crypto, side, pages=pages))
+
+
+# Offer books requested by users stay fresh for OFFERS_TTL. Keys kept warm
+# only for the spread (scheduler background pins) are refreshed one page
+# deep on the longer BACKGROUND_TTL — the spread needs just the best offers.
+OFFERS_TTL     = 25
+BACKGROUND_TTL = 45
+
+
+async def _load_offers(cache_key: str, exchange: str, fiat: str, crypto: str, side: str,
+                       pages: Optional[int] = None) -> OfferBatch:
+    # An empty result never replaces usable (stale) data, but is cached on a
+    # cold miss so a dead upstream isn't hammered by every request.
+    ttl = BACKGROUND_TTL if scheduler.is_background(cache_key) else OFFERS_TTL
+    return await tiered.load(
+        cache_key, lambda: _fetch_batch(exchange, fiat, crypto, side, pages),
+        ttl=ttl, keep_empty=False,
+    )
+
+
+def _load_now(cache_key: str, exchange: str, fiat: str, crypto: str, side: str) -> asyncio.Task:
+    """
+    Load for a miss a client is waiting on. Slow upstream requests may be
+    hedged (app.clients); the flag is set inside the load's own task, so it
+    never leaks into background refreshes spawned later by the same handler.
+    """
+    async def load() -> OfferBatch:
+        hedging.set(True)
+        return await flight.do(cache_key, lambda: _load_offers(cache_key, exchange, fiat, crypto, side))
+    return asyncio.ensure_future(load())
+
+
+# How long a client waits for a cold key before getting 503 + Retry-After;
+# the load keeps going, so a retry a moment later is a cache hit
+COLD_DEADLINE = 9.0
+COLD_RETRY_AFTER = 3
+
+
+class StillLoading(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="offers are still loading, retry shortly",
+                         headers={"Retry-After": str(COLD_RETRY_AFTER)})
+
+
+async def _load_within(cache_key: str, exchange: str, fiat: str, crypto: str, side: str,
+                       deadline: float = COLD_DEADLINE) -> OfferBatch:
+    """`_load_now` bounded by `deadline`; raises StillLoading when it takes longer."""
+    try:
+        # shield: the load outlives this caller's deadline
+        return await asyncio.wait_for(asyncio.shield(_load_now(cache_key, exchange, fiat, crypto, side)),
+                                      deadline)
+    except asyncio.TimeoutError:
+        raise StillLoading() from None
+
+
 # ─── Background stale-cache refresh ─────────────────────────────────────────
-async def _bg_refresh(cache_key: str, exchange: str, fiat: str, crypto: str, side: str):
+async def _bg_refresh(cache_key: str, exchange: str, fiat: str, crypto: str, side: str,
+                      pages: Optional[int] = None):
     try:
         logger.info("[bg] refreshing %s", cache_key)
-        fresh = await _fetch_with_retry(exchange, fiat, crypto, side)
+        fresh = await _load_offers(cache_key, exchange, fiat, crypto, side, pages=pages)
         if fresh:
-            cache.set(cache_key, fresh, ttl=25)
             logger.info("[bg] %s refreshed (%d offers)", cache_key, len(fresh))
+        return fresh
     except Exception as exc:
         logger.error("[bg] refresh failed %s: %s", cache_key, exc)
+        return []
 
 
-# ─── Safety scoring (Bybit-specific) ────────────────────────────────────────
-#
-# On Bybit P2P, offers with dirty money or scam intent share common signals:
-#   • Very few trades (new / throwaway accounts)
-#   • Low completion rate (abandon trades after receiving fiat)
-#   • Price that deviates suspiciously far from the median (too-good-to-be-true bait)
-#   • Abnormally low minimum amount (luring small, cautious buyers)
-#
-# Binance pre-filters advertisers via its own KYC/compliance layer, so we
-# assign a flat baseline score there instead of applying Bybit heuristics.
-
-SAFE_THRESHOLD = 65          # minimum score to be used in safe spread
-
-
-def compute_safety_score(offer: dict, median_price: float) -> int:
-    """Return integer 0–100. Higher = safer."""
-    # Binance is platform-filtered — trust their KYC baseline
-    if offer.get("exchange", "").lower() == "binance":
-        return 85
+# ─── Proactive refresh of hot keys ───────────────────────────────────────────
+# The scheduler may use half of each exchange's request budget; the rest is
+# left for cold misses and the spread scan. The budget is in upstream
+# requests: a refresh of a requested key is charged its worst case of
+# MAX_PAGES, a background (spread-only) key a single page.
+SCHEDULER_BUDGET_SHARE = 0.5
 
-    score = 100
-    tc = offer.get("trade_count", 0)
-    cr = offer.get("completion_rate", 0)
 
-    # ── Trade count ──────────────────────────────────────────────────────
-    if   tc < 5:    score -= 45   # throwaway / brand-new account
-    elif tc < 20:   score -= 30
-    elif tc < 50:   score -= 15
-    elif tc < 100:  score -= 7
+def _refresh_pages(cache_key: str) -> int:
+    if scheduler.is_background(cache_key):
+        return 1
+    return EXCHANGES[cache_key.split(":")[1]].MAX_PAGES
 
-    # ── Completion rate ──────────────────────────────────────────────────
-    if   cr < 80:   score -= 30   # abandons >20 % of deals
-    elif cr < 90:   score -= 15
-    elif cr < 95:   score -= 7
 
-    # ── Price outlier ────────────────────────────────────────────────────
-    # A suspiciously better price is a classic scam lure
-    if median_price > 0 and offer.get("price", 0) > 0:
-        dev = abs(offer["price"] - median_price) / median_price * 100
-        if   dev > 8:   score -= 30
-        elif dev > 5:   score -= 15
-        elif dev > 3:   score -= 5
+def _schedule_refresh(cache_key: str):
+    _, exchange, fiat, crypto, side = cache_key.split(":")
+    pages = _refresh_pages(cache_key)
+    return flight.spawn(cache_key, lambda: _bg_refresh(cache_key, exchange, fiat, crypto, side, pages))
 
-    # ── Suspiciously low minimum amount ─────────────────────────────────
-    if offer.get("min_amount", 0) < 5:
-        score -= 10
 
-    return max(0, min(100, score))
+def _check_refresh_budget():
+    """Warn at startup when the background pins alone don't fit the scheduler budget."""
+    for ex, budget in scheduler.budget.items():
+        keys = len(scheduler.background_keys(ex))
+        demand = keys / (BACKGROUND_TTL - scheduler.lead)     # one page each per fresh window
+        if demand > budget:
+            logger.warning(
+                "[scheduler] %s: %d background keys need %.2f req/s, budget is %.2f — "
+                "they will be served stale", ex, keys, demand, budget,
+            )
+        else:
+            logger.info("[scheduler] %s: %d background keys use %.2f of %.2f req/s",
+                        ex, keys, demand, budget)
 
 
-def _safety_tier(score: int) -> str:
-    if score >= 80: return "safe"
-    if score >= 60: return "caution"
-    return "risky"
+scheduler = RefreshScheduler(
+    _schedule_refresh,
+    budget={ex: SCHEDULER_BUDGET_SHARE * limiter.bucket(ex).rate for ex in EXCHANGES},
+    cost=_refresh_pages,
+)
 
 
-def enrich_safety(offers: list) -> list:
-    """Mutates each offer dict in-place; returns same list."""
-    if not offers:
-        return offers
-    prices = sorted(o["price"] for o in offers if o.get("price", 0) > 0)
-    median = prices[len(prices) // 2] if prices else 0
-    for o in offers:
-        sc = compute_safety_score(o, median)
-        o["safety_score"] = sc
-        o["safety_tier"]  = _safety_tier(sc)
-    return offers
+# ─── Helpers ─────────────────────────────────────────────────────────────────
+def normalize_exchange(exchange: str) -> str:
+    """Lower-cased `exchange`, 400 unless it is one we collect — it ends up in cache keys."""
+    name = exchange.lower()
+    if name not in EXCHANGES:
+        raise HTTPException(status_code=400, detail=f"exchange must be one of {list(EXCHANGES)}")
+    return name
 
 
-# ─── Helpers ─────────────────────────────────────────────────────────────────
 def normalize_pair(fiat: str, crypto: str, side: str):
     fiat_is_crypto = fiat   in CRYPTO_SET
     crypto_is_fiat = crypto in FIAT_SET
@@ -172,18 +266,33 @@ def normalize_pair(fiat: str, crypto: str, side: str):
     return fiat, crypto, side
 
 
-def compute_rating(completion_rate: float, trade_count: int) -> float:
-    """Composite score 0–10: completion_rate×0.7 + log(trades+1)×0.3"""
-    cr  = min(max(completion_rate, 0), 100) / 100
-    tc  = math.log(max(trade_count, 0) + 1)
-    raw = cr * 0.7 + tc * 0.3
-    return round(min(raw / 0.287, 10), 2)
-
-
 # ─── Routes ──────────────────────────────────────────────────────────────────
 @app.get("/health")
 async def health():
-    return {"status": "ok", "supported_fiats": SUPPORTED_FIATS}
+    return {
+        "status":          "ok",
+        "supported_fiats": SUPPORTED_FIATS,
+        "http_pools":      clients.stats(),
+        "scheduler":       scheduler.stats(),
+        "rate_limits":     limiter.stats(),
+        "upstreams":       breakers.stats(),
+        "snapshots":       snapshots.stats(),
+        "history":         history.stats(),
+        "market_stream":   stream.stats(),
+        "tickers":         tickers.stats(),
+        "live_feed":       feed.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition (app.metrics)."""
+    return Response(registry.expose(), media_type=CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return cache.stats()
 
 
 @app.get("/p2p")
@@ -196,255 +305,589 @@ async def p2p(
     min_rate:  float = 0,
     payment:   str   = "",
     amount:    float = 0,
+    limit:     int   = Query(0, ge=0, le=500),     # 0 = everything
+    offset:    int   = Query(0, ge=0),
+    cursor:    str   = "",                         # next_cursor from a previous page
+    fields:    str   = "",                         # e.g. "price,advertiser,url"
+    fmt:       str   = Query("full", alias="format"),  # "full" | "compact" (array-of-arrays)
+    if_none_match:   Optional[str] = Header(None),
+    accept_encoding: str           = Header(""),
 ):
+    exchange = normalize_exchange(exchange)
     real_fiat, real_crypto, real_side = normalize_pair(fiat, crypto, side)
     if real_fiat is None:
         return {"offers": [], "exchange": exchange,
                 "error": "crypto-to-crypto not supported",
-                "server_time": int(time.time()), "ttl": 25}
+                "server_time": int(time.time()), "ttl": OFFERS_TTL}
 
     cache_key = f"p2p:{exchange}:{real_fiat}:{real_crypto}:{real_side}"
+    scheduler.touch(cache_key)
     offers    = cache.get(cache_key)
     is_stale  = cache.is_stale(cache_key)
 
     if offers is None:
-        # Nothing in cache — fetch synchronously (first request or expired)
-        offers = await _fetch_with_retry(exchange, real_fiat, real_crypto, real_side)
-        cache.set(cache_key, offers, ttl=25)
+        # Nothing in cache — fetch synchronously (first request or expired);
+        # concurrent misses for the same key await the same fetch. The caller
+        # is waiting, so slow upstream requests may be hedged, and the wait
+        # is bounded by COLD_DEADLINE.
+        offers = await _load_within(cache_key, exchange, real_fiat, real_crypto, real_side)
         is_stale = False
     elif is_stale:
-        # Serve stale data immediately; refresh in background
-        asyncio.create_task(_bg_refresh(cache_key, exchange, real_fiat, real_crypto, real_side))
-
-    # Work on a shallow copy so we don't mutate cached dicts
-    offers = [dict(o) for o in offers]
-    enrich_safety(offers)
-
-    for o in offers:
-        o["rating_score"] = compute_rating(
-            o.get("completion_rate", 0),
-            o.get("trade_count", 0),
-        )
-
-    # ── Filters ──────────────────────────────────────────────────────────
-    if min_rate > 0:
-        offers = [o for o in offers if o["completion_rate"] >= min_rate]
-
-    if payment:
-        offers = [
-            o for o in offers
-            if any(payment.lower() in pm.lower()
-                   for pm in o.get("payment_methods", []))
-        ]
-
-    if amount > 0:
-        offers = [
-            o for o in offers
-            if o.get("min_amount", 0) <= amount <= o.get("max_amount", float("inf"))
-        ]
-
-    # ── Sort ─────────────────────────────────────────────────────────────
-    if sort == "volume":
-        offers.sort(key=lambda x: x["max_amount"], reverse=True)
-    elif sort == "rate":
-        offers.sort(key=lambda x: x["completion_rate"], reverse=True)
-    elif sort == "score":
-        offers.sort(key=lambda x: x["rating_score"], reverse=True)
-    elif sort == "safety":
-        offers.sort(key=lambda x: x.get("safety_score", 0), reverse=True)
-    else:
-        offers.sort(key=lambda x: x["price"], reverse=(real_side == "SELL"))
+        # Serve stale data immediately; at most one background refresh per key
+        flight.spawn(cache_key, lambda: _bg_refresh(
+            cache_key, exchange, real_fiat, real_crypto, real_side))
+
+    # Snapshot version = write time of the cache entry; identical on every
+    # worker that adopted it from the shared tier
+    version = int((cache.set_at(cache_key) or 0) * 1000)
+    snapshot_changed = False
+    if cursor:
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        cursor_version, offset = decoded
+        snapshot_changed = cursor_version != version
+
+    compact = fmt == "compact"
+    field_list = parse_fields(fields)
+    params = (real_side, sort, min_rate, payment.lower(), amount, limit, offset, fields, compact)
+    etag = f'W/"{version:x}-{zlib.crc32(repr(params).encode()):08x}"'
+    if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # The cached snapshot is already scored and sorted — this only selects
+    # rows (shared, read-only dicts) via precomputed permutations and indexes
+    idx   = offers.select(real_side, sort=sort, min_rate=min_rate, payment=payment, amount=amount)
+    total = len(idx)
+    end   = offset + limit if limit else total
+    rows, columns = project([offers.rows[i] for i in idx[offset:end].tolist()], field_list, compact)
 
-    return {
-        "offers":      offers,
+    result = {
+        "offers":      rows,
         "exchange":    exchange,
         "is_stale":    is_stale,
         "server_time": int(time.time()),
-        "ttl":         25,
+        "ttl":         OFFERS_TTL,
+        "total":       total,
+        "next_cursor": encode_cursor(version, end) if end < total else None,
     }
+    if compact:
+        result["columns"] = columns
+    if cursor:
+        result["snapshot_changed"] = snapshot_changed
+    return json_response(result, accept_encoding, headers={"ETag": etag})
+
+
+# ─── Batch query ─────────────────────────────────────────────────────────────
+class P2PQuery(BaseModel):
+    exchange: str   = "bybit"
+    fiat:     str   = "PLN"
+    crypto:   str   = "USDT"
+    side:     str   = "BUY"
+    sort:     str   = "price"
+    min_rate: float = 0
+    payment:  str   = ""
+    amount:   float = 0
+    limit:    int   = Field(0, ge=0, le=500)
+    fields:   str   = ""
+    deadline: Optional[float] = Field(None, gt=0, le=12.0)   # overrides the batch deadline
+
+
+class P2PBatch(BaseModel):
+    queries:  list[P2PQuery] = Field(..., max_length=50)
+    deadline: float          = Field(5.0, gt=0, le=12.0)   # seconds to wait for cold keys
+
+
+@app.post("/p2p/batch")
+async def p2p_batch(body: P2PBatch, accept_encoding: str = Header("")):
+    """
+    Several /p2p queries in one round trip. Queries sharing an upstream key
+    share one lookup; cache hits (fresh or stale) are answered at once and
+    all misses load concurrently. Every query waits for its key up to its
+    own `deadline` (default: the batch's) — one slow key doesn't hold back
+    the others' budget. Queries whose key is still loading by then are
+    reported as `pending`; the load keeps going in the background.
+    """
+    keys: dict[str, tuple] = {}
+    waits: dict[str, float] = {}               # key → longest deadline among its queries
+    plan = []                                  # per query: (cache_key, side) or an error
+    for q in body.queries:
+        exchange = q.exchange.lower()
+        if exchange not in EXCHANGES:
+            plan.append(f"exchange must be one of {list(EXCHANGES)}")
+            continue
+        real_fiat, real_crypto, real_side = normalize_pair(q.fiat, q.crypto, q.side)
+        if real_fiat is None:
+            plan.append("crypto-to-crypto not supported")
+            continue
+        cache_key = f"p2p:{exchange}:{real_fiat}:{real_crypto}:{real_side}"
+        keys[cache_key] = (exchange, real_fiat, real_crypto, real_side)
+        waits[cache_key] = max(waits.get(cache_key, 0.0), q.deadline or body.deadline)
+        plan.append((cache_key, real_side))
+
+    loaded: dict[str, tuple[Optional[OfferBatch], str]] = {}
+    loads: dict[asyncio.Future, str] = {}
+    for cache_key, (exchange, fiat, crypto, side) in keys.items():
+        scheduler.touch(cache_key)
+        offers = cache.get(cache_key)
+        if offers is None:
+            loads[_load_now(cache_key, exchange, fiat, crypto, side)] = cache_key
+        elif cache.is_stale(cache_key):
+            loaded[cache_key] = (offers, "stale")
+            flight.spawn(cache_key, lambda k=cache_key, e=exchange, f=fiat, c=crypto, s=side:
+                         _bg_refresh(k, e, f, c, s))
+        else:
+            loaded[cache_key] = (offers, "ok")
+
+    started = time.monotonic()
+    arrived: dict[str, float] = {}             # key → seconds until its load finished
+
+    async def settle(fut: asyncio.Future, cache_key: str):
+        try:
+            # shield: a load that outlives the deadline keeps filling the cache
+            offers = await asyncio.wait_for(asyncio.shield(fut), waits[cache_key])
+            loaded[cache_key] = (offers, "ok")
+            arrived[cache_key] = time.monotonic() - started
+        except asyncio.TimeoutError:
+            loaded[cache_key] = (None, "pending")
+        except Exception as exc:
+            logger.error("[batch] %s failed: %s", cache_key, exc)
+            loaded[cache_key] = (None, "error")
 
+    if loads:
+        await asyncio.gather(*(settle(fut, cache_key) for fut, cache_key in loads.items()))
+
+    results = []
+    for q, item in zip(body.queries, plan):
+        if isinstance(item, str):
+            results.append({"exchange": q.exchange, "fiat": q.fiat, "crypto": q.crypto, "side": q.side,
+                            "offers": [], "total": 0, "status": "error", "error": item})
+            continue
+        cache_key, real_side = item
+        offers, status = loaded[cache_key]
+        if arrived.get(cache_key, 0.0) > (q.deadline or body.deadline):
+            offers, status = None, "pending"       # loaded, but after this query's deadline
+        rows, total = [], 0
+        if offers is not None:
+            idx   = offers.select(real_side, sort=q.sort, min_rate=q.min_rate, payment=q.payment, amount=q.amount)
+            total = len(idx)
+            rows, _ = project([offers.rows[i] for i in idx[: q.limit or total].tolist()],
+                              parse_fields(q.fields), False)
+        results.append({"exchange": q.exchange, "fiat": q.fiat, "crypto": q.crypto, "side": q.side,
+                        "offers": rows, "total": total, "status": status,
+                        "is_stale": status == "stale"})
+
+    return json_response({"results": results, "server_time": int(time.time()), "ttl": OFFERS_TTL}, accept_encoding)
+
+
+# ─── Aggregated order book ───────────────────────────────────────────────────
+async def _offers_for(exchange: str, fiat: str, crypto: str, side: str,
+                      deadline: float) -> tuple[Optional[OfferBatch], str]:
+    """
+    Cached snapshot for one key, loading it on a miss for up to `deadline`
+    → (offers, "ok" | "stale"), or (None, "missing") when it isn't there in
+    time (the load carries on in the background).
+    """
+    cache_key = f"p2p:{exchange}:{fiat}:{crypto}:{side}"
+    scheduler.touch(cache_key)
+    offers = cache.get(cache_key)
+    if offers is None:
+        try:
+            return await _load_within(cache_key, exchange, fiat, crypto, side, deadline), "ok"
+        except StillLoading:
+            return None, "missing"
+        except Exception as exc:
+            logger.error("[book] %s failed: %s", cache_key, exc)
+            return None, "missing"
+    if cache.is_stale(cache_key):
+        flight.spawn(cache_key, lambda: _bg_refresh(cache_key, exchange, fiat, crypto, side))
+        return offers, "stale"
+    return offers, "ok"
+
+
+@app.get("/p2p/book")
+async def p2p_book(
+    fiat:    str   = "PLN",
+    crypto:  str   = "USDT",
+    side:    str   = "BUY",
+    amount:  float = 0,                            # fiat amount to price a fill for
+    limit:   int   = Query(50, ge=0, le=500),      # offers returned; 0 = levels only
+    deadline: float = Query(5.0, gt=0, le=12.0),   # seconds to wait for each cold exchange
+    accept_encoding: str = Header(""),
+):
+    """
+    All exchanges' offers for a pair merged into one book, with depth and
+    VWAP. Each exchange is loaded independently; one that is slow or
+    throttled is left out after `deadline` (`missing`) instead of holding
+    back the whole book.
+    """
+    real_fiat, real_crypto, real_side = normalize_pair(fiat, crypto, side)
+    if real_fiat is None:
+        raise HTTPException(status_code=400, detail="crypto-to-crypto not supported")
+
+    books = await asyncio.gather(*[
+        _offers_for(ex, real_fiat, real_crypto, real_side, deadline) for ex in EXCHANGES
+    ])
+    rows = merge_offers([offers for offers, _ in books if offers is not None], real_side)
+    levels = depth_levels(rows)
+    return json_response({
+        "fiat":         real_fiat,
+        "crypto":       real_crypto,
+        "side":         real_side,
+        "exchanges":    {ex: {"offers": len(offers) if offers is not None else 0,
+                              "is_stale": status == "stale", "missing": status == "missing"}
+                         for ex, (offers, status) in zip(EXCHANGES, books)},
+        "offers":       rows[:limit],
+        "levels":       levels,
+        "total_volume": levels[-1]["cumulative"] if levels else 0,
+        "fill":         fill(rows, amount),
+        "server_time":  int(time.time()),
+        "ttl":          OFFERS_TTL,
+    }, accept_encoding)
+
+
+# ─── Price history ───────────────────────────────────────────────────────────
+# Every p2p:* refresh is recorded by app.history (best / median / top-of-book
+# VWAP / safe-offer count), kept raw for hours and as 1m / 1h means for longer.
+# It is per worker and saved to HISTORY_PATH (if set) for restarts.
+cache.add_listener("p2p:", history.on_cache_write)
+
+
+@app.get("/p2p/history")
+async def p2p_history(
+    fiat:       str   = "PLN",
+    crypto:     str   = "USDT",
+    side:       str   = "BUY",
+    exchange:   str   = "bybit",
+    start:      float = Query(None, alias="from"),     # unix seconds; default: to − 24h
+    end:        float = Query(None, alias="to"),       # unix seconds; default: now
+    resolution: str   = "auto",                        # raw | 1m | 1h | auto
+    accept_encoding: str = Header(""),
+):
+    if resolution != "auto" and resolution not in TIERS:
+        raise HTTPException(status_code=400, detail=f"resolution must be auto or one of {list(TIERS)}")
+    exchange = normalize_exchange(exchange)
+    real_fiat, real_crypto, real_side = normalize_pair(fiat, crypto, side)
+    if real_fiat is None:
+        raise HTTPException(status_code=400, detail="crypto-to-crypto not supported")
+    end   = end if end is not None else time.time()
+    start = start if start is not None else end - 86400
+    cache_key = f"p2p:{exchange}:{real_fiat}:{real_crypto}:{real_side}"
+    result = history.query(cache_key, start, end, resolution)
+    result.update({"exchange": exchange, "fiat": real_fiat, "crypto": real_crypto, "side": real_side,
+                   "from": start, "to": end})
+    return json_response(result, accept_encoding)
+
+
+# ─── Live offer feed ─────────────────────────────────────────────────────────
+# Instead of polling /p2p, clients subscribe to (exchange, pair, side, filters)
+# and get one snapshot followed by diffs keyed by ad id (app.feed). Subscribed
+# keys are pinned in the scheduler, and every refresh that lands in the cache
+# is pushed to all subscribers at once.
+cache.add_listener("p2p:", feed.on_cache_write)
+
+
+async def _prepare_feed(
+    exchange: str, fiat: str, crypto: str, side: str,
+) -> tuple[str, OfferBatch]:
+    """Validate a feed request and make sure its offers are loaded → (cache key, offers)."""
+    exchange = normalize_exchange(exchange)
+    real_fiat, real_crypto, real_side = normalize_pair(fiat, crypto, side)
+    if real_fiat is None:
+        raise HTTPException(status_code=400, detail="crypto-to-crypto not supported")
+    cache_key = f"p2p:{exchange}:{real_fiat}:{real_crypto}:{real_side}"
+    offers = cache.get(cache_key)
+    if offers is None:
+        offers = await _load_within(cache_key, exchange, real_fiat, real_crypto, real_side)
+    return cache_key, offers
+
+
+def _open_feed(
+    cache_key: str, offers: OfferBatch,
+    sort: str, min_rate: float, payment: str, amount: float,
+) -> Subscription:
+    """Pin the key and subscribe; every call must be paired with _close_feed."""
+    scheduler.pin(cache_key)
+    filters = {"sort": sort, "min_rate": min_rate, "payment": payment.lower(), "amount": amount}
+    version = int((cache.set_at(cache_key) or 0) * 1000)
+    current = cache.get(cache_key)                   # may have refreshed since _prepare_feed
+    return feed.subscribe(cache_key, filters, offers if current is None else current, version)
+
+
+def _close_feed(cache_key: str, sub: Subscription):
+    feed.unsubscribe(sub)
+    scheduler.unpin(cache_key)
+
+
+@app.websocket("/p2p/live")
+async def p2p_live(
+    ws:       WebSocket,
+    fiat:     str   = "PLN",
+    crypto:   str   = "USDT",
+    side:     str   = "BUY",
+    exchange: str   = "bybit",
+    sort:     str   = "price",
+    min_rate: float = 0,
+    payment:  str   = "",
+    amount:   float = 0,
+):
+    await ws.accept()
+    try:
+        cache_key, offers = await _prepare_feed(exchange, fiat, crypto, side)
+    except HTTPException as exc:
+        # 1013 = try again later
+        await ws.close(code=1013 if exc.status_code == 503 else 1008, reason=exc.detail)
+        return
+    sub = _open_feed(cache_key, offers, sort, min_rate, payment, amount)
+
+    async def drain_incoming():
+        # Only needed to notice the client going away
+        while True:
+            await ws.receive_text()
+
+    reader = asyncio.create_task(drain_incoming())
+    try:
+        while True:
+            getter = asyncio.ensure_future(sub.next())
+            await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break                                # client disconnected
+            message = getter.result()
+            if message is None:
+                await ws.close(code=1013, reason="too slow, reconnect")
+                break
+            await ws.send_text(message[1])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        # Retrieve its outcome (usually the disconnect) so it isn't logged
+        # as "Task exception was never retrieved"
+        with suppress(asyncio.CancelledError, WebSocketDisconnect):
+            await reader
+        _close_feed(cache_key, sub)
+
+
+@app.get("/p2p/live/stream")
+async def p2p_live_stream(
+    fiat:     str   = "PLN",
+    crypto:   str   = "USDT",
+    side:     str   = "BUY",
+    exchange: str   = "bybit",
+    sort:     str   = "price",
+    min_rate: float = 0,
+    payment:  str   = "",
+    amount:   float = 0,
+):
+    """Same feed as /p2p/live, as Server-Sent Events (`snapshot` / `diff`)."""
+    # Errors still become a plain 400/503 here, but the pin and subscription
+    # are taken inside the generator: a client that disconnects before the
+    # body starts never runs it, and would otherwise leak both.
+    cache_key, offers = await _prepare_feed(exchange, fiat, crypto, side)
+
+    async def events():
+        sub = _open_feed(cache_key, offers, sort, min_rate, payment, amount)
+        try:
+            while True:
+                message = await sub.next()
+                if message is None:
+                    yield b"event: dropped\ndata: {}\n\n"
+                    break
+                kind, body = message
+                yield b"event: " + kind.encode() + b"\ndata: " + body.encode() + b"\n\n"
+        finally:
+            _close_feed(cache_key, sub)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Market responses are the same for every caller until the entry changes,
+# so the whole response body is cached pre-encoded (app.payload.Payload).
+# While the Binance stream is connected the data behind them is pushed and
+# rebuilding is cheap, so they are cached only briefly.
+MARKET_TTL      = 60
+MARKET_LIVE_TTL = 2
+
+
+def _market_ttl() -> int:
+    return MARKET_LIVE_TTL if market_live() else MARKET_TTL
 
 @app.get("/market/chart")
-async def chart(symbol: str = "BTCUSDT", interval: str = "1d"):
-    cache_key = f"chart:{symbol}:{interval}"
-    data = cache.get(cache_key)
-    if data is None:
-        data = await fetch_chart(symbol, interval)
-        cache.set(cache_key, data, ttl=60)
-    return {"data": data, "symbol": symbol}
+async def chart(
+    symbol:     str = "BTCUSDT",
+    interval:   str = "1d",
+    limit:      int = Query(90, ge=1, le=500),
+    indicators: str = DEFAULT_INDICATORS,          # e.g. "ma7,ema21,rsi14,bb20,vwap20"
+    accept_encoding: str = Header(""),
+):
+    try:
+        names = parse_indicators(indicators)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return json_response(await _chart_payload(symbol, interval, limit, names), accept_encoding)
+
+
+@app.get("/market/charts")
+async def charts(
+    symbols:    str = "BTCUSDT,ETHUSDT",
+    interval:   str = "1d",
+    limit:      int = Query(90, ge=1, le=500),
+    indicators: str = DEFAULT_INDICATORS,
+    accept_encoding: str = Header(""),
+):
+    """Several symbols' charts in one response, loaded concurrently."""
+    try:
+        names = parse_indicators(indicators)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    wanted = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))[:20]
+    payloads = await asyncio.gather(*[_chart_payload(sym, interval, limit, names) for sym in wanted])
+    return json_response({"charts": {sym: p.obj["data"] for sym, p in zip(wanted, payloads)},
+                          "interval": interval}, accept_encoding)
+
+
+async def _chart_payload(symbol: str, interval: str, limit: int, names: list[str]) -> Payload:
+    cache_key = f"chart:{symbol}:{interval}:{limit}:{','.join(names)}"
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = await flight.do(cache_key, lambda: _load_chart(cache_key, symbol, interval, limit, names))
+    return payload
+
+
+async def _load_chart(cache_key: str, symbol: str, interval: str, limit: int, names: list[str]) -> Payload:
+    async def fetch():
+        return Payload({"data": await fetch_chart(symbol, interval, limit, names), "symbol": symbol})
+
+    return await tiered.load(cache_key, fetch, ttl=_market_ttl())
 
 
 @app.get("/market/trending")
-async def trending():
-    data = cache.get("trending")
-    if data is None:
-        data = await fetch_trending()
-        cache.set("trending", data, ttl=60)
-    return {"data": data}
+async def trending(
+    limit:      int   = Query(20, ge=1, le=200),
+    quote:      str   = "USDT",
+    min_volume: float = Query(1_000_000, ge=0),    # 24 h volume in the quote asset
+    sort_by:    str   = "change",                  # change | volume | range
+    accept_encoding: str = Header(""),
+):
+    if sort_by not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {list(SORT_KEYS)}")
+    quote = quote.upper()
+    cache_key = f"trending:{quote}:{sort_by}:{min_volume:g}:{limit}"
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = await flight.do(cache_key, lambda: _load_trending(cache_key, limit, quote, min_volume, sort_by))
+    return json_response(payload, accept_encoding)
+
+
+async def _load_trending(cache_key: str, limit: int, quote: str, min_volume: float, sort_by: str) -> Payload:
+    async def fetch():
+        return Payload({"data": await fetch_trending(limit, quote, min_volume, sort_by)})
+
+    return await tiered.load(cache_key, fetch, ttl=_market_ttl())
 
 
 # ─── Spread ───────────────────────────────────────────────────────────────────
-# Priority pairs for spread scan — only these are fetched on cache miss.
-# Everything else is read from cache if already populated by /p2p endpoint.
+# Best buy / sell per pair is maintained incrementally by app.spread from
+# every p2p:* cache write, so the endpoint never fans out to the exchanges.
+# Priority pairs are pinned in the scheduler (background, one page deep) so
+# they are always populated; everything else shows up once /p2p traffic has
+# cached it.
 SPREAD_PRIORITY_PAIRS = [
     ("PLN",  "USDT"), ("EUR",  "USDT"), ("USD",  "USDT"),
     ("GBP",  "USDT"), ("NGN",  "USDT"), ("PLN",  "BTC"),
     ("EUR",  "BTC"),  ("USD",  "BTC"),
 ]
 
+SPREAD_KEYS = [
+    f"p2p:{ex}:{fiat}:{crypto}:{side}"
+    for fiat, crypto in SPREAD_PRIORITY_PAIRS for ex in EXCHANGES for side in ("BUY", "SELL")
+]
 
-async def _fetch_and_cache(exchange: str, fiat: str, crypto: str, side: str) -> list:
-    cache_key = f"p2p:{exchange}:{fiat}:{crypto}:{side}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-    try:
-        # No rate_wait here for spread — we use a semaphore at caller level
-        module = EXCHANGES.get(exchange.lower(), bybit_p2p)
-        fresh = await module.fetch_p2p_offers(fiat, crypto, side)
-        cache.set(cache_key, fresh, ttl=25)
-        return fresh
-    except Exception:
-        return []
-
-
-# Semaphore: at most 4 concurrent live fetches during spread scan
-_spread_sem = asyncio.Semaphore(4)
+cache.add_listener("p2p:", spread_index.on_cache_write)
+for _key in SPREAD_KEYS:
+    scheduler.pin(_key, background=True)
 
-async def _spread_fetch(exchange: str, fiat: str, crypto: str, side: str) -> list:
-    """Cache-first; only hits network for priority pairs, with semaphore."""
-    cache_key = f"p2p:{exchange}:{fiat}:{crypto}:{side}"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-    # Only fetch live if this is a priority pair
-    if (fiat, crypto) not in SPREAD_PRIORITY_PAIRS:
-        return []
-    async with _spread_sem:
-        try:
-            return await asyncio.wait_for(
-                _fetch_and_cache(exchange, fiat, crypto, side),
-                timeout=8.0
-            )
-        except Exception:
-            return []
 
+# After a cold start (or a long upstream outage) priority keys may be missing.
+# Both endpoints then load them concurrently, bounded by SPREAD_DEADLINE:
+# every load that finishes in time lands in the index, whatever is still
+# running keeps going in the background and is picked up by the next call.
+SPREAD_DEADLINE = 12.0
 
-@app.get("/p2p/spread")
-async def best_spread():
-    # Return cached result immediately if fresh
-    cached_result = cache.get("spread_result")
-    if cached_result and not cache.is_stale("spread_result"):
-        return cached_result
-
-    # Build task list — all known pairs, cache-first
-    tasks, keys = [], []
-    for fiat in SUPPORTED_FIATS:
-        for crypto in SUPPORTED_CRYPTOS:
-            for ex in EXCHANGES:
-                for side in ("BUY", "SELL"):
-                    tasks.append(_spread_fetch(ex, fiat, crypto, side))
-                    keys.append((ex, fiat, crypto, side))
-
-    # Hard cap: entire spread scan must finish within 12 s
-    try:
-        results = await asyncio.wait_for(
-            asyncio.gather(*tasks, return_exceptions=True),
-            timeout=12.0
-        )
-    except asyncio.TimeoutError:
-        logger.warning("spread scan timed out — returning partial results")
-        results = [[] for _ in keys]
 
-    # Aggregate raw offers per (fiat, crypto, side) across exchanges
-    pair_offers: dict[tuple, dict[str, list]] = {}
-    for (ex, fiat, crypto, side), result in zip(keys, results):
-        if not isinstance(result, list) or not result:
-            continue
-        key = (fiat, crypto)
-        if key not in pair_offers:
-            pair_offers[key] = {"BUY": [], "SELL": []}
-        pair_offers[key][side].extend(result)
-
-    pair_buy:  dict[tuple, dict] = {}
-    pair_sell: dict[tuple, dict] = {}
-
-    for key, sides in pair_offers.items():
-        # Enrich both sides with safety scores before filtering
-        buy_all  = enrich_safety([dict(o) for o in sides["BUY"]])
-        sell_all = enrich_safety([dict(o) for o in sides["SELL"]])
-
-        # Filter to safe offers; fall back to all if none qualify
-        safe_buys  = [o for o in buy_all  if o["safety_score"] >= SAFE_THRESHOLD] or buy_all
-        safe_sells = [o for o in sell_all if o["safety_score"] >= SAFE_THRESHOLD] or sell_all
-
-        if safe_buys:
-            best = min(safe_buys, key=lambda o: o["price"])
-            pair_buy[key] = {
-                "price":        best["price"],
-                "exchange":     best.get("exchange", ""),
-                "advertiser":   best.get("advertiser", ""),
-                "url":          best.get("url", ""),
-                "safety_score": best["safety_score"],
-                "safety_tier":  best["safety_tier"],
-            }
-
-        if safe_sells:
-            best = max(safe_sells, key=lambda o: o["price"])
-            pair_sell[key] = {
-                "price":        best["price"],
-                "exchange":     best.get("exchange", ""),
-                "advertiser":   best.get("advertiser", ""),
-                "url":          best.get("url", ""),
-                "safety_score": best["safety_score"],
-                "safety_tier":  best["safety_tier"],
-            }
-
-    spreads = []
-    for key in pair_buy:
-        if key not in pair_sell:
-            continue
-        fiat, crypto = key
-        buy  = pair_buy[key]
-        sell = pair_sell[key]
-        bp, sp = buy["price"], sell["price"]
-        if bp <= 0:
-            continue
-        pct = (sp - bp) / bp * 100
-        if not (-50 < pct < 10):
-            continue
+def _missing_spread_loads() -> dict[tuple, list[asyncio.Future]]:
+    """(fiat, crypto) → load futures for priority keys with nothing in cache."""
+    loads: dict[tuple, list[asyncio.Future]] = {}
+    for fiat, crypto in SPREAD_PRIORITY_PAIRS:
+        for ex in EXCHANGES:
+            for side in ("BUY", "SELL"):
+                key = f"p2p:{ex}:{fiat}:{crypto}:{side}"
+                if cache.peek(key) is None:
+                    # The spread only needs the best offers — page 1
+                    fut = asyncio.ensure_future(flight.do(key, lambda k=key, e=ex, f=fiat, c=crypto, s=side:
+                                                          _load_offers(k, e, f, c, s, pages=1)))
+                    loads.setdefault((fiat, crypto), []).append(fut)
+    return loads
 
-        spreads.append({
-            "fiat":              fiat,
-            "crypto":            crypto,
-            "buy_price":         round(bp, 6),
-            "sell_price":        round(sp, 6),
-            "spread_pct":        round(pct, 3),
-            "profitable":        pct > 0,
-            "buy_exchange":      buy["exchange"],
-            "sell_exchange":     sell["exchange"],
-            "buy_advertiser":    buy["advertiser"],
-            "sell_advertiser":   sell["advertiser"],
-            "buy_url":           buy["url"],
-            "sell_url":          sell["url"],
-            "buy_safety_score":  buy["safety_score"],
-            "sell_safety_score": sell["safety_score"],
-            "buy_safety_tier":   buy["safety_tier"],
-            "sell_safety_tier":  sell["safety_tier"],
-            # True when best buy and best sell are on different exchanges
-            "cross_exchange":    buy["exchange"].lower() != sell["exchange"].lower(),
-        })
-
-    spreads.sort(key=lambda x: x["spread_pct"], reverse=True)
-    profitable = [s for s in spreads if s["profitable"]]
 
-    result = {
-        "spread":     spreads[0] if spreads else None,
-        "all":        spreads,
-        "profitable": profitable,
-        "scanned":    len(spreads),
-    }
-    # Cache the full spread result for 30s so rapid refreshes hit cache
-    if spreads:
-        cache.set("spread_result", result, ttl=30)
-    return result
+@app.get("/p2p/spread")
+async def best_spread(accept_encoding: str = Header("")):
+    loads = _missing_spread_loads()
+    if loads:
+        # Partial results are kept: the index already holds every pair that
+        # resolved before the deadline
+        futures = [f for fs in loads.values() for f in fs]
+        done, pending = await asyncio.wait(futures, timeout=SPREAD_DEADLINE)
+        if pending:
+            logger.warning("[spread] %d/%d loads still running after %.0fs — serving partial result",
+                           len(pending), len(futures), SPREAD_DEADLINE)
+    return json_response(spread_index.payload(), accept_encoding)
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+@app.get("/p2p/spread/stream")
+async def spread_stream():
+    """
+    Server-Sent Events: every spread already known is sent at once, then one
+    `spread` event per missing priority pair as soon as both of its sides
+    have loaded. Ends with a `done` event carrying the full sorted result.
+    """
+    loads = _missing_spread_loads()
+
+    async def pair_ready(pair: tuple, futures: list) -> tuple:
+        await asyncio.gather(*futures, return_exceptions=True)
+        return pair
+
+    async def events():
+        for row in spread_index.result()["all"]:
+            yield _sse("spread", row)
+        waiters = [asyncio.ensure_future(pair_ready(p, fs)) for p, fs in loads.items()]
+        pending = 0
+        try:
+            for next_pair in asyncio.as_completed(waiters, timeout=SPREAD_DEADLINE):
+                pair = await next_pair
+                row = spread_index.spread(*pair)
+                if row is not None:
+                    yield _sse("spread", row)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Upstream loads are shielded by `flight` and finish regardless
+            pending = sum(not w.done() for w in waiters)
+            for w in waiters:
+                w.cancel()
+        result = spread_index.result()
+        result["pending"] = pending
+        yield _sse("done", result)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+# HTTP handlers without the lifespan: no upstream clients, scheduler or
+# stream are started, so tests seed the cache themselves.
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("path", [
+    "/p2p?exchange=kraken",
+    "/p2p/history?exchange=kraken",
+    "/p2p/live/stream?exchange=kraken",
+])
+def test_unknown_exchange_is_rejected(client, path):
+    tracked = set(main.scheduler._scores)
+    r = client.get(path)
+    assert r.status_code == 400
+    assert "exchange must be one of" in r.json()["detail"]
+    assert set(main.scheduler._scores) == tracked             # no junk key recorded
+
+
+def test_batch_reports_unknown_exchange_per_item(client):
+    r = client.post("/p2p/batch", json={"queries": [{"exchange": "kraken"}, {"fiat": "BTC", "crypto": "ETH"}]})
+    assert r.status_code == 200
+    assert [(x["status"], x["error"]) for x in r.json()["results"]] == [
+        ("error", "exchange must be one of ['bybit', 'binance']"),
+        ("error", "crypto-to-crypto not supported"),
+    ]
+
+
+def test_cold_load_is_bounded_and_keeps_loading(monkeypatch):
+    key = "p2p:bybit:CZK:BTC:BUY"
+    main.cache.delete(key)
+
+    async def slow_fetch(exchange, fiat, crypto, side, max_retries=2, pages=None):
+        await asyncio.sleep(0.3)
+        return [{"adv_id": "1", "price": 1.0, "exchange": "Bybit", "side": side}]
+    monkeypatch.setattr(main, "_fetch_with_retry", slow_fetch)
+
+    async def run():
+        with pytest.raises(main.StillLoading) as exc:
+            await main._load_within(key, "bybit", "CZK", "BTC", "BUY", deadline=0.05)
+        assert exc.value.status_code == 503 and exc.value.headers["Retry-After"]
+        await asyncio.sleep(0.4)                       # the load carried on
+        assert len(main.cache.get(key)) == 1
+    try:
+        asyncio.run(run())
+    finally:
+        main.cache.delete(key)
+
+
+def test_book_leaves_out_a_slow_exchange(monkeypatch):
+    keys = [f"p2p:{ex}:HUF:BTC:BUY" for ex in main.EXCHANGES]
+    for key in keys:
+        main.cache.delete(key)
+
+    async def fetch(exchange, fiat, crypto, side, max_retries=2, pages=None):
+        await asyncio.sleep(0.5 if exchange == "binance" else 0.0)
+        return [{"adv_id": exchange, "price": 400.0, "max_amount": 1000.0, "min_amount": 10.0,
+                 "exchange": exchange.title(), "side": side}]
+    monkeypatch.setattr(main, "_fetch_with_retry", fetch)
+
+    async def run():
+        response = await main.p2p_book(fiat="HUF", crypto="BTC", side="BUY", amount=0, limit=50,
+                                       deadline=0.1, accept_encoding="")
+        return json.loads(response.body)
+    try:
+        book = asyncio.run(run())
+    finally:
+        for key in keys:
+            main.cache.delete(key)
+    assert book["exchanges"]["bybit"] == {"offers": 1, "is_stale": False, "missing": False}
+    assert book["exchanges"]["binance"] == {"offers": 0, "is_stale": False, "missing": True}
+    assert [o["exchange"] for o in book["offers"]] == ["Bybit"]
+
+
+def test_live_stream_subscribes_only_once_the_body_starts():
+    key = "p2p:bybit:RON:USDT:BUY"
+    main.cache.set(key, main.OfferBatch([{"adv_id": "1", "price": 4.6, "exchange": "Bybit"}]))
+
+    async def run():
+        response = await main.p2p_live_stream(fiat="RON", crypto="USDT", side="BUY", exchange="bybit",
+                                              sort="price", min_rate=0, payment="", amount=0)
+        # A client gone before the body starts never runs the generator
+        assert key not in main.scheduler._pinned and main.feed.stats()["subscribers"] == 0
+
+        body = response.body_iterator
+        first = await body.__anext__()
+        assert first.startswith(b"event: snapshot\n")
+        assert main.scheduler._pinned[key] == 1 and main.feed.stats()["subscribers"] == 1
+        await body.aclose()
+        assert key not in main.scheduler._pinned and main.feed.stats()["subscribers"] == 0
+    try:
+        asyncio.run(run())
+    finally:
+        main.cache.delete(key)
+
+
+@pytest.fixture
+def seeded():
+    key = "p2p:bybit:SEK:USDT:BUY"
+
+    writes = itertools.count()
+
+    def seed(n: int, price: float = 10.0):
+        now = time.time() + next(writes)                      # a distinct version per write
+        batch = main.OfferBatch([{"adv_id": str(i), "price": price + i / 100, "exchange": "Bybit"}
+                                 for i in range(n)])
+        main.cache.set_entry(key, batch, now + 60, now + 120, now)
+    yield seed
+    main.cache.delete(key)
+
+
+def test_cursor_walks_the_snapshot(client, seeded):
+    seeded(5)
+    pages, params = [], {"fiat": "SEK", "limit": 2}
+    while True:
+        body = client.get("/p2p", params=params).json()
+        pages.append([o["adv_id"] for o in body["offers"]])
+        assert body["total"] == 5
+        assert body.get("snapshot_changed", False) is False
+        if body["next_cursor"] is None:
+            break
+        params = {"fiat": "SEK", "limit": 2, "cursor": body["next_cursor"]}
+    assert pages == [["0", "1"], ["2", "3"], ["4"]]
+
+    assert client.get("/p2p", params={"fiat": "SEK", "cursor": "!!"}).status_code == 400
+
+
+def test_cursor_reports_a_rotated_snapshot(client, seeded):
+    seeded(5)
+    cursor = client.get("/p2p", params={"fiat": "SEK", "limit": 2}).json()["next_cursor"]
+    seeded(6, price=9.0)
+    body = client.get("/p2p", params={"fiat": "SEK", "limit": 2, "cursor": cursor}).json()
+    assert body["snapshot_changed"] is True
+    assert [o["adv_id"] for o in body["offers"]] == ["2", "3"]     # same offset, new snapshot
+    assert body["total"] == 6
+
+
+def test_etag_revalidation(client, seeded):
+    seeded(3)
+    first = client.get("/p2p", params={"fiat": "SEK"})
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+
+    again = client.get("/p2p", params={"fiat": "SEK"}, headers={"If-None-Match": f'"other", {etag}'})
+    assert again.status_code == 304 and again.content == b"" and again.headers["ETag"] == etag
+
+    # Different parameters or a new snapshot → a different representation
+    other = client.get("/p2p", params={"fiat": "SEK", "sort": "rate"}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+    seeded(3, price=11.0)
+    rotated = client.get("/p2p", params={"fiat": "SEK"}, headers={"If-None-Match": etag})
+    assert rotated.status_code == 200 and rotated.headers["ETag"] != etag
+    assert rotated.json()["offers"][0]["price"] == 11.0
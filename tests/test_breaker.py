@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import main
+from app import breaker as breaker_module
+from app.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker_module.time, "monotonic", clock)
+    return clock
+
+
+def _tripped(**kwargs) -> CircuitBreaker:
+    b = CircuitBreaker(min_calls=4, failure_ratio=0.5, slow_call=1.0, cooldown=10.0, max_cooldown=30.0, **kwargs)
+    for ok in (True, True, False):
+        b.record(0.1, ok)
+    assert b.state == CLOSED and b.allow() is False
+    b.record(2.0, True)                              # slow counts as a failure: 2 of 4
+    assert b.state == OPEN
+    return b
+
+
+def test_opens_on_failure_ratio_and_rejects_during_cooldown(clock):
+    b = _tripped()
+    assert b.allow() is None
+    clock.now += 9.9
+    assert b.allow() is None
+    assert b.rejected == 2 and b.stats()["retry_in"] == pytest.approx(0.1)
+
+
+def test_old_failures_leave_the_window(clock):
+    b = CircuitBreaker(window=60.0, min_calls=4, failure_ratio=0.5)
+    for _ in range(3):
+        b.record(0.1, False)
+    clock.now += 61
+    b.record(0.1, False)
+    assert b.state == CLOSED                         # only one call in the window
+
+
+def test_half_open_lets_exactly_one_probe_through(clock):
+    b = _tripped()
+    clock.now += 10
+    assert b.allow() is True and b.state == HALF_OPEN
+    assert b.allow() is None
+
+
+def test_successful_probe_closes(clock):
+    b = _tripped()
+    clock.now += 10
+    assert b.allow() is True
+    b.record(0.2, True)
+    assert b.state == CLOSED and b.allow() is False
+    assert b.stats()["calls"] == 0                   # a fresh start, not the failures that tripped it
+
+
+def test_failed_probe_reopens_with_doubled_cooldown(clock):
+    b = _tripped()
+    for cooldown in (20, 30, 30):                    # doubled, then capped at max_cooldown
+        clock.now += b._cooldown
+        assert b.allow() is True
+        b.record(0.1, False)
+        assert b.state == OPEN and b._cooldown == cooldown
+    clock.now += 29.9
+    assert b.allow() is None
+    assert b.opened == 4
+
+
+def test_release_gives_the_probe_back(clock):
+    b = _tripped()
+    clock.now += 10
+    assert b.allow() is True
+    b.release()
+    assert b.state == HALF_OPEN and b.allow() is True
+
+
+def test_fetch_does_not_release_a_probe_it_never_held(clock, monkeypatch):
+    b = CircuitBreaker(cooldown=10.0)
+    monkeypatch.setattr(main.breakers, "breakers", {**main.breakers.breakers, "bybit": b})
+    gate = asyncio.Event()
+
+    async def fetch(fiat, crypto, side, pages=None):
+        if side == "slow":
+            await gate.wait()                        # admitted while closed, finishes later
+        return [{"adv_id": side}]
+    monkeypatch.setattr(main.EXCHANGES["bybit"], "fetch_p2p_offers", fetch)
+
+    async def run():
+        slow = asyncio.create_task(main._fetch_with_retry("bybit", "PLN", "USDT", "slow"))
+        await asyncio.sleep(0)
+        b._trip(clock.now)
+        clock.now += 10
+        assert b.allow() is True                     # someone else's probe, still in flight
+        gate.set()
+        assert await slow == [{"adv_id": "slow"}]
+        assert b.allow() is None                     # the probe slot is still taken
+    asyncio.run(run())
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from app.cache import SharedTier, TieredCache, TTLCache
+
+# L1 + shared L2 behaviour against an in-memory Redis. Each TieredCache is
+# one worker; workers built on the same FakeServer share the L2.
+
+
+def _worker(server: fakeredis.FakeServer, wait_timeout: float = 5.0) -> TieredCache:
+    shared = SharedTier(None)
+    shared._redis = fakeredis.FakeAsyncRedis(server=server)
+    return TieredCache(TTLCache(), shared, wait_timeout=wait_timeout)
+
+
+def _fetcher(value, calls: list, gate: asyncio.Event = None):
+    async def fetch():
+        calls.append(value)
+        if gate is not None:
+            await gate.wait()
+        return value
+    return fetch
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def test_load_fills_both_tiers(server):
+    async def run():
+        a = _worker(server)
+        calls = []
+        assert await a.load("p2p:bybit:PLN:USDT:BUY", _fetcher([{"price": 4.1}], calls)) == [{"price": 4.1}]
+        assert calls == [[{"price": 4.1}]]
+        assert a.local.get("p2p:bybit:PLN:USDT:BUY") == [{"price": 4.1}]
+        entry = await a.shared.get("p2p:bybit:PLN:USDT:BUY")
+        assert entry.value == [{"price": 4.1}]
+        assert entry.fresh_until > time.time()
+        assert entry.set_at == a.local.set_at("p2p:bybit:PLN:USDT:BUY")
+    asyncio.run(run())
+
+
+def test_second_worker_adopts_fresh_l2_entry(server):
+    async def run():
+        a, b = _worker(server), _worker(server)
+        await a.load("trending", _fetcher({"top": ["BTCUSDT"]}, []))
+        calls = []
+        assert await b.load("trending", _fetcher({"top": []}, calls)) == {"top": ["BTCUSDT"]}
+        assert calls == []                                    # no upstream fetch
+        assert b.local.get("trending") == {"top": ["BTCUSDT"]}
+        assert b.local.set_at("trending") == a.local.set_at("trending")
+    asyncio.run(run())
+
+
+def test_pull_ignores_entry_not_newer_than_l1(server):
+    async def run():
+        a, b = _worker(server), _worker(server)
+        await a.put("k", "old")
+        await asyncio.sleep(0.01)
+        b.local.set_entry("k", "mine", time.time() + 25, time.time() + 75, time.time())
+        assert await b.pull("k") is None
+        assert b.local.get("k") == "mine"
+    asyncio.run(run())
+
+
+def test_lock_contention_fetches_once(server):
+    async def run():
+        a, b = _worker(server), _worker(server)
+        gate, calls = asyncio.Event(), []
+        first = asyncio.ensure_future(a.load("k", _fetcher("from-a", calls, gate)))
+        await asyncio.sleep(0.05)                             # a holds the lock
+        assert await b.shared.acquire("k") is None
+        second = asyncio.ensure_future(b.load("k", _fetcher("from-b", calls)))
+        await asyncio.sleep(0.1)
+        gate.set()
+        assert await first == "from-a"
+        assert await second == "from-a"                       # b waited for a's result
+        assert calls == ["from-a"]
+        # The winner released its lock
+        token = await b.shared.acquire("k")
+        assert token is not None
+        await b.shared.release("k", token)
+    asyncio.run(run())
+
+
+def test_lock_wait_times_out_and_fetches(server):
+    async def run():
+        a, b = _worker(server), _worker(server, wait_timeout=0.3)
+        assert await a.shared.acquire("k") is not None        # held and never released
+        calls = []
+        assert await b.load("k", _fetcher("from-b", calls)) == "from-b"
+        assert calls == ["from-b"]
+    asyncio.run(run())
+
+
+def test_release_keeps_foreign_lock(server):
+    async def run():
+        a = _worker(server)
+        token = await a.shared.acquire("k")
+        await a.shared.release("k", "someone-else")
+        assert await a.shared.acquire("k") is None
+        await a.shared.release("k", token)
+        assert await a.shared.acquire("k") is not None
+    asyncio.run(run())
+
+
+def test_redis_down_falls_back_to_l1(server):
+    async def run():
+        a = _worker(server)
+        server.connected = False
+        calls = []
+        assert await a.load("k", _fetcher([1, 2], calls)) == [1, 2]
+        assert calls == [[1, 2]]
+        assert a.local.get("k") == [1, 2]
+        assert await a.shared.get("k") is None
+        assert await a.shared.acquire("k") == "local"
+    asyncio.run(run())
+
+
+def test_failed_refresh_keeps_stale_l1(server):
+    async def run():
+        a = _worker(server)
+        now = time.time()
+        a.local.set_entry("k", [{"price": 1.0}], now - 1, now + 50, now - 26)
+        assert await a.load("k", _fetcher([], []), keep_empty=False) == []
+        assert a.local.peek("k") == [{"price": 1.0}]
+    asyncio.run(run())
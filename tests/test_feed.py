@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from app.feed import QUEUE_SIZE, LiveFeed, offer_id
+from app.offers import OfferBatch
+
+KEY = "p2p:bybit:PLN:USDT:BUY"
+
+
+def _offer(adv_id: str, price: float, **extra) -> dict:
+    return {"adv_id": adv_id, "price": price, "min_amount": 10.0, "max_amount": 1000.0,
+            "completion_rate": 98.0, "trade_count": 200, "exchange": "Bybit", **extra}
+
+
+def _drain(sub) -> list:
+    out = []
+    while not sub.queue.empty():
+        message = sub.queue.get_nowait()
+        out.append(None if message is None else (message[0], json.loads(message[1])))
+    return out
+
+
+def test_offer_id_falls_back_to_advertiser_and_position():
+    assert offer_id({"adv_id": "42", "advertiser_id": "u"}, 3) == "42"
+    assert offer_id({"advertiser_id": "u"}, 3) == "u#3"
+
+
+def test_subscriber_gets_snapshot_then_diff_by_adv_id():
+    feed = LiveFeed()
+    sub = feed.subscribe(KEY, {"sort": "price"}, OfferBatch([_offer("a", 4.0), _offer("b", 4.1), _offer("c", 4.2)]), 1)
+    [(kind, snapshot)] = _drain(sub)
+    assert kind == "snapshot" and snapshot["version"] == 1
+    assert [o["adv_id"] for o in snapshot["offers"]] == ["a", "b", "c"]
+
+    # b reprices below a, c goes away, d is new
+    feed.on_cache_write(KEY, OfferBatch([_offer("b", 3.9), _offer("a", 4.0), _offer("d", 4.5)]), 0)
+    [(kind, diff)] = _drain(sub)
+    assert kind == "diff"
+    assert [o["adv_id"] for o in diff["added"]] == ["d"]
+    assert diff["removed"] == ["c"]
+    assert [(o["adv_id"], o["price"]) for o in diff["changed"]] == [("b", 3.9)]
+    assert diff["order"] == ["b", "a", "d"]
+
+
+def test_unchanged_refresh_sends_nothing_and_filters_apply():
+    feed = LiveFeed()
+    rows = [_offer("a", 4.0, payment_methods=["SEPA"]), _offer("b", 4.1, payment_methods=["Wise"])]
+    sub = feed.subscribe(KEY, {"sort": "price", "payment": "sepa"}, OfferBatch(rows), 1)
+    assert [o["adv_id"] for o in _drain(sub)[0][1]["offers"]] == ["a"]
+
+    feed.on_cache_write(KEY, OfferBatch(rows), 0)
+    assert _drain(sub) == []
+
+
+def test_same_filters_share_a_group_until_the_last_leaves():
+    feed = LiveFeed()
+    batch = OfferBatch([_offer("a", 4.0)])
+    first  = feed.subscribe(KEY, {"sort": "price"}, batch, 1)
+    second = feed.subscribe(KEY, {"sort": "price"}, None, 1)
+    other  = feed.subscribe(KEY, {"sort": "rate"}, batch, 1)
+    assert first.group is second.group and other.group is not first.group
+    assert [o["adv_id"] for o in _drain(second)[0][1]["offers"]] == ["a"]
+    assert feed.stats()["groups"] == 2 and feed.stats()["subscribers"] == 3
+
+    feed.unsubscribe(first)
+    feed.unsubscribe(other)
+    assert feed.stats()["groups"] == 1
+    feed.unsubscribe(second)
+    assert feed.stats() == {"keys": 0, "groups": 0, "subscribers": 0, "sent": 0, "dropped": 0}
+
+
+def test_slow_subscriber_is_dropped_without_stalling_the_rest():
+    feed = LiveFeed()
+    slow = feed.subscribe(KEY, {"sort": "price"}, OfferBatch([_offer("a", 4.0)]), 1)
+    fast = feed.subscribe(KEY, {"sort": "price"}, None, 1)
+
+    # The snapshot already takes one slot; fill the rest with diffs
+    for i in range(QUEUE_SIZE - 1):
+        _drain(fast)
+        feed.on_cache_write(KEY, OfferBatch([_offer("a", 4.0 + (i + 1) / 100)]), 0)
+    assert not slow.dropped and slow.queue.full()
+    _drain(fast)
+
+    feed.on_cache_write(KEY, OfferBatch([_offer("a", 5.0)]), 0)
+    assert slow.dropped and not fast.dropped
+    assert feed.dropped == 1 and feed.stats()["subscribers"] == 1
+    # Backlog discarded: the slow client sees the terminator next
+    assert asyncio.run(slow.next()) is None
+    [(kind, diff)] = _drain(fast)
+    assert kind == "diff" and diff["changed"][0]["price"] == 5.0
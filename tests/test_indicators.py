@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from app.indicators import KlineSeries, parse_indicators
+
+# Incrementally maintained indicators must equal a from-scratch textbook
+# computation over the same candles.
+
+NAMES = ["ma7", "ema9", "rsi14", "bb20", "vwap10"]
+
+
+def sma(x, p):
+    return np.array([x[i - p + 1:i + 1].mean() if i >= p - 1 else np.nan for i in range(len(x))])
+
+
+def ema(x, p):
+    out, alpha = np.full(len(x), np.nan), 2.0 / (p + 1)
+    if len(x) >= p:
+        out[p - 1] = x[:p].mean()
+        for i in range(p, len(x)):
+            out[i] = out[i - 1] + alpha * (x[i] - out[i - 1])
+    return out
+
+
+def rsi(x, p):
+    out = np.full(len(x), np.nan)
+    if len(x) <= p:
+        return out
+    gains  = [max(x[i] - x[i - 1], 0.0) for i in range(1, len(x))]
+    losses = [max(x[i - 1] - x[i], 0.0) for i in range(1, len(x))]
+    g, l = sum(gains[:p]) / p, sum(losses[:p]) / p
+    for i in range(p, len(x)):
+        if i > p:
+            g = (g * (p - 1) + gains[i - 1]) / p
+            l = (l * (p - 1) + losses[i - 1]) / p
+        out[i] = 100.0 if l == 0 else 100.0 - 100.0 / (1.0 + g / l)
+    return out
+
+
+def bollinger(x, p, k=2.0):
+    mid = sma(x, p)
+    std = np.array([x[i - p + 1:i + 1].std() if i >= p - 1 else np.nan for i in range(len(x))])
+    return {"upper": mid + k * std, "mid": mid, "lower": mid - k * std}
+
+
+def vwap(c, p):
+    tp = (c[:, 2] + c[:, 3] + c[:, 4]) / 3.0
+    v = c[:, 5]
+    return np.array([(tp[i - p + 1:i + 1] * v[i - p + 1:i + 1]).sum() / v[i - p + 1:i + 1].sum()
+                     if i >= p - 1 else np.nan for i in range(len(c))])
+
+
+def naive(candles: np.ndarray) -> dict[str, np.ndarray]:
+    close = candles[:, 4]
+    bb = bollinger(close, 20)
+    return {
+        "ma7":   sma(close, 7),
+        "ema9":  ema(close, 9),
+        "rsi14": rsi(close, 14),
+        "bb20_upper": bb["upper"], "bb20_mid": bb["mid"], "bb20_lower": bb["lower"],
+        "vwap10": vwap(candles, 10),
+    }
+
+
+def _candles(rng: np.random.Generator, n: int) -> np.ndarray:
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    close[rng.integers(0, n, n // 10)] = np.roll(close, 1)[rng.integers(0, n, n // 10)]   # flat moves
+    spread = rng.uniform(0, 2, n)
+    return np.column_stack((np.arange(n) * 60_000.0, close, close + spread, close - spread,
+                            close, rng.uniform(0.1, 50, n)))
+
+
+def _assert_matches(series: KlineSeries, expected: dict[str, np.ndarray]):
+    for name in NAMES:
+        for col, arr in series.indicators[name].out.items():
+            if not col.startswith("_"):
+                np.testing.assert_allclose(arr, expected[col], rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col)
+
+
+def _feed(series: KlineSeries, candles: np.ndarray, rng: np.random.Generator):
+    """Append in random chunks; each chunk first revises the still-open candle."""
+    i = 0
+    while i < len(candles):
+        j = min(i + int(rng.integers(1, 25)), len(candles))
+        chunk = candles[i:j].copy()
+        if j < len(candles):
+            chunk[-1, 4] += rng.normal(0, 3)           # provisional close, fixed by the next chunk
+            j -= 1
+        series.extend(chunk)
+        i = j
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_matches_naive(seed):
+    rng = np.random.default_rng(seed)
+    candles = _candles(rng, 250)
+    series = KlineSeries(capacity=1000)
+    series.ensure(NAMES)
+    _feed(series, candles, rng)
+    np.testing.assert_array_equal(series.close, candles[:, 4])
+    _assert_matches(series, naive(candles))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_capacity_overflow_keeps_the_tail(seed):
+    rng = np.random.default_rng(seed)
+    candles = _candles(rng, 400)
+    series = KlineSeries(capacity=120)
+    series.ensure(NAMES)
+    _feed(series, candles, rng)
+
+    assert len(series) == 120
+    np.testing.assert_array_equal(series.time, candles[-120:, 0])
+    # Recursive indicators carry their state across the trim
+    _assert_matches(series, {col: arr[-120:] for col, arr in naive(candles).items()})
+
+
+def test_indicator_added_after_overflow_starts_from_the_kept_candles():
+    rng = np.random.default_rng(7)
+    candles = _candles(rng, 300)
+    series = KlineSeries(capacity=100)
+    _feed(series, candles, rng)
+    series.ensure(NAMES)
+    _assert_matches(series, naive(candles[-100:]))
+
+
+def test_short_series_is_all_warmup():
+    series = KlineSeries()
+    series.ensure(NAMES)
+    series.extend(_candles(np.random.default_rng(0), 5))
+    rows = series.rows(5, NAMES)
+    assert all(r["rsi14"] is None and r["bb20_mid"] is None and r["ema9"] is None for r in rows)
+
+
+def test_parse_indicators():
+    assert parse_indicators(" MA7, rsi14,,ma7 ") == ["ma7", "rsi14"]
+    for bad in ("macd12", "ma1", "ema501", "rsi"):
+        with pytest.raises(ValueError):
+            parse_indicators(bad)
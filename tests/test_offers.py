@@ -0,0 +1,82 @@
+import itertools
+import random
+
+import pytest
+
+from app.offers import SORTS, OfferBatch
+
+# OfferBatch.select must return what the original per-request list pipeline
+# in /p2p did: filter by min_rate, payment and amount, then a stable sort.
+
+PAYMENTS = ["Bank Transfer", "SEPA", "Revolut", "Wise", "SEPA Instant", None]
+
+
+def baseline(offers: list[dict], side: str, sort: str, min_rate: float, payment: str, amount: float) -> list[dict]:
+    if min_rate > 0:
+        offers = [o for o in offers if o["completion_rate"] >= min_rate]
+    if payment:
+        offers = [
+            o for o in offers
+            if any(payment.lower() in pm.lower()
+                   for pm in o.get("payment_methods", []) if pm is not None)
+        ]
+    if amount > 0:
+        offers = [
+            o for o in offers
+            if o.get("min_amount", 0) <= amount <= o.get("max_amount", float("inf"))
+        ]
+    offers = list(offers)
+    if sort == "volume":
+        offers.sort(key=lambda x: x["max_amount"], reverse=True)
+    elif sort == "rate":
+        offers.sort(key=lambda x: x["completion_rate"], reverse=True)
+    elif sort == "score":
+        offers.sort(key=lambda x: x["rating_score"], reverse=True)
+    elif sort == "safety":
+        offers.sort(key=lambda x: x.get("safety_score", 0), reverse=True)
+    else:
+        offers.sort(key=lambda x: x["price"], reverse=(side == "SELL"))
+    return offers
+
+
+def _offers(rng: random.Random, n: int) -> list[dict]:
+    # Few distinct values per column, so every sort has plenty of ties
+    offers = []
+    for i in range(n):
+        low = rng.choice([0, 10, 50, 100])
+        offers.append({
+            "adv_id":          str(i),
+            "price":           rng.choice([0.0, 0.99, 1.0, 1.01, 1.05]),
+            "min_amount":      low,
+            "max_amount":      low + rng.choice([0, 40, 100, 500]),
+            "trade_count":     rng.choice([0, 10, 50, 200]),
+            "completion_rate": rng.choice([0, 80, 90, 95, 100]),
+            "payment_methods": rng.sample(PAYMENTS, rng.randint(0, 3)),
+            "exchange":        rng.choice(["bybit", "binance"]),
+        })
+    return offers
+
+
+SIDES   = ["BUY", "SELL"]
+ORDERS  = ["price", *SORTS, "unknown"]
+FILTERS = list(itertools.product([0, 90, 95.5], ["", "sepa", "REVOLUT", "nope"], [0, 10, 50, 140]))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("sort", ORDERS)
+@pytest.mark.parametrize("side", SIDES)
+def test_select_matches_list_pipeline(seed, sort, side):
+    rng = random.Random(seed)
+    batch = OfferBatch(_offers(rng, rng.randint(1, 80)))
+    for min_rate, payment, amount in FILTERS:
+        got = [batch.rows[i] for i in batch.select(side, sort, min_rate, payment, amount).tolist()]
+        want = baseline(batch.rows, side, sort, min_rate, payment, amount)
+        assert [o["adv_id"] for o in got] == [o["adv_id"] for o in want], (min_rate, payment, amount)
+
+
+@pytest.mark.parametrize("side", SIDES)
+def test_select_on_an_empty_batch(side):
+    batch = OfferBatch([])
+    for sort in ORDERS:
+        for min_rate, payment, amount in FILTERS:
+            assert batch.select(side, sort, min_rate, payment, amount).tolist() == []
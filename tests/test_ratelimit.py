@@ -0,0 +1,100 @@
+import asyncio
+import types
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import ratelimit as ratelimit_module
+from app.ratelimit import TokenBucket, parse_retry_after
+
+
+class Clock:
+    """time.monotonic and asyncio.sleep for app.ratelimit: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit_module.time, "monotonic", clock)
+    monkeypatch.setattr(ratelimit_module, "asyncio", types.SimpleNamespace(sleep=clock.sleep, Lock=asyncio.Lock))
+    return clock
+
+
+def test_burst_then_paced_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=4)
+
+    async def run():
+        return [await bucket.acquire() for _ in range(6)]
+    waits = asyncio.run(run())
+    assert waits[:4] == [0.0] * 4
+    assert waits[4:] == pytest.approx([0.5, 0.5])
+    assert bucket.acquired == 6 and bucket.wait_max == pytest.approx(0.5)
+
+
+def test_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=2.0, burst=4)
+    asyncio.run(bucket.acquire(4))
+    assert bucket.available() == 0
+    clock.now += 1.0
+    assert bucket.available() == pytest.approx(2.0)
+    clock.now += 60.0
+    assert bucket.available() == 4
+
+
+def test_cost_above_burst_leaves_debt(clock):
+    bucket = TokenBucket(rate=2.0, burst=4)
+
+    async def run():
+        return await bucket.acquire(10), await bucket.acquire(1)
+    big, small = asyncio.run(run())
+    assert big == 0.0                                # a full bucket is enough
+    assert small == pytest.approx(3.5)               # 6 tokens of debt + 1, at 2/s
+
+
+def test_penalize_pauses_for_retry_after_and_halves_the_rate(clock):
+    bucket = TokenBucket(rate=2.0, burst=4, recover_secs=60.0)
+    bucket.penalize(5.0)
+    assert bucket.throttled == 1 and bucket.effective_rate == pytest.approx(1.0)
+    assert bucket.available() == 0.0
+    assert bucket.stats()["blocked_for"] == pytest.approx(5.0)
+
+    waited = asyncio.run(bucket.acquire())
+    assert clock.slept[0] == pytest.approx(5.0)      # nothing accrues during the pause
+    # ... then one token at the reduced (recovering) rate
+    assert 5.8 < waited < 6.0
+
+    clock.now += 60.0
+    bucket.available()
+    assert bucket.effective_rate == 2.0              # recovered linearly
+
+
+def test_penalize_without_retry_after_and_repeated(clock):
+    bucket = TokenBucket(rate=2.0, burst=4)
+    for _ in range(5):
+        bucket.penalize()
+    assert bucket.effective_rate == pytest.approx(2.0 * TokenBucket.MIN_FACTOR)
+    # Each pause lasts one token at the reduced rate; the longest one wins
+    assert bucket.stats()["blocked_for"] == pytest.approx(1 / (2.0 * TokenBucket.MIN_FACTOR))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("soon") is None
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert parse_retry_after(format_datetime(later, usegmt=True)) == pytest.approx(30, abs=2)
@@ -0,0 +1,48 @@
+import copy
+import random
+
+import pytest
+
+from app.offers import OfferBatch
+from app.scoring import compute_rating, enrich_safety
+
+# The vectorized scorers (OfferBatch) must agree with the per-offer rules
+# in compute_safety_score / compute_rating.
+
+# Values on and around every threshold, plus the odd garbage the parsers let through
+TRADE_COUNTS = [0, 4, 5, 19, 20, 49, 50, 99, 100, 5000]
+RATES        = [0, 50, 79.9, 80, 89.9, 90, 94.9, 95, 100, 120, -5]
+MIN_AMOUNTS  = [0, 4.99, 5, 100]
+
+
+def _offers(rng: random.Random, n: int) -> list[dict]:
+    median = rng.uniform(1, 5000)
+    offers = []
+    for _ in range(n):
+        price = rng.choice([0.0, median * rng.uniform(0.85, 1.15), median * (1 + rng.choice([3, 5, 8]) / 100)])
+        offers.append({
+            "price":           price,
+            "min_amount":      rng.choice(MIN_AMOUNTS + [rng.uniform(0, 50)]),
+            "max_amount":      rng.uniform(100, 10000),
+            "trade_count":     rng.choice(TRADE_COUNTS + [rng.randint(0, 300)]),
+            "completion_rate": rng.choice(RATES + [round(rng.uniform(0, 100), 2)]),
+            "exchange":        rng.choice(["Bybit", "Binance", "bybit"]),
+        })
+    return offers
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_batch_scores_match_scalar_rules(seed):
+    rng = random.Random(seed)
+    offers = _offers(rng, rng.randint(1, 60))
+    expected = enrich_safety(copy.deepcopy(offers))
+    batch = OfferBatch(offers)
+    assert [o["safety_score"] for o in batch.rows] == [o["safety_score"] for o in expected]
+    assert [o["safety_tier"] for o in batch.rows] == [o["safety_tier"] for o in expected]
+    assert [o["rating_score"] for o in batch.rows] == [
+        compute_rating(o["completion_rate"], o["trade_count"]) for o in offers]
+
+
+def test_empty_batch():
+    batch = OfferBatch([])
+    assert len(batch) == 0 and batch.rows == ()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app import snapshots as snapshots_module
+from app.cache import TTLCache
+from app.snapshots import MAGIC, SnapshotStore
+
+# SnapshotStore against a temp file, each test with its own TTLCache.
+
+
+@pytest.fixture
+def local_cache(monkeypatch):
+    fresh = TTLCache()
+    monkeypatch.setattr(snapshots_module, "cache", fresh)
+    return fresh
+
+
+def _restart(path: str, cache: TTLCache, **kwargs) -> SnapshotStore:
+    """A new process: empty cache, store opened on the same file."""
+    cache.clear()
+    store = SnapshotStore(path, **kwargs)
+    store._open()
+    cache.set_fallback(store.restore)
+    return store
+
+
+def test_restores_offer_books_but_not_market_payloads(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+
+    async def run():
+        store = SnapshotStore(path)
+        await store.start()
+        local_cache.set("p2p:bybit:PLN:USDT:BUY", [{"price": 4.1}], ttl=25)
+        local_cache.set("chart:BTCUSDT:1h:90:ma7", {"rows": []}, ttl=2)
+        local_cache.set("trending:USDT:change:1e+06:20", {"top": []}, ttl=2)
+        await store.stop()
+    asyncio.run(run())
+
+    store = _restart(path, local_cache)
+    assert set(store._index) == {"p2p:bybit:PLN:USDT:BUY"}
+    assert local_cache.get("chart:BTCUSDT:1h:90:ma7") is None
+    assert local_cache.get("trending:USDT:change:1e+06:20") is None
+    assert local_cache.get("p2p:bybit:PLN:USDT:BUY") == [{"price": 4.1}]
+    assert store.restored == 1
+
+
+def test_old_market_records_are_ignored_and_compacted_away(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+    now = time.time()
+    # Written by a version that persisted every prefix
+    old = SnapshotStore(path, prefixes=("",))
+    old._open()
+    old._append({"chart:BTCUSDT:1h": ({"rows": [1] * 500}, now - 598, now - 594, now - 600),
+                 "p2p:binance:EUR:USDT:SELL": ([{"price": 1.0}], now - 5, now + 45, now - 30)})
+
+    store = _restart(path, local_cache)
+    assert store.restore("chart:BTCUSDT:1h") is None
+    assert local_cache.get("p2p:binance:EUR:USDT:SELL") == [{"price": 1.0}]
+    store._compact()
+    with open(path, "rb") as f:
+        assert set(SnapshotStore._scan(f.read(), ("",))[0]) == {"p2p:binance:EUR:USDT:SELL"}
+
+
+def test_torn_tail_is_truncated(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+    now = time.time()
+    store = SnapshotStore(path)
+    store._open()
+    store._append({"p2p:bybit:PLN:USDT:BUY": ([{"price": 4.1}], now, now + 50, now)})
+    good = os.path.getsize(path)
+    store._append({"p2p:bybit:EUR:USDT:BUY": ([{"price": 1.1}], now, now + 50, now)})
+    with open(path, "r+b") as f:                  # crash halfway through the second record
+        f.truncate(good + (os.path.getsize(path) - good) // 2)
+
+    store = _restart(path, local_cache)
+    assert os.path.getsize(path) == good
+    assert set(store._index) == {"p2p:bybit:PLN:USDT:BUY"}
+    assert local_cache.get("p2p:bybit:PLN:USDT:BUY") == [{"price": 4.1}]
+
+
+def test_corrupt_record_ends_the_valid_data(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+    now = time.time()
+    store = SnapshotStore(path)
+    store._open()
+    store._append({"p2p:bybit:PLN:USDT:BUY": ([{"price": 4.1}], now, now + 50, now)})
+    with open(path, "r+b") as f:                  # flip a byte of the value
+        f.seek(-6, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-6, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    store = _restart(path, local_cache)
+    assert store._index == {}
+    assert os.path.getsize(path) == len(MAGIC)
+
+
+def test_compaction_keeps_latest_record_per_key(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+    now = time.time()
+    store = SnapshotStore(path)
+    store._open()
+    for i in range(20):
+        store._append({"p2p:bybit:PLN:USDT:BUY": ([{"price": float(i)}], now, now + 50, now + i)})
+    bloated = os.path.getsize(path)
+
+    store = _restart(path, local_cache, compact_ratio=3.0)   # compacts on open
+    assert os.path.getsize(path) < bloated / 10
+    assert local_cache.get("p2p:bybit:PLN:USDT:BUY") == [{"price": 19.0}]
+
+
+def test_expired_records_are_not_restored(tmp_path, local_cache):
+    path = str(tmp_path / "snap.bin")
+    now = time.time()
+    store = SnapshotStore(path, max_age=900)
+    store._open()
+    store._append({"p2p:bybit:PLN:USDT:BUY": ([{"price": 4.1}], now - 975, now - 925, now - 1000)})
+
+    store = _restart(path, local_cache)
+    assert local_cache.get("p2p:bybit:PLN:USDT:BUY") is None
+    assert store.expired == 1
@@ -0,0 +1,107 @@
+import random
+import time
+import types
+
+import pytest
+
+from app import spread as spread_module
+from app.offers import OfferBatch
+from app.scoring import SAFE_THRESHOLD
+from app.spread import SpreadIndex, _spread_row
+
+EXCHANGES = ["bybit", "binance", "okx"]
+PAIRS     = [("PLN", "USDT"), ("EUR", "USDT"), ("PLN", "BTC")]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(spread_module, "time", types.SimpleNamespace(time=clock, perf_counter=time.perf_counter))
+    return clock
+
+
+def _batch(rng: random.Random, exchange: str) -> OfferBatch:
+    rows = []
+    for i in range(rng.choice([0, 1, 3, 8])):
+        rows.append({
+            "price":           rng.uniform(92, 108),
+            "min_amount":      rng.choice([0, 10, 100]),
+            "max_amount":      1000.0,
+            "trade_count":     rng.choice([0, 3, 60, 500]),
+            "completion_rate": rng.choice([50, 85, 99]),
+            "exchange":        exchange.title(),
+            "advertiser":      f"{exchange}-{i}",
+            "url":             "",
+        })
+    return OfferBatch(rows)
+
+
+def _summary(o: dict) -> dict:
+    return {k: o.get(k, "") for k in ("price", "exchange", "advertiser", "url", "safety_score", "safety_tier")}
+
+
+def brute_force(writes: dict, fiat: str, crypto: str, now: float):
+    """Latest live write per exchange → best safe offer, else best offer, per side."""
+    best = {}
+    for side in ("BUY", "SELL"):
+        safe, any_ = [], []
+        for (f, c, s, _), (batch, stale_until) in writes.items():
+            if (f, c, s) != (fiat, crypto, side) or now > stale_until:
+                continue
+            for i, o in enumerate(batch.rows):
+                any_.append(o)
+                if batch.safety_score[i] >= SAFE_THRESHOLD:
+                    safe.append(o)
+        pool = safe or any_
+        if not pool:
+            return None
+        pick = max if side == "SELL" else min
+        best[side] = _summary(pick(pool, key=lambda o: o["price"]))
+    return _spread_row(fiat, crypto, best["BUY"], best["SELL"])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_brute_force_after_random_writes_and_expiry(clock, seed):
+    rng = random.Random(seed)
+    index, writes = SpreadIndex(), {}
+    for _ in range(300):
+        fiat, crypto = rng.choice(PAIRS)
+        side, exchange = rng.choice(["BUY", "SELL"]), rng.choice(EXCHANGES)
+        if rng.random() < 0.8:
+            batch, stale_until = _batch(rng, exchange), clock.now + rng.uniform(1, 40)
+            index.on_cache_write(f"p2p:{exchange}:{fiat}:{crypto}:{side}", batch, stale_until)
+            writes[(fiat, crypto, side, exchange)] = (batch, stale_until)   # replaces the previous one
+        clock.now += rng.uniform(0, 5)
+
+        for f, c in PAIRS:
+            assert index.spread(f, c) == brute_force(writes, f, c, clock.now)
+        expected = [r for r in (brute_force(writes, f, c, clock.now) for f, c in PAIRS) if r]
+        assert sorted(index.result()["all"], key=lambda r: (r["fiat"], r["crypto"])) == \
+            sorted(expected, key=lambda r: (r["fiat"], r["crypto"]))
+
+        # Lazy deletion keeps each heap bounded by the live exchanges
+        for book in index._books.values():
+            assert len(book.heap) <= 8 * max(len(book.live), 1) + 2
+
+
+def test_expired_exchange_leaves_the_book(clock):
+    index = SpreadIndex()
+    buy  = OfferBatch([{"price": 100.0, "exchange": "Bybit", "trade_count": 500, "completion_rate": 99}])
+    sell = OfferBatch([{"price": 101.0, "exchange": "Binance", "trade_count": 500, "completion_rate": 99}])
+    index.on_cache_write("p2p:bybit:PLN:USDT:BUY", buy, clock.now + 10)
+    index.on_cache_write("p2p:binance:PLN:USDT:SELL", sell, clock.now + 30)
+    assert index.spread("PLN", "USDT")["cross_exchange"] is True
+
+    clock.now += 11
+    assert index.spread("PLN", "USDT") is None
+    assert index.result()["all"] == []
+    assert index._books[("PLN", "USDT", "BUY")].live == {}       # dropped, not just hidden
+    assert index._books[("PLN", "USDT", "SELL")].live == {"binance": 2}
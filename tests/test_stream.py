@@ -0,0 +1,214 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from websockets.asyncio.server import serve
+
+from app import market
+from app.indicators import KlineSeries
+from app.stream import BinanceStream
+
+# BinanceStream against a local stand-in for the combined-stream endpoint,
+# with the market handlers (app.market) registered as in production.
+
+
+class StandIn:
+    """Records what clients send; pushes events to the latest connection."""
+
+    def __init__(self):
+        self.received: list[list[dict]] = []      # per connection
+        self.connections = []
+
+    async def _handler(self, ws):
+        self.connections.append(ws)
+        self.received.append([])
+        log = self.received[-1]
+        async for raw in ws:
+            msg = json.loads(raw)
+            log.append(msg)
+            await ws.send(json.dumps({"result": None, "id": msg["id"]}))
+
+    async def __aenter__(self):
+        self._server = await serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/stream"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def push(self, stream: str, data):
+        await self.connections[-1].send(json.dumps({"stream": stream, "data": data}))
+
+    def subscribed(self, connection: int = -1) -> set[str]:
+        streams: set[str] = set()
+        for msg in self.received[connection] if self.received else []:
+            if msg["method"] == "SUBSCRIBE":
+                streams.update(msg["params"])
+            else:
+                streams.difference_update(msg["params"])
+        return streams
+
+
+async def _until(cond, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _client(url: str) -> BinanceStream:
+    client = BinanceStream(url)
+    client.on("kline", market._on_kline)
+    client.on("24hrMiniTicker", market._on_mini_ticker)
+    client.on_connect(market._on_connect)
+    return client
+
+
+def _kline(t: int, close: float, closed: bool) -> dict:
+    return {"e": "kline", "E": t + 1, "s": "BTCUSDT",
+            "k": {"t": t, "T": t + 59_999, "s": "BTCUSDT", "i": "1m", "o": "100.0", "h": "110.0",
+                  "l": "90.0", "c": str(close), "v": "5.0", "x": closed}}
+
+
+@pytest.fixture
+def series():
+    key = ("BTCUSDT", "1m")
+    s = market._series[key] = KlineSeries(capacity=100, depth=2)
+    s.extend(np.array([[0, 100, 110, 90, 101, 5], [60_000, 101, 111, 91, 102, 5]], dtype=float))
+    yield key, s
+    market._series.pop(key, None)
+    market._synced.discard(key)
+
+
+def test_subscribe_before_and_after_connect():
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            client.subscribe("!miniTicker@arr")
+            await client.start()
+            try:
+                await _until(lambda: server.subscribed() == {"!miniTicker@arr"})
+                client.subscribe("btcusdt@kline_1m", "!miniTicker@arr")
+                await _until(lambda: "btcusdt@kline_1m" in server.subscribed())
+                assert [m["params"] for m in server.received[-1]] == [["!miniTicker@arr"], ["btcusdt@kline_1m"]]
+                ids = [m["id"] for m in server.received[-1]]
+                assert len(set(ids)) == len(ids)
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_kline_updates_open_candle_and_appends_closed(series):
+    key, s = series
+
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            await client.start()
+            try:
+                await _until(lambda: client.connected)
+                market._synced.add(key)
+                # Update of the still-open last candle: replaced in place
+                await server.push("btcusdt@kline_1m", _kline(60_000, 105.0, closed=False))
+                await _until(lambda: s.close[-1] == 105.0)
+                assert len(s) == 2
+                # It closes, then the next candle opens
+                await server.push("btcusdt@kline_1m", _kline(60_000, 106.0, closed=True))
+                await server.push("btcusdt@kline_1m", _kline(120_000, 107.0, closed=False))
+                await _until(lambda: len(s) == 3)
+                assert s.close.tolist() == [101.0, 106.0, 107.0]
+                assert s.last_time == 120_000
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_kline_ignored_until_synced(series):
+    key, s = series
+
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            await client.start()
+            try:
+                await _until(lambda: client.connected)
+                await server.push("btcusdt@kline_1m", _kline(120_000, 107.0, closed=False))
+                await _until(lambda: client.messages == 1)
+                assert len(s) == 2                   # REST has to catch it up first
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_mini_ticker_feeds_ticker_table():
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            await client.start()
+            try:
+                await _until(lambda: client.connected)
+                await server.push("!miniTicker@arr", [
+                    {"e": "24hrMiniTicker", "s": "ZZZUSDT", "c": "2.0", "o": "1.0",
+                     "h": "2.5", "l": "0.9", "v": "1000", "q": "5000000"},
+                ])
+                await _until(lambda: "ZZZUSDT" in market.tickers.row)
+                top = market.tickers.top(5, "USDT", 1_000_000, "change")
+                assert top[0]["symbol"] == "ZZZ" and top[0]["change"] == 100.0
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_reconnect_resubscribes_and_resets_sync(series):
+    key, _ = series
+
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            client.subscribe("!miniTicker@arr", "btcusdt@kline_1m")
+            await client.start()
+            try:
+                await _until(lambda: len(server.subscribed()) == 2)
+                market._synced.add(key)
+                await server.connections[-1].close()
+                await _until(lambda: len(server.connections) == 2 and len(server.subscribed()) == 2)
+                assert server.subscribed() == {"!miniTicker@arr", "btcusdt@kline_1m"}
+                assert client.reconnects == 1
+                assert key not in market._synced         # missed events → REST backfill first
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_unsubscribe_is_sent_and_not_replayed():
+    async def run():
+        async with StandIn() as server:
+            client = _client(server.url)
+            client.subscribe("!miniTicker@arr", "btcusdt@kline_1m")
+            await client.start()
+            try:
+                await _until(lambda: len(server.subscribed()) == 2)
+                client.unsubscribe("btcusdt@kline_1m", "ethusdt@kline_1m")
+                await _until(lambda: server.subscribed() == {"!miniTicker@arr"})
+                assert server.received[-1][-1]["params"] == ["btcusdt@kline_1m"]
+                await server.connections[-1].close()
+                await _until(lambda: len(server.connections) == 2 and server.received[-1])
+                assert server.received[-1][0]["params"] == ["!miniTicker@arr"]
+            finally:
+                await client.stop()
+    asyncio.run(run())
+
+
+def test_evicted_series_unsubscribes(monkeypatch):
+    monkeypatch.setattr(market, "MAX_SERIES", 2)
+    monkeypatch.setattr(market, "_series", type(market._series)())
+    client = BinanceStream("")
+    monkeypatch.setattr(market, "stream", client)
+    for symbol in ("AAAUSDT", "BBBUSDT", "CCCUSDT"):
+        client.subscribe(market._kline_stream(symbol, "1h"))
+        market._remember((symbol, "1h"), KlineSeries())
+    assert list(market._series) == [("BBBUSDT", "1h"), ("CCCUSDT", "1h")]
+    assert client.streams == {"bbbusdt@kline_1h", "cccusdt@kline_1h"}